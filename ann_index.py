@@ -0,0 +1,392 @@
+import os
+import time
+import threading
+import numpy as np
+
+import gallery as gallery_store
+
+ASSIGN_CHUNK = 16384  # vectors assigned per matmul during training/insert
+
+
+def _kmeans(x, k, iters=20, seed=0, spherical=True):
+    """Lloyd's k-means; spherical mode assigns by inner product and keeps unit centroids"""
+    rng = np.random.default_rng(seed)
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(x, centroids, spherical)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        # Sort once and sum contiguous runs; far faster than np.add.at
+        order = np.argsort(assign, kind="stable")
+        present = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+        sums[present] = np.add.reduceat(x[order], starts, axis=0)
+        empty = counts == 0
+        # Reseed empty clusters from random points so every list stays usable
+        if empty.any():
+            sums[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+        if spherical:
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+def _assign(x, centroids, spherical=True):
+    """Nearest centroid per row, computed in chunks to bound the score matrix"""
+    out = np.empty(len(x), dtype=np.int64)
+    half_norms = None if spherical else 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    for start in range(0, len(x), ASSIGN_CHUNK):
+        scores = x[start:start + ASSIGN_CHUNK] @ centroids.T
+        if half_norms is not None:
+            scores -= half_norms  # argmax(x.c - |c|^2/2) == argmin |x - c|^2
+        out[start:start + len(scores)] = scores.argmax(axis=1)
+    return out
+
+
+class IVFIndex:
+    """Inverted-file ANN index for inner-product search over unit vectors.
+
+    A k-means coarse quantizer splits the vectors into ``nlist`` lists and a
+    query only scans the ``nprobe`` lists whose centroids score highest, so
+    raising ``nprobe`` trades latency for recall. With ``pq_m`` > 0 the
+    residuals to the list centroid are product-quantized into ``pq_m``
+    one-byte codes and scored with per-query lookup tables (IVF-PQ), which
+    cuts memory 4 * dim / pq_m fold at some cost in accuracy.
+    """
+
+    def __init__(self, dim=gallery_store.FACE_DIM, nlist=1024, nprobe=16, pq_m=0):
+        if pq_m and dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide dim={dim}")
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_ksub = 256
+        self.centroids = None
+        self.codebooks = None  # (pq_m, 256, dim // pq_m)
+        self._ids = []
+        self._data = []
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    @property
+    def ntotal(self):
+        return sum(len(ids) for ids in self._ids)
+
+    def train(self, vectors, iters=20, seed=0, max_samples=100000):
+        """Fit the coarse quantizer (and PQ codebooks) on a sample of vectors"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        if len(vectors) > max_samples:
+            vectors = vectors[np.sort(rng.choice(len(vectors), size=max_samples, replace=False))]
+        if len(vectors) < self.nlist:
+            raise ValueError(f"Need at least nlist={self.nlist} training vectors, got {len(vectors)}")
+
+        self.centroids = _kmeans(vectors, self.nlist, iters=iters, seed=seed)
+        if self.pq_m:
+            # 256 centroids per sub-quantizer converge well on ~80 points each
+            pq_sample = vectors[:self.pq_ksub * 80]
+            residuals = pq_sample - self.centroids[_assign(pq_sample, self.centroids)]
+            ksub = min(self.pq_ksub, len(residuals))
+            dsub = self.dim // self.pq_m
+            self.codebooks = np.stack([
+                _kmeans(residuals[:, m * dsub:(m + 1) * dsub], ksub, iters=iters,
+                        seed=seed + m + 1, spherical=False)
+                for m in range(self.pq_m)
+            ])
+        self._ids = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self._data = [self._empty_data() for _ in range(self.nlist)]
+
+    def _empty_data(self):
+        if self.pq_m:
+            return np.empty((0, self.pq_m), dtype=np.uint8)
+        return np.empty((0, self.dim), dtype=np.float32)
+
+    def _encode(self, residuals):
+        dsub = self.dim // self.pq_m
+        codes = np.empty((len(residuals), self.pq_m), dtype=np.uint8)
+        for m in range(self.pq_m):
+            codes[:, m] = _assign(residuals[:, m * dsub:(m + 1) * dsub], self.codebooks[m], spherical=False)
+        return codes
+
+    def add(self, ids, vectors):
+        """Insert vectors under integer ids; safe to call one registration at a time"""
+        if not self.is_trained:
+            raise RuntimeError("Index must be trained before adding vectors")
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        lists = _assign(vectors, self.centroids)
+        data = self._encode(vectors - self.centroids[lists]) if self.pq_m else vectors
+        for lst in np.unique(lists):
+            members = lists == lst
+            self._ids[lst] = np.concatenate([self._ids[lst], ids[members]])
+            self._data[lst] = np.concatenate([self._data[lst], data[members]])
+
+    def search(self, query, k=5, nprobe=None):
+        """Return (ids, scores) of the approximate top-k inner products"""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        coarse = self.centroids @ query
+        probed = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+
+        if self.pq_m:
+            dsub = self.dim // self.pq_m
+            # lut[m, j] = query_m . codebook_m[j]; a code's score is the sum over m
+            lut = np.einsum("md,mjd->mj", query.reshape(self.pq_m, dsub), self.codebooks)
+            sub = np.arange(self.pq_m)
+            scores = [coarse[lst] + lut[sub, self._data[lst]].sum(axis=1) for lst in probed]
+        else:
+            scores = [self._data[lst] @ query for lst in probed]
+
+        ids = np.concatenate([self._ids[lst] for lst in probed])
+        scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+        if len(ids) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[best], scores[best]
+        order = np.argsort(-scores)
+        return ids[order], scores[order].astype(np.float32)
+
+    def save(self, path, **extra):
+        """Persist the index (plus any extra arrays) to a single .npz file"""
+        offsets = np.cumsum([0] + [len(ids) for ids in self._ids])
+        # Per-process temp name: several service workers may save the same index
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path,
+                 meta=np.array([self.dim, self.nlist, self.nprobe, self.pq_m], dtype=np.int64),
+                 centroids=self.centroids,
+                 codebooks=self.codebooks if self.pq_m else np.empty(0, dtype=np.float32),
+                 ids=np.concatenate(self._ids),
+                 data=np.concatenate(self._data),
+                 offsets=offsets, **extra)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save(); returns (index, extra arrays)"""
+        with np.load(path) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        dim, nlist, nprobe, pq_m = (int(v) for v in arrays.pop("meta"))
+        index = cls(dim=dim, nlist=nlist, nprobe=nprobe, pq_m=pq_m)
+        index.centroids = arrays.pop("centroids")
+        codebooks = arrays.pop("codebooks")
+        index.codebooks = codebooks if pq_m else None
+        ids, data, offsets = arrays.pop("ids"), arrays.pop("data"), arrays.pop("offsets")
+        index._ids = [ids[offsets[i]:offsets[i + 1]].copy() for i in range(nlist)]
+        index._data = [data[offsets[i]:offsets[i + 1]].copy() for i in range(nlist)]
+        return index, arrays
+
+
+class GalleryFaceIndex:
+    """IVF index over an EmbeddingGallery's face rows, kept in sync by row number.
+
+    The gallery is append-only, so new registrations are picked up by
+    inserting rows past ``indexed_rows`` (``sync()``), and superseded or
+    removed rows are dropped at query time through the gallery's labels.
+    After ``EmbeddingGallery.compact()`` renumbers rows the index is rebuilt.
+    """
+
+    def __init__(self, gallery=None, path=None, nlist=None, nprobe=16, pq_m=0):
+        self.gallery = gallery if gallery is not None else gallery_store.EmbeddingGallery()
+        self.path = path or os.path.join(self.gallery.root, "face_ivf.npz")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.index = None
+        self.indexed_rows = 0
+        self._last_row = None
+        self._lock = threading.RLock()
+        if os.path.exists(self.path):
+            self._load()
+
+    def _load(self):
+        try:
+            self.index, extra = IVFIndex.load(self.path)
+            # Rebuilds after a compact() keep the layout the index was built with
+            self.pq_m = self.index.pq_m
+            self.nprobe = self.index.nprobe
+            self.indexed_rows = int(extra["indexed_rows"])
+            self._last_row = extra["last_row"]
+        except Exception as e:
+            print(f"❌ ERROR loading face index, rebuilding: {str(e)}")
+            self.index = None
+            self.indexed_rows = 0
+
+    def _default_nlist(self, rows):
+        # ~4*sqrt(N) lists, capped so each list keeps enough training points
+        return int(max(1, min(4 * np.sqrt(rows), rows // 39 or 1)))
+
+    def build(self):
+        """(Re)train on every gallery row and index them"""
+        with self._lock:
+            rows = self.gallery.rows
+            if rows == 0:
+                self.index = None
+                self.indexed_rows = 0
+                return
+            face = self.gallery.face
+            self.index = IVFIndex(dim=self.gallery.face_dim,
+                                  nlist=self.nlist or self._default_nlist(rows),
+                                  nprobe=self.nprobe, pq_m=self.pq_m)
+            self.index.train(face)
+            self.indexed_rows = 0
+            self.sync()
+
+    def _stale(self):
+        rows = self.gallery.rows
+        if self.index is None or self.indexed_rows > rows:
+            return True
+        if self.indexed_rows and self._last_row is not None:
+            return not np.array_equal(self.gallery.face[self.indexed_rows - 1], self._last_row)
+        return False
+
+    def sync(self):
+        """Insert rows enrolled since the last sync; rebuild if the gallery was compacted"""
+        with self._lock:
+            if self._stale():
+                return self.build()
+            rows = self.gallery.rows
+            if rows > self.indexed_rows:
+                self.index.add(np.arange(self.indexed_rows, rows), self.gallery.face[self.indexed_rows:rows])
+                self.indexed_rows = rows
+                self._last_row = np.array(self.gallery.face[rows - 1])
+
+    def save(self):
+        with self._lock:
+            if self.index is not None:
+                self.index.save(self.path, indexed_rows=np.int64(self.indexed_rows),
+                                last_row=self._last_row)
+
+    def search(self, face_embedding, k=5, nprobe=None, rerank=0):
+        """Approximate top-k as (rows, scores) over live gallery rows.
+
+        rerank > 0 rescores that many ANN candidates against the exact
+        gallery vectors, which recovers most of the PQ approximation error.
+        """
+        with self._lock:
+            self.sync()
+            if self.index is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            probe = np.asarray(face_embedding, dtype=np.float32).reshape(-1)
+            probe = probe / max(np.linalg.norm(probe), 1e-12)
+            labels = self.gallery.labels()
+            # Over-fetch to make up for superseded rows filtered below
+            fetch = max(k, rerank) + (self.gallery.rows - len(self.gallery))
+            rows, scores = self.index.search(probe, k=fetch, nprobe=nprobe)
+            live = labels[rows] != None  # noqa: E711 (elementwise)
+            rows, scores = rows[live], scores[live]
+            if rerank:
+                rows = rows[:rerank]
+                scores = self.gallery.face[np.sort(rows)] @ probe
+                rows = np.sort(rows)
+                order = np.argsort(-scores)
+                rows, scores = rows[order], scores[order]
+            return rows[:k], scores[:k]
+
+    def identify(self, face_embedding, k=5, nprobe=None, rerank=0):
+        """Top-k (username, score) pairs, scores clamped to [0, 1] like compare_faces"""
+        rows, scores = self.search(face_embedding, k=k, nprobe=nprobe, rerank=rerank)
+        labels = self.gallery.labels()
+        return [(labels[r], min(max(float(s), 0.0), 1.0)) for r, s in zip(rows, scores)]
+
+
+def load_face_index(gallery):
+    """The gallery's saved GalleryFaceIndex, or None until `ann_index.py build` has written one"""
+    if not os.path.exists(os.path.join(gallery.root, "face_ivf.npz")):
+        return None
+    face_index = GalleryFaceIndex(gallery)
+    return face_index if face_index.index is not None else None
+
+
+def synthetic_embeddings(n, dim=gallery_store.FACE_DIM, clusters=1000, spread=2.0, seed=0):
+    """Unit vectors drawn around random centres, a rough stand-in for face embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    x = centres[rng.integers(0, clusters, size=n)]
+    x += spread / np.sqrt(dim) * rng.standard_normal((n, dim), dtype=np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def evaluate(num_vectors=100000, num_queries=200, k=10, nlist=None, nprobes=(1, 2, 4, 8, 16, 32, 64),
+             pq_m=0, noise=0.8, seed=0):
+    """Recall@k and latency of IVFIndex against exact search on synthetic embeddings.
+
+    recall@k is the overlap with the exact top-k; hit@k is how often the
+    enrolled vector a probe was generated from is returned at all.
+    """
+    rng = np.random.default_rng(seed + 1)
+    base = synthetic_embeddings(num_vectors, seed=seed)
+    dim = base.shape[1]
+    # Queries are noisy re-captures of enrolled vectors, like genuine probes
+    sources = rng.choice(num_vectors, size=num_queries, replace=False)
+    queries = base[sources] + np.float32(noise / np.sqrt(dim)) * rng.standard_normal((num_queries, dim), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    exact = []
+    for q in queries:
+        scores = base @ q
+        exact.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    exact_ms = (time.perf_counter() - start) / num_queries * 1000
+
+    nlist = nlist or int(4 * np.sqrt(num_vectors))
+    index = IVFIndex(dim=dim, nlist=nlist, pq_m=pq_m)
+    start = time.perf_counter()
+    index.train(base, seed=seed)
+    index.add(np.arange(num_vectors), base)
+    build_s = time.perf_counter() - start
+
+    print(f"IVF{nlist}{f',PQ{pq_m}' if pq_m else ',Flat'} over {num_vectors} vectors, "
+          f"{num_queries} queries, built in {build_s:.1f}s")
+    exact_hit = np.mean([source in truth for source, truth in zip(sources, exact)])
+    print(f"  exact       : recall@{k} 1.000  hit@{k} {exact_hit:.3f}  {exact_ms:7.3f} ms/query")
+    results = []
+    for nprobe in nprobes:
+        if nprobe > nlist:
+            break
+        found = genuine = 0
+        start = time.perf_counter()
+        for q, truth, source in zip(queries, exact, sources):
+            ids, _ = index.search(q, k=k, nprobe=nprobe)
+            found += len(truth.intersection(ids.tolist()))
+            genuine += source in ids
+        ms = (time.perf_counter() - start) / num_queries * 1000
+        recall = found / (k * num_queries)
+        hit = genuine / num_queries
+        results.append((nprobe, recall, hit, ms))
+        print(f"  nprobe={nprobe:<4}: recall@{k} {recall:.3f}  hit@{k} {hit:.3f}  {ms:7.3f} ms/query")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the face ANN index or evaluate recall vs. exact search")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Build the index from the enrolled gallery")
+    build_parser.add_argument("--gallery", default=gallery_store.GALLERY_DIR)
+    build_parser.add_argument("--nlist", type=int, default=None)
+    build_parser.add_argument("--pq-m", type=int, default=0)
+
+    eval_parser = commands.add_parser("evaluate", help="Recall@k vs. exact search on synthetic embeddings")
+    eval_parser.add_argument("--vectors", type=int, default=100000)
+    eval_parser.add_argument("--queries", type=int, default=200)
+    eval_parser.add_argument("--k", type=int, default=10)
+    eval_parser.add_argument("--nlist", type=int, default=None)
+    eval_parser.add_argument("--pq-m", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        face_index = GalleryFaceIndex(gallery_store.EmbeddingGallery(args.gallery),
+                                      nlist=args.nlist, pq_m=args.pq_m)
+        face_index.build()
+        face_index.save()
+        print(f"✅ Indexed {face_index.indexed_rows} row(s) into {face_index.path}")
+    else:
+        evaluate(args.vectors, args.queries, args.k, args.nlist, pq_m=args.pq_m)
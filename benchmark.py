@@ -0,0 +1,531 @@
+import argparse
+import contextlib
+import glob
+import io
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
+
+import capture
+import fusion
+import util
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_face_batch(args):
+    """Per-image extract_face_features loop vs. extract_face_features_batch"""
+    paths = _image_paths(args.images)
+    if not paths:
+        print(f"❌ ERROR: No images found under {args.images}")
+        return
+    paths = (paths * (args.count // len(paths) + 1))[:args.count]
+
+    util.warm_up_models(background=False)
+    util.extract_face_features_batch(paths[:2])  # first-inference costs out of the way
+
+    loop, loop_s = _timed(lambda: [util.extract_face_features(p) for p in paths])
+    (batch, statuses), batch_s = _timed(util.extract_face_features_batch, paths,
+                                        batch_size=args.batch_size, workers=args.workers)
+
+    ok = [i for i, s in enumerate(statuses) if s == "ok" and loop[i] is not None]
+    agreement = min((float(np.dot(loop[i], batch[i])) for i in ok), default=float("nan"))
+    print(f"Face embedding extraction, {len(paths)} images ({os.cpu_count()} CPUs)")
+    print(f"  per-image loop : {len(paths) / loop_s:8.1f} img/s")
+    print(f"  batched        : {len(paths) / batch_s:8.1f} img/s "
+          f"(batch={args.batch_size}, workers={args.workers or 'auto'})  {loop_s / batch_s:.2f}x")
+    print(f"  statuses       : {statuses.count('ok')} ok / {len(statuses)}; "
+          f"min cosine vs. loop {agreement:.4f}")
+
+
+def _image_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, "**", "*.jp*g"), recursive=True) +
+                  glob.glob(os.path.join(directory, "**", "*.png"), recursive=True))
+
+
+def _fusion_scores(n, trials, dim=512, noise=0.03, seed=0):
+    """Genuine/impostor scores of N-frame fused probes against an enrolled template.
+
+    Each frame is the identity direction plus isotropic noise whose size grows
+    as its capture quality drops, so the quality weights matter.
+    """
+    rng = np.random.default_rng(seed)
+    identity = rng.standard_normal(dim).astype(np.float32)
+    identity /= np.linalg.norm(identity)
+    impostor = rng.standard_normal(dim).astype(np.float32)
+    impostor /= np.linalg.norm(impostor)
+
+    def frames(center, count):
+        quality = rng.uniform(0.3, 1.0, count).astype(np.float32)
+        noisy = center + (noise / quality)[:, None] * rng.standard_normal((count, dim)).astype(np.float32)
+        return noisy / np.linalg.norm(noisy, axis=1, keepdims=True), quality
+
+    template = util.fuse_embeddings(*frames(identity, 5))
+    genuine, imposter = [], []
+    for _ in range(trials):
+        genuine.append(util.compare_embeddings(template, util.fuse_embeddings(*frames(identity, n))))
+        imposter.append(util.compare_embeddings(template, util.fuse_embeddings(*frames(impostor, n))))
+    return np.array(genuine), np.array(imposter)
+
+
+def bench_face_fusion(args):
+    """Compute cost per fused frame count N and the genuine-score variance it removes"""
+    counts = [int(n) for n in args.frames.split(",")]
+    paths = _image_paths(args.images)
+    if paths:
+        util.warm_up_models(background=False)
+        frames, keypoints = [], []
+        for path in paths:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            bboxes, kpss = util.detect_faces(img)
+            if len(bboxes) and kpss is not None:
+                frames.append(img)
+                keypoints.append(kpss[0])
+        if frames:
+            print(f"Face template cost, recognition on pre-detected frames (mean of {args.repeats})")
+            util.extract_face_template(frames[:1], keypoints[:1])
+            base = None
+            for n in counts:
+                picks = [i % len(frames) for i in range(n)]
+                batch = ([frames[i] for i in picks], [keypoints[i] for i in picks])
+                _, fused = _timed(lambda: [util.extract_face_template(*batch) for _ in range(args.repeats)])
+                _, single = _timed(lambda: [[util.extract_face_template([frames[i]], [keypoints[i]]) for i in picks]
+                                            for _ in range(args.repeats)])
+                fused, single = fused / args.repeats * 1000, single / args.repeats * 1000
+                base = base or fused
+                print(f"  N={n:<2}: {fused:7.2f} ms batched ({fused / base:.2f}x N=1)  "
+                      f"vs {single:7.2f} ms as {n} separate calls")
+        else:
+            print(f"⚠️ No detectable faces under {args.images}; skipping the timing")
+    else:
+        print(f"⚠️ No images under {args.images}; skipping the timing")
+
+    print(f"Score spread vs. an enrolled 5-frame template, synthetic embeddings ({args.trials} trials)")
+    base_std = None
+    for n in counts:
+        genuine, impostor = _fusion_scores(n, args.trials)
+        base_std = base_std or genuine.std()
+        print(f"  N={n:<2}: genuine {genuine.mean():.3f} ± {genuine.std():.4f} "
+              f"(variance {genuine.var() / base_std ** 2:.2f}x N={counts[0]})  impostor max {impostor.max():.3f}")
+
+
+def bench_face_config(args):
+    """Per-image face embedding latency: FaceAnalysis defaults vs. detection+recognition only,
+    per detector size and detection downscale"""
+    from insightface.app import FaceAnalysis
+
+    images = [img for img in (cv2.imread(p) for p in _image_paths(args.images)[:args.count]) if img is not None]
+    if not images:
+        print(f"⚠️ No images under {args.images}; using blank {args.width}x{args.height} frames")
+        images = [np.full((args.height, args.width, 3), 128, dtype=np.uint8)]
+
+    def per_image(fn):
+        with contextlib.redirect_stdout(io.StringIO()):  # no-face images are expected
+            fn(images[0])
+            _, seconds = _timed(lambda: [fn(img) for _ in range(args.repeats) for img in images])
+        return seconds / (args.repeats * len(images)) * 1000
+
+    # What util did before: every buffalo_l module at the default 640x640
+    legacy = FaceAnalysis(name='buffalo_l')
+    legacy.prepare(ctx_id=0)
+    reference = [faces[0].normed_embedding if faces else None for faces in map(legacy.get, images)]
+    print(f"Face embedding latency, {len(images)} image(s) of {images[0].shape[1]}x{images[0].shape[0]}, "
+          f"mean of {args.repeats} passes")
+    print(f"  {'all modules, det 640':<34}: {per_image(legacy.get):7.2f} ms")
+    del legacy
+
+    util.warm_up_models(background=False)
+    for det_size in (int(s) for s in args.det_sizes.split(",")):
+        for max_side in (0, args.max_side):
+            util.set_face_runtime(det_size=det_size, detect_max_side=max_side)
+            ms = per_image(util.extract_face_features)
+            with contextlib.redirect_stdout(io.StringIO()):
+                embeddings = [util.extract_face_features(img) for img in images]
+            agreement = min((float(np.dot(r, e)) for r, e in zip(reference, embeddings)
+                             if r is not None and e is not None), default=float("nan"))
+            label = f"det+rec, det {det_size}" + (f", downscale to {max_side}" if max_side else "")
+            print(f"  {label:<34}: {ms:7.2f} ms  min cosine vs. all-modules {agreement:.4f}")
+
+
+def _synthetic_recordings(directory, count, min_seconds=1.0, max_seconds=6.0, samplerate=16000, seed=0):
+    """Write noisy tone recordings of varied length, standing in for enrollment audio"""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        n = int(rng.uniform(min_seconds, max_seconds) * samplerate)
+        t = np.arange(n) / samplerate
+        audio = 0.3 * np.sin(2 * np.pi * rng.uniform(100, 300) * t) + 0.05 * rng.standard_normal(n)
+        path = os.path.join(directory, f"voice_{i}.wav")
+        sf.write(path, audio.astype(np.float32), samplerate)
+        paths.append(path)
+    return paths
+
+
+def bench_voice_batch(args):
+    """Per-file extract_voice_features loop vs. extract_voice_features_batch"""
+    util.models.warm_up(["voice"], background=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = _synthetic_recordings(tmp, args.count)
+        util.extract_voice_features_batch(paths[:2])
+
+        loop, loop_s = _timed(lambda: np.stack([util.extract_voice_features(p) for p in paths]))
+        (batch, statuses), batch_s = _timed(util.extract_voice_features_batch, paths,
+                                            batch_size=args.batch_size)
+
+    cos = np.sum(loop * batch, axis=1) / (np.linalg.norm(loop, axis=1) * np.linalg.norm(batch, axis=1))
+    print(f"Voice embedding extraction, {len(paths)} recordings of 1-6 s")
+    print(f"  per-file loop : {len(paths) / loop_s:8.1f} utt/s")
+    print(f"  batched       : {len(paths) / batch_s:8.1f} utt/s (batch={args.batch_size})  {loop_s / batch_s:.2f}x")
+    print(f"  statuses      : {statuses.count('ok')} ok / {len(statuses)}; min cosine vs. loop {cos.min():.6f}")
+
+
+def bench_vad(args):
+    """extract_voice_features latency and embedding stability with and without the VAD"""
+    util.models.warm_up(["voice"], background=False)
+    speech, rate = sf.read(args.audio, dtype="float32", always_2d=True)
+    speech = speech.mean(axis=1)
+    if rate != util.VOICE_SAMPLE_RATE:
+        speech = util._get_resampler(rate)(torch.from_numpy(speech)[None])[0].numpy()
+    rng = np.random.default_rng(0)
+
+    def noise(seconds, level):
+        return (level * rng.standard_normal(int(seconds * util.VOICE_SAMPLE_RATE))).astype(np.float32)
+
+    # The same utterance with varying lead/trail padding of silence or background noise
+    clips = []
+    for pad in (0.5, 1.0, 2.0, 3.0):
+        for level in (0.0, 0.003, 0.01):
+            lead = rng.uniform(0, pad)
+            clips.append(np.concatenate([noise(lead, level), speech, noise(pad - lead, level)]))
+    noise_only = [noise(3.0, level) for level in (0.0, 0.003, 0.01, 0.05) for _ in range(args.repeats)]
+    ratio = util.speech_activity(speech)["speech_ratio"]
+    print(f"VAD on {args.audio} ({len(speech) / util.VOICE_SAMPLE_RATE:.1f} s, {ratio:.0%} speech), "
+          f"{len(clips)} padded variants, {len(noise_only)} noise-only clips")
+
+    for vad in (False, True):
+        reference = util.extract_voice_features(speech, vad=vad)
+        embeddings, seconds = _timed(lambda: [util.extract_voice_features(clip, vad=vad) for clip in clips])
+        cosines = np.array([util.compare_embeddings(reference, e) for e in embeddings])
+        with contextlib.redirect_stdout(io.StringIO()):
+            noise_embeddings, noise_seconds = _timed(lambda: [util.extract_voice_features(clip, vad=vad)
+                                                              for clip in noise_only])
+        rejected = sum(not np.any(e) for e in noise_embeddings)
+        print(f"  vad={str(vad):<5}: {seconds / len(clips) * 1000:7.2f} ms/clip  "
+              f"cosine vs. unpadded min {cosines.min():.4f} mean {cosines.mean():.4f}  |  "
+              f"noise {noise_seconds / len(noise_only) * 1000:6.2f} ms/clip, {rejected}/{len(noise_only)} rejected")
+
+
+def bench_voice_backends(args):
+    """Per-utterance latency and batch throughput of the voice model on each backend"""
+    import voice_runtime
+
+    eager = util.get_eager_voice_model()
+    rng = np.random.default_rng(0)
+    utterance = torch.from_numpy(rng.uniform(0, 50, (1, 80, int(args.seconds * 100))).astype(np.float32))
+    lengths = torch.from_numpy(rng.integers(100, int(args.seconds * 100) + 1, args.batch_size))
+    batch = torch.from_numpy(rng.uniform(0, 50, (args.batch_size, 80, int(lengths.max()))).astype(np.float32))
+
+    print(f"Voice model backends, {args.seconds:.0f} s utterance / batch of {args.batch_size} "
+          f"(threads={args.threads or torch.get_num_threads()}, {os.cpu_count()} CPUs)")
+    for backend in voice_runtime.BACKENDS:
+        try:
+            model = voice_runtime.build_voice_model(eager, backend, args.threads)
+        except Exception as e:
+            print(f"  {backend:<11}: unavailable ({str(e)})")
+            continue
+        with torch.no_grad():
+            model(utterance)
+            model(batch, lengths=lengths)
+            _, single = _timed(lambda: [model(utterance) for _ in range(args.repeats)])
+            _, batched = _timed(lambda: [model(batch, lengths=lengths) for _ in range(args.repeats)])
+        print(f"  {backend:<11}: {single / args.repeats * 1000:7.2f} ms/utterance  "
+              f"{args.batch_size * args.repeats / batched:8.1f} utt/s batched")
+
+
+def _synthetic_speakers(speakers, utterances, seconds=2.0, samplerate=16000, seed=0):
+    """Voiced "speech" per synthetic speaker: a glottal pulse train at the speaker's pitch shaped
+    by the speaker's formants, with per-utterance jitter, syllable envelope and noise.
+    Returns (speaker ids, waveforms)."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * samplerate)
+    freqs = np.fft.rfftfreq(n, 1 / samplerate)
+    ids, waveforms = [], []
+    for speaker in range(speakers):
+        pitch = rng.uniform(85, 255)
+        formants = np.sort(rng.uniform([300, 900, 2000], [900, 2300, 3500]))
+        for _ in range(utterances):
+            f0 = pitch * rng.uniform(0.93, 1.07) * (1 + 0.05 * np.sin(2 * np.pi * rng.uniform(1, 4) * np.arange(n) / samplerate))
+            pulses = np.diff(np.floor(np.cumsum(f0) / samplerate), prepend=0)
+            shaped = sum(np.exp(-0.5 * ((freqs - f * rng.uniform(0.97, 1.03)) / (60 + 0.05 * f)) ** 2)
+                         for f in formants)
+            voiced = np.fft.irfft(np.fft.rfft(pulses) * shaped, n)
+            envelope = np.clip(np.sin(np.pi * rng.uniform(2, 5) * np.arange(n) / samplerate) ** 2 * 1.5, 0, 1)
+            audio = voiced * envelope / (np.abs(voiced).max() + 1e-9) * 0.3 + 0.002 * rng.standard_normal(n)
+            ids.append(speaker)
+            waveforms.append(audio.astype(np.float32))
+    return np.array(ids), waveforms
+
+
+def bench_voice_quant(args):
+    """Float vs. int8 voice model: cosine drift, EER, latency and model size"""
+    import voice_runtime
+
+    eager = util.get_eager_voice_model()
+    ids, waveforms = _synthetic_speakers(args.speakers, args.utterances)
+    mels = [util._voice_mel(w) for w in waveforms]
+    calibration = util.voice_calibration_mels() + mels[::args.utterances]  # one utterance per speaker
+    same = ids[:, None] == ids[None, :]
+    upper = np.triu(np.ones_like(same), k=1)
+    batch = torch.stack(mels[:args.batch_size])
+    seconds = mels[0].shape[-1] / 100
+
+    print(f"Voice model quantization, {args.speakers} synthetic speakers x {args.utterances} utterances of {seconds:.0f} s")
+    reference = None
+    for mode in (None, "dynamic", "static"):
+        model = voice_runtime.build_voice_model(eager, "eager", args.threads, mode, calibration)
+        with torch.no_grad():
+            embeddings = torch.cat([model(mel.unsqueeze(0)) for mel in mels]).numpy()
+            model(batch)
+            _, single = _timed(lambda: [model(mels[0].unsqueeze(0)) for _ in range(args.repeats)])
+            _, batched = _timed(lambda: [model(batch) for _ in range(args.repeats)])
+        unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        scores = unit @ unit.T
+        eer, _ = fusion.eer(scores[same & (upper > 0)], scores[~same & (upper > 0)])
+        if reference is None:
+            reference = unit
+        drift = np.sum(unit * reference, axis=1)
+
+        state = model.module.state_dict() if hasattr(model, "module") else model.state_dict()
+        buffer = io.BytesIO()
+        torch.save(state, buffer)
+        print(f"  {mode or 'float32':<8}: {single / args.repeats * 1000:6.2f} ms/utt  "
+              f"{args.batch_size * args.repeats / batched:7.1f} utt/s batched  "
+              f"{buffer.tell() / 1e6:5.2f} MB  cosine vs. float min {drift.min():.4f}  EER {eer:.2%}")
+
+
+def bench_transforms(args):
+    """Per-call mel front-end latency: fresh transforms per call vs. the cached ones"""
+
+    def uncached(waveform, sample_rate):
+        # The original extract_voice_features front end
+        waveform = waveform.mean(dim=0, keepdim=True)
+        resampler = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)
+        waveform = resampler(waveform)
+        mel_transform = torchaudio.transforms.MelSpectrogram(sample_rate=16000, n_mels=80, n_fft=400, hop_length=160)
+        return mel_transform(waveform)[0]
+
+    print(f"Mel front end, {args.seconds:.0f} s clip, mean of {args.repeats} calls")
+    for sample_rate in (16000, 44100, 48000):
+        waveform = torch.randn(1, int(args.seconds * sample_rate))
+        uncached(waveform, sample_rate)
+        util._voice_mel(waveform, sample_rate)
+        _, before = _timed(lambda: [uncached(waveform, sample_rate) for _ in range(args.repeats)])
+        _, after = _timed(lambda: [util._voice_mel(waveform, sample_rate) for _ in range(args.repeats)])
+        before, after = before / args.repeats * 1000, after / args.repeats * 1000
+        print(f"  {sample_rate:>5} Hz: {before:7.2f} ms -> {after:7.2f} ms  ({before / after:.1f}x)")
+
+
+def bench_preview(args):
+    """Camera preview CPU per camera frame: per-frame PIL LANCZOS + new PhotoImage vs. PreviewRenderer"""
+    from PIL import Image, ImageTk
+
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        root = None  # no display: PhotoImage cost is left out of both paths
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8) for _ in range(8)]
+    size = (300, 300)
+
+    def before():
+        for i in range(args.frames):
+            rgb_frame = cv2.cvtColor(frames[i % len(frames)], cv2.COLOR_BGR2RGB)
+            pil_img = Image.fromarray(rgb_frame).resize(size, Image.LANCZOS)
+            if root is not None:
+                ImageTk.PhotoImage(image=pil_img)
+
+    def after():
+        renderer = capture.PreviewRenderer(size, args.max_fps)
+        photo = ImageTk.PhotoImage("RGB", size) if root is not None else None
+        for i in range(args.frames):
+            now = i / args.camera_fps  # simulated camera clock
+            if renderer.due(now):
+                renderer.submit(frames[i % len(frames)], now)
+            frame = renderer.take()
+            if frame is not None and photo is not None:
+                photo.paste(Image.fromarray(frame))
+        return renderer
+
+    print(f"Preview, {args.frames} camera frames of {args.width}x{args.height} at {args.camera_fps} fps "
+          f"-> {size[0]}x{size[1]}{'' if root is not None else ' (no display: PhotoImage not measured)'}")
+    for name, fn in (("PIL LANCZOS, every frame", before), (f"INTER_AREA, capped {args.max_fps} fps", after)):
+        start = time.process_time()
+        result = fn()
+        cpu = (time.process_time() - start) / args.frames
+        shown = f"  {result.submitted} shown" if result is not None else ""
+        print(f"  {name:26}: {cpu * 1000:6.2f} ms CPU/frame  {cpu * args.camera_fps:6.1%} of a core{shown}")
+    if root is not None:
+        root.destroy()
+
+
+def bench_cache(args):
+    """Face/voice embedding latency on first sight vs. a re-scored probe served from util.EMBEDDING_CACHE"""
+    paths = _image_paths(args.images)[:args.count]
+    util.EMBEDDING_CACHE.max_entries = args.entries
+    util.warm_up_models(background=False)
+    _, audios = _synthetic_speakers(args.count, 1)
+    jobs = [("face", util.extract_face_features, paths), ("voice", util.extract_voice_features, audios)]
+    print(f"Embedding cache ({args.entries} entries), {args.count} probes each, scored twice")
+    for name, extract, probes in jobs:
+        if not probes:
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            extract(probes[0])  # first-inference costs out of the way
+            util.EMBEDDING_CACHE.clear()
+            _, cold = _timed(lambda: [extract(p) for p in probes])
+            _, warm = _timed(lambda: [extract(p) for p in probes])
+        print(f"  {name:<5}: {cold / len(probes) * 1000:7.2f} ms cold -> {warm / len(probes) * 1000:7.2f} ms cached "
+              f"({cold / warm:.1f}x)")
+    print(f"  stats: {util.EMBEDDING_CACHE.stats()}")
+
+
+def bench_pool(args):
+    """Verify throughput of worker_pool.InferencePool from 1 to --max-workers processes"""
+    from worker_pool import InferencePool
+
+    paths = _image_paths(args.images)
+    if not paths:
+        print(f"❌ ERROR: No images found under {args.images}")
+        return
+    with open(paths[0], "rb") as f:
+        face = f.read()
+    _, waveforms = _synthetic_speakers(1, 1, seconds=args.seconds)
+    buffer = io.BytesIO()
+    sf.write(buffer, waveforms[0], 16000, format="WAV")
+    fields = {"username": b"bench", "face": face, "voice": buffer.getvalue()}
+
+    os.environ["EMBEDDING_CACHE_ENTRIES"] = "0"  # workers inherit it: repeated probes must not hit the cache
+    max_workers = args.max_workers or os.cpu_count() or 1
+    print(f"Worker pool verify throughput, {args.requests} requests, {os.cpu_count()} CPUs")
+    baseline = None
+    with tempfile.TemporaryDirectory() as gallery_dir:
+        for workers in range(1, max_workers + 1):
+            with InferencePool(workers, gallery_dir, args.threads) as pool:
+                if workers == 1:
+                    status, payload = pool.submit("/enroll", fields).result()
+                    if status != 200:
+                        print(f"❌ ERROR: Enrollment failed: {payload['error']}")
+                        return
+                for future in [pool.submit("/verify", fields) for _ in range(workers)]:
+                    future.result()  # first-inference costs out of the way
+                start = time.perf_counter()
+                results = [future.result() for future in [pool.submit("/verify", fields) for _ in range(args.requests)]]
+                seconds = time.perf_counter() - start
+                errors = sum(status != 200 for status, _ in results)
+            rate = args.requests / seconds
+            baseline = baseline or rate
+            print(f"  {workers:>3} workers: {rate:7.1f} req/s  {rate / baseline:5.2f}x  "
+                  f"completed per worker {pool.stats()['completed']}  {errors} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the util face/voice pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    face_batch = commands.add_parser("face-batch", help="Batched vs. per-image face embedding throughput")
+    face_batch.add_argument("--images", default="./db", help="Directory searched recursively for images")
+    face_batch.add_argument("--count", type=int, default=200, help="Images to process (inputs are repeated)")
+    face_batch.add_argument("--batch-size", type=int, default=32)
+    face_batch.add_argument("--workers", type=int, default=None)
+    face_batch.set_defaults(run=bench_face_batch)
+
+    face_config = commands.add_parser("face-config", help="Face latency per module set, det_size and downscale")
+    face_config.add_argument("--images", default="./db", help="Directory searched recursively for face images")
+    face_config.add_argument("--count", type=int, default=20, help="Images to use")
+    face_config.add_argument("--det-sizes", default="640,480,320", help="Comma-separated detector sizes")
+    face_config.add_argument("--max-side", type=int, default=640, help="Downscale larger frames to this for detection")
+    face_config.add_argument("--width", type=int, default=1280, help="Blank frame size when no images exist")
+    face_config.add_argument("--height", type=int, default=720)
+    face_config.add_argument("--repeats", type=int, default=10)
+    face_config.set_defaults(run=bench_face_config)
+
+    face_fusion = commands.add_parser("face-fusion", help="Multi-frame template cost per N and score variance")
+    face_fusion.add_argument("--images", default="./db", help="Directory searched recursively for face images")
+    face_fusion.add_argument("--frames", default="1,2,3,5,8", help="Comma-separated frame counts N")
+    face_fusion.add_argument("--repeats", type=int, default=20)
+    face_fusion.add_argument("--trials", type=int, default=2000, help="Synthetic probes per N")
+    face_fusion.set_defaults(run=bench_face_fusion)
+
+    voice_batch = commands.add_parser("voice-batch", help="Batched vs. per-file voice embedding throughput")
+    voice_batch.add_argument("--count", type=int, default=100, help="Synthetic recordings to process")
+    voice_batch.add_argument("--batch-size", type=int, default=16)
+    voice_batch.set_defaults(run=bench_voice_batch)
+
+    backends = commands.add_parser("voice-backends", help="Voice model latency on eager, TorchScript and ONNX Runtime")
+    backends.add_argument("--seconds", type=float, default=5.0, help="Utterance length")
+    backends.add_argument("--batch-size", type=int, default=16)
+    backends.add_argument("--repeats", type=int, default=20)
+    backends.add_argument("--threads", type=int, default=None, help="Intra-op threads (default: library default)")
+    backends.set_defaults(run=bench_voice_backends)
+
+    quant = commands.add_parser("voice-quant", help="Float vs. dynamic/static int8 voice model")
+    quant.add_argument("--speakers", type=int, default=20)
+    quant.add_argument("--utterances", type=int, default=5, help="Utterances per synthetic speaker")
+    quant.add_argument("--batch-size", type=int, default=16)
+    quant.add_argument("--repeats", type=int, default=20)
+    quant.add_argument("--threads", type=int, default=None)
+    quant.set_defaults(run=bench_voice_quant)
+
+    vad = commands.add_parser("vad", help="Voice embedding latency and stability with/without VAD")
+    vad.add_argument("--audio", default="./temp_voice.wav")
+    vad.add_argument("--repeats", type=int, default=5, help="Noise-only clips per noise level")
+    vad.set_defaults(run=bench_vad)
+
+    transforms = commands.add_parser("transforms", help="Per-call resample + mel latency, uncached vs. cached")
+    transforms.add_argument("--seconds", type=float, default=5.0)
+    transforms.add_argument("--repeats", type=int, default=20)
+    transforms.set_defaults(run=bench_transforms)
+
+    preview = commands.add_parser("preview", help="Camera preview CPU per frame, old vs. PreviewRenderer")
+    preview.add_argument("--frames", type=int, default=300)
+    preview.add_argument("--width", type=int, default=640)
+    preview.add_argument("--height", type=int, default=480)
+    preview.add_argument("--camera-fps", type=int, default=30)
+    preview.add_argument("--max-fps", type=int, default=15)
+    preview.set_defaults(run=bench_preview)
+
+    cache = commands.add_parser("cache", help="Embedding latency cold vs. served from the embedding cache")
+    cache.add_argument("--images", default="./db", help="Directory searched recursively for face images")
+    cache.add_argument("--count", type=int, default=20, help="Probes per modality")
+    cache.add_argument("--entries", type=int, default=1024, help="Cache size")
+    cache.set_defaults(run=bench_cache)
+
+    pool = commands.add_parser("pool", help="Verify throughput of the multi-process worker pool, 1..N workers")
+    pool.add_argument("--images", default="./db", help="Directory searched recursively for a face image")
+    pool.add_argument("--requests", type=int, default=100)
+    pool.add_argument("--seconds", type=float, default=3.0, help="Length of the synthetic voice sample")
+    pool.add_argument("--max-workers", type=int, default=None, help="Largest pool (default: one per CPU)")
+    pool.add_argument("--threads", type=int, default=1, help="Inference threads per worker")
+    pool.set_defaults(run=bench_pool)
+
+    args = parser.parse_args()
+    # The other benchmarks measure the models, so repeated inputs must not be served from the cache
+    util.EMBEDDING_CACHE.max_entries = 0
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import threading
+import time
+import numpy as np
+import cv2
+
+import util
+
+
+def sharpness(gray):
+    """Variance of the Laplacian: low for blurred or defocused images"""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def pose_score(kps):
+    """1.0 for a frontal face, falling to 0 with yaw or roll, from insightface's 5 keypoints.
+
+    Keypoints are left eye, right eye, nose, left and right mouth corner.
+    """
+    left_eye, right_eye, nose = kps[0], kps[1], kps[2]
+    eye_vector = right_eye - left_eye
+    eye_dist = float(np.linalg.norm(eye_vector))
+    if eye_dist < 1e-6:
+        return 0.0
+    # Nose drifts sideways from the eye midpoint as the head turns
+    yaw = abs(float(nose[0] - (left_eye[0] + right_eye[0]) / 2)) / eye_dist
+    roll = abs(np.degrees(np.arctan2(eye_vector[1], eye_vector[0])))
+    return float(np.clip(1 - yaw / 0.5, 0, 1) * np.clip(1 - roll / 30, 0, 1))
+
+
+def face_quality(frame, bbox, kps, det_score):
+    """Combined quality in [0, 1] plus its components for one detected face"""
+    h, w = frame.shape[:2]
+    x1, y1, x2, y2 = (int(v) for v in bbox[:4])
+    x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+    if x2 - x1 < 8 or y2 - y1 < 8:
+        return 0.0, {}
+
+    # Blur on a fixed-size face crop so near and far faces are comparable
+    crop = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+    crop = cv2.resize(crop, (112, 112), interpolation=cv2.INTER_AREA)
+    sharp = sharpness(crop)
+    components = {
+        "detector": float(det_score),
+        "sharpness": sharp / (sharp + 100.0),
+        "size": float(np.clip((x2 - x1) / (0.25 * w), 0, 1)),  # saturates at a quarter of the frame width
+        "pose": pose_score(kps),
+    }
+    return float(np.prod(list(components.values()))), components
+
+
+class FaceTracker:
+    """Follows one face through the camera preview without detecting on every frame.
+
+    The detector runs every detect_every frames; in between, the face's 5
+    keypoints are tracked with pyramidal Lucas-Kanade optical flow and the
+    box follows the similarity transform they moved by. Losing a point, a
+    large tracking error or a degenerate transform triggers an immediate
+    re-detection.
+    """
+
+    def __init__(self, detect_every=5, max_error=30.0):
+        self.detect_every = detect_every
+        self.max_error = max_error
+        self.detections = 0
+        self.reset()
+
+    def reset(self):
+        self._gray = None
+        self._bbox = None
+        self._kps = None
+        self._score = 0.0
+        self._since_detect = 0
+
+    def update(self, frame):
+        """Advance to frame; returns (bbox, kps, det_score) in frame coordinates, or None"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self._kps is None or self._since_detect + 1 >= self.detect_every or not self._track(gray):
+            self._detect(frame)
+        self._gray = gray
+        if self._kps is None:
+            return None
+        return self._bbox.copy(), self._kps.copy(), self._score
+
+    def _detect(self, frame):
+        self.detections += 1
+        self._since_detect = 0
+        bboxes, kpss = util.detect_faces(frame)
+        if bboxes is None or len(bboxes) == 0 or kpss is None:
+            self._kps = None
+            return
+        self._bbox = bboxes[0][:4].astype(np.float32)
+        self._kps = kpss[0].astype(np.float32)
+        self._score = float(bboxes[0][4])
+
+    def _track(self, gray):
+        points, status, error = cv2.calcOpticalFlowPyrLK(self._gray, gray, self._kps.reshape(-1, 1, 2), None,
+                                                         winSize=(21, 21), maxLevel=3)
+        if points is None or not status.all() or float(error.max()) > self.max_error:
+            return False
+        points = points.reshape(-1, 2)
+        transform, _ = cv2.estimateAffinePartial2D(self._kps, points)
+        if transform is None:
+            return False
+        x1, y1, x2, y2 = self._bbox
+        corners = cv2.transform(np.array([[[x1, y1], [x2, y1], [x1, y2], [x2, y2]]], dtype=np.float32), transform)[0]
+        self._bbox = np.concatenate([corners.min(axis=0), corners.max(axis=0)]).astype(np.float32)
+        self._kps = points
+        self._since_detect += 1
+        return True
+
+
+def draw_face_box(rgb_frame, bbox, color=(0, 255, 0)):
+    """Draw the tracked face box on the preview frame in place"""
+    x1, y1, x2, y2 = (int(v) for v in bbox[:4])
+    cv2.rectangle(rgb_frame, (x1, y1), (x2, y2), color, 2)
+
+
+class PreviewRenderer:
+    """Turns camera frames into fixed-size RGB preview frames for the Tk label.
+
+    The camera thread checks due() and calls submit(); the Tk loop polls
+    take() from root.after. Frames are resized with INTER_AREA into three
+    reused buffers (written, published, on screen), at most max_fps times
+    a second. A published frame the Tk loop has not taken yet is replaced,
+    so stale frames are dropped instead of queueing up.
+    """
+
+    def __init__(self, size=(300, 300), max_fps=15):
+        self.size = size
+        self.max_fps = max_fps
+        self._buffers = [np.zeros((size[1], size[0], 3), dtype=np.uint8) for _ in range(3)]
+        self._back, self._ready, self._front = 0, 1, 2
+        self._fresh = False
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+        self.submitted = 0
+        self.dropped = 0
+
+    def due(self, now=None):
+        """True once the FPS cap allows another preview frame (1 ms slack for clock jitter)"""
+        return (time.perf_counter() if now is None else now) >= self._next_time - 0.001
+
+    def submit(self, frame, now=None):
+        """Resize a BGR frame into the back buffer and publish it"""
+        now = time.perf_counter() if now is None else now
+        self._next_time = now + 1.0 / self.max_fps
+        buffer = self._buffers[self._back]
+        cv2.resize(frame, self.size, dst=buffer, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(buffer, cv2.COLOR_BGR2RGB, dst=buffer)
+        with self._lock:
+            if self._fresh:
+                self.dropped += 1
+            self._back, self._ready = self._ready, self._back
+            self._fresh = True
+        self.submitted += 1
+
+    def take(self):
+        """The newest unseen preview frame (RGB), or None; valid until the next take()"""
+        with self._lock:
+            if not self._fresh:
+                return None
+            self._front, self._ready = self._ready, self._front
+            self._fresh = False
+        return self._buffers[self._front]
+
+
+class FrameSelector:
+    """Keeps capture candidates in a preallocated ring buffer and picks the best face.
+
+    add() copies each frame into a reused slot and computes a cheap
+    whole-frame sharpness; select() runs the detector only on the sharpest
+    few candidates and scores them by detector confidence, face sharpness,
+    face size and pose. Frames added with a tracked face (FaceTracker) are
+    scored from it and skip detection entirely. Only the winning frame (or
+    the best few, for a fused template) then goes on to ArcFace.
+    """
+
+    def __init__(self, capacity=5, max_detect=3, preview_size=(160, 120)):
+        self.capacity = capacity
+        self.max_detect = max_detect
+        self.preview_size = preview_size
+        self._frames = None
+        self._sharpness = np.zeros(capacity)
+        self._faces = [None] * capacity  # (bbox, kps, det_score) when the frame came with a tracked face
+        self._count = 0
+
+    def reset(self):
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def add(self, frame, face=None):
+        """Buffer a candidate frame, optionally with its tracked (bbox, kps, det_score)"""
+        if self._frames is None or self._frames.shape[1:] != frame.shape:
+            self._frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+        slot = self._count % self.capacity
+        np.copyto(self._frames[slot], frame)
+        self._faces[slot] = face
+        small = cv2.resize(frame, self.preview_size, interpolation=cv2.INTER_AREA)
+        self._sharpness[slot] = sharpness(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+        self._count += 1
+
+    def select_top(self, n=1):
+        """Return up to n (frame copy, quality, components, keypoints) tuples, best first.
+
+        The keypoints let util.extract_face_template align the frames
+        without running the detector again.
+        """
+        order = np.argsort(-self._sharpness[:len(self)])
+        tracked = [slot for slot in order if self._faces[slot] is not None]
+        untracked = [slot for slot in order if self._faces[slot] is None][:max(self.max_detect, n)]
+        scored = []
+        for slot in tracked + untracked:
+            frame = self._frames[slot]
+            if self._faces[slot] is not None:
+                bbox, kps, det_score = self._faces[slot]
+            else:
+                bboxes, kpss = util.detect_faces(frame)
+                if bboxes is None or len(bboxes) == 0 or kpss is None:
+                    continue
+                bbox, kps, det_score = bboxes[0], kpss[0], bboxes[0][4]
+            quality, components = face_quality(frame, bbox, kps, det_score)
+            scored.append((quality, slot, components, kps))
+        scored.sort(key=lambda item: -item[0])
+        return [(self._frames[slot].copy(), quality, components, kps)
+                for quality, slot, components, kps in scored[:n]]
+
+    def select(self):
+        """Return (frame copy, quality, components) of the best candidate, or (None, 0.0, {})"""
+        best = self.select_top(1)
+        if not best:
+            return None, 0.0, {}
+        frame, quality, components, _ = best[0]
+        return frame, quality, components
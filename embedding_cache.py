@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def content_key(kind, data, *version):
+    """Cache key of a decoded image/audio buffer: kind, model/config version and a content hash.
+
+    Shape and dtype are hashed along with the bytes, so equal bytes in a
+    different layout do not collide.
+    """
+    data = np.ascontiguousarray(data)
+    digest = hashlib.blake2b(data.view(np.uint8).reshape(-1), digest_size=16)
+    digest.update(repr((data.shape, data.dtype.str)).encode())
+    return (kind,) + tuple(version) + (digest.hexdigest(),)
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of embeddings, bounded by entry count and bytes, with a TTL.
+
+    get() returns a copy, so callers may modify what they get; entries older
+    than ttl seconds count as misses and are dropped. Counters (hits,
+    misses, evictions, expirations) are reported by stats(). A key of None
+    (see enabled) is never stored or looked up.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 << 20, ttl=600.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored at, array)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        """False when max_entries is 0; callers then skip hashing and pass key None"""
+        return bool(self.max_entries)
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].copy()
+
+    def put(self, key, value):
+        if key is None or not self.max_entries:
+            return
+        value = np.array(value, copy=True)
+        if value.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic(), value)
+            self._bytes += value.nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= value.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "expirations": self.expirations,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
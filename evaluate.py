@@ -0,0 +1,256 @@
+import contextlib
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+
+import fusion
+
+FACE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+VOICE_EXTENSIONS = (".wav", ".flac", ".ogg")
+DIMS = {"face": 512, "voice": 256}
+
+
+def dataset_files(root):
+    """{"face": [(user, path)], "voice": [(user, path)]} for a directory laid out like ./db/<user>/"""
+    files = {"face": [], "voice": []}
+    for user in sorted(os.listdir(root)):
+        user_dir = os.path.join(root, user)
+        if not os.path.isdir(user_dir):
+            continue
+        for name in sorted(os.listdir(user_dir)):
+            extension = os.path.splitext(name)[1].lower()
+            if extension in FACE_EXTENSIONS:
+                files["face"].append((user, os.path.join(user_dir, name)))
+            elif extension in VOICE_EXTENSIONS:
+                files["voice"].append((user, os.path.join(user_dir, name)))
+    return files
+
+
+def _init_worker(threads):
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def _embed_shard(job):
+    """Pool task: (kind, first row, paths) -> (kind, first row, embeddings, statuses)"""
+    import util
+
+    kind, start, paths = job
+    util.EMBEDDING_CACHE.max_entries = 0  # every file is seen once
+    with contextlib.redirect_stdout(io.StringIO()):
+        if kind == "face":
+            embeddings, statuses = util.extract_face_features_batch(paths, workers=1)
+        else:
+            embeddings, statuses = util.extract_voice_features_batch(paths, workers=1)
+    return kind, start, embeddings, statuses
+
+
+def extract_embeddings(files, work_dir, workers=None, shard_size=64, threads=1):
+    """Embed every file once across a process pool, streaming shards into on-disk memmaps.
+
+    Returns {kind: (memmap of embeddings, ok mask)}; only one shard per
+    worker is in memory at a time.
+    """
+    import util
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and not util.voice_weights_shared():
+        # Shards embedded by different processes would not be comparable
+        raise ValueError("Several extraction workers need identical voice weights; set VOICE_WEIGHTS or VOICE_SEED")
+    jobs, outputs = [], {}
+    for kind, items in files.items():
+        if not items:
+            continue
+        outputs[kind] = (np.lib.format.open_memmap(os.path.join(work_dir, f"{kind}.npy"), mode="w+",
+                                                   dtype=np.float32, shape=(len(items), DIMS[kind])),
+                         np.zeros(len(items), dtype=bool))
+        paths = [path for _, path in items]
+        jobs += [(kind, start, paths[start:start + shard_size]) for start in range(0, len(paths), shard_size)]
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        for kind, start, embeddings, statuses in pool.imap_unordered(_embed_shard, jobs):
+            matrix, ok = outputs[kind]
+            matrix[start:start + len(embeddings)] = embeddings
+            ok[start:start + len(statuses)] = [status == "ok" for status in statuses]
+    for matrix, _ in outputs.values():
+        matrix.flush()
+    return outputs
+
+
+class ScoreHistogram:
+    """Genuine/impostor score counts in fixed bins, so ROC/EER need no per-pair storage"""
+
+    def __init__(self, low, high, bins=10000):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.genuine = np.zeros(bins, dtype=np.int64)
+        self.impostor = np.zeros(bins, dtype=np.int64)
+
+    def add(self, scores, genuine):
+        index = ((scores - self.low) * (self.bins / (self.high - self.low))).astype(np.int64)
+        np.clip(index, 0, self.bins - 1, out=index)
+        self.genuine += np.bincount(index[genuine], minlength=self.bins)
+        self.impostor += np.bincount(index[~genuine], minlength=self.bins)
+
+    def rates(self):
+        """(thresholds, far, frr) at each bin's lower edge, accepting scores >= threshold"""
+        thresholds = self.low + np.arange(self.bins) * (self.high - self.low) / self.bins
+        far = np.cumsum(self.impostor[::-1])[::-1] / max(self.impostor.sum(), 1)
+        frr = np.concatenate([[0], np.cumsum(self.genuine)[:-1]]) / max(self.genuine.sum(), 1)
+        return thresholds, far, frr
+
+    def eer(self):
+        thresholds, far, frr = self.rates()
+        i = int(np.argmin(np.abs(far - frr)))
+        return float((far[i] + frr[i]) / 2), float(thresholds[i])
+
+    def at_threshold(self, threshold):
+        """(FAR, FRR) at threshold, to bin resolution"""
+        thresholds, far, frr = self.rates()
+        i = min(int(np.searchsorted(thresholds, threshold, side="left")), self.bins - 1)
+        return float(far[i]), float(frr[i])
+
+    def threshold_at_far(self, target_far):
+        thresholds, far, _ = self.rates()
+        i = min(int(np.searchsorted(-far, -target_far, side="left")), self.bins - 1)
+        return float(thresholds[i])
+
+
+def score_blocks(probes, gallery, probe_labels, gallery_labels, block=4096, same_set=True):
+    """Yield (scores, genuine, keep, (row, column)) per block of the clamped cosine score matrix.
+
+    Scores match compare_embeddings; rows of probes/gallery must be unit
+    length (or zero). With same_set, keep excludes the diagonal (a sample
+    against itself) and the pairs below it, which are the same trials again.
+    """
+    for i in range(0, len(probes), block):
+        a = np.asarray(probes[i:i + block])
+        for j in range(i if same_set else 0, len(gallery), block):
+            scores = np.clip(a @ np.asarray(gallery[j:j + block]).T, 0.0, 1.0)
+            genuine = probe_labels[i:i + block, None] == gallery_labels[None, j:j + block]
+            keep = np.ones_like(genuine)
+            if same_set and i == j:
+                keep = np.triu(keep, k=1)
+            yield scores, genuine, keep, (i, j)
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def evaluate(root, work_dir, score_fusion, workers=None, shard_size=64, block=4096, bins=10000):
+    """Embed a dataset once and return per-modality and fused ScoreHistograms plus timings"""
+    files = dataset_files(root)
+    start = time.perf_counter()
+    embedded = extract_embeddings(files, work_dir, workers, shard_size)
+    extract_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    histograms, units, labels = {}, {}, {}
+    for kind, (matrix, ok) in embedded.items():
+        users = np.array([user for user, _ in files[kind]])[ok]
+        labels[kind] = np.unique(users, return_inverse=True)[1]
+        units[kind] = np.lib.format.open_memmap(os.path.join(work_dir, f"{kind}_unit.npy"), mode="w+",
+                                                dtype=np.float32, shape=(int(ok.sum()), DIMS[kind]))
+        rows = np.flatnonzero(ok)
+        for i in range(0, len(rows), block):
+            units[kind][i:i + block] = _unit_rows(matrix[rows[i:i + block]])
+        histograms[kind] = ScoreHistogram(0.0, 1.0, bins)
+        for scores, genuine, keep, _ in score_blocks(units[kind], units[kind], labels[kind], labels[kind], block):
+            histograms[kind].add(scores[keep], genuine[keep])
+
+    # Fused trials pair each user's k-th face with their k-th recording
+    if len(embedded) == 2:
+        pairs = _paired_rows(files, embedded)
+        if len(pairs):
+            corners = [score_fusion.fuse({"face": f, "voice": v}) for f in (0.0, 1.0) for v in (0.0, 1.0)]
+            histograms["fused"] = ScoreHistogram(min(corners), max(corners), bins)
+            face, voice = (_gather(units[kind], pairs[:, column], os.path.join(work_dir, f"{kind}_paired.npy"), block)
+                           for column, kind in enumerate(("face", "voice")))
+            pair_labels = labels["face"][pairs[:, 0]]
+            voice_blocks = score_blocks(voice, voice, pair_labels, pair_labels, block)
+            for (face_scores, genuine, keep, _), (voice_scores, _, _, _) in zip(
+                    score_blocks(face, face, pair_labels, pair_labels, block), voice_blocks):
+                fused = score_fusion.fuse({"face": face_scores[keep], "voice": voice_scores[keep]})
+                histograms["fused"].add(fused, genuine[keep])
+    score_seconds = time.perf_counter() - start
+
+    counts = {kind: len(files[kind]) for kind in embedded}
+    failed = {kind: int((~ok).sum()) for kind, (_, ok) in embedded.items()}
+    return histograms, {"files": counts, "failed": failed, "extract_seconds": extract_seconds,
+                        "score_seconds": score_seconds}
+
+
+def _gather(matrix, rows, path, block):
+    """matrix[rows] written block by block into a new memmap"""
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=matrix.dtype, shape=(len(rows), matrix.shape[1]))
+    for i in range(0, len(rows), block):
+        out[i:i + block] = matrix[rows[i:i + block]]
+    return out
+
+
+def _paired_rows(files, embedded):
+    """(face row, voice row) indices into the ok-only unit matrices, k-th face with k-th voice per user"""
+    per_user = {}
+    for kind in ("face", "voice"):
+        _, ok = embedded[kind]
+        for row, (user, _) in enumerate(np.array(files[kind], dtype=object)[ok]):
+            per_user.setdefault(user, {"face": [], "voice": []})[kind].append(row)
+    pairs = [(f, v) for user in sorted(per_user) for f, v in zip(per_user[user]["face"], per_user[user]["voice"])]
+    return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+
+def report(histograms, stats, thresholds, fars, score_fusion):
+    for kind, count in stats["files"].items():
+        print(f"{kind}: {count} files, {stats['failed'][kind]} failed")
+    total = sum(stats["files"].values())
+    print(f"Extraction: {stats['extract_seconds']:.1f} s ({total / max(stats['extract_seconds'], 1e-9):.1f} files/s)")
+    pairs = sum(int(h.genuine.sum() + h.impostor.sum()) for h in histograms.values())
+    print(f"Scoring: {pairs} pairs in {stats['score_seconds']:.2f} s "
+          f"({pairs / max(stats['score_seconds'], 1e-9) / 1e6:.1f} M pairs/s)")
+    for name, histogram in histograms.items():
+        rate, at = histogram.eer()
+        print(f"\n{name}: {int(histogram.genuine.sum())} genuine / {int(histogram.impostor.sum())} impostor pairs, "
+              f"EER {rate:.2%} at {at:.3f}")
+        points = list(thresholds)
+        if name == "fused" and score_fusion.threshold not in points:
+            points.append(score_fusion.threshold)
+        for threshold in points:
+            far, frr = histogram.at_threshold(threshold)
+            print(f"  threshold {threshold:7.3f}: FAR {far:8.4%}  FRR {frr:7.2%}")
+        for target in fars:
+            threshold = histogram.threshold_at_far(target)
+            far, frr = histogram.at_threshold(threshold)
+            print(f"  FAR <= {target:g}: threshold {threshold:.3f}  FRR {frr:.2%}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-score a labelled dataset laid out like ./db/<user>/ offline")
+    parser.add_argument("--data", default="./db", help="Dataset root with one directory of images/recordings per user")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: one per CPU)")
+    parser.add_argument("--shard-size", type=int, default=64, help="Files per extraction task")
+    parser.add_argument("--block", type=int, default=4096, help="Rows per score matrix block")
+    parser.add_argument("--work-dir", help="Where embedding shards are written (default: a temporary directory)")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9", help="Comma-separated thresholds to report")
+    parser.add_argument("--fars", default="0.01,0.001", help="Comma-separated target FARs to report")
+    parser.add_argument("--fusion-config", default=fusion.FUSION_PATH)
+    args = parser.parse_args()
+
+    engine = fusion.load_fusion(args.fusion_config)
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(work_dir, exist_ok=True)
+        histograms, stats = evaluate(args.data, work_dir, engine, args.workers, args.shard_size, args.block)
+        if not histograms:
+            print(f"❌ ERROR: No face images or recordings found under {args.data}")
+        else:
+            report(histograms, stats, [float(t) for t in args.thresholds.split(",")],
+                   [float(f) for f in args.fars.split(",")], engine)
@@ -0,0 +1,476 @@
+import json
+import os
+import numpy as np
+
+FUSION_PATH = "./db/fusion.json"
+MODALITIES = ("face", "voice")
+VERIFY_THRESHOLD = 0.7  # fused threshold of the uncalibrated 50/50 mean
+
+
+# Evaluation: every function takes whole genuine/impostor score arrays
+
+def roc(genuine, impostor):
+    """(thresholds, far, frr) at every distinct score, thresholds ascending.
+
+    A trial is accepted when its score is >= the threshold.
+    """
+    genuine = np.sort(np.asarray(genuine, dtype=np.float64).reshape(-1))
+    impostor = np.sort(np.asarray(impostor, dtype=np.float64).reshape(-1))
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    frr = np.searchsorted(genuine, thresholds, side="left") / max(len(genuine), 1)
+    far = 1 - np.searchsorted(impostor, thresholds, side="left") / max(len(impostor), 1)
+    return thresholds, far, frr
+
+
+def eer(genuine, impostor):
+    """(equal error rate, threshold at which FAR and FRR cross)"""
+    thresholds, far, frr = roc(genuine, impostor)
+    i = int(np.argmin(np.abs(far - frr)))
+    return float((far[i] + frr[i]) / 2), float(thresholds[i])
+
+
+def threshold_at_far(impostor, target_far):
+    """Lowest threshold whose false accept rate is at most target_far (-inf without impostor scores)"""
+    impostor = np.sort(np.asarray(impostor, dtype=np.float64).reshape(-1))
+    if len(impostor) == 0:
+        return -np.inf
+    allowed = int(np.floor(target_far * len(impostor)))  # impostors that may score >= threshold
+    if allowed >= len(impostor):
+        return float(impostor[0])
+    # Just above the highest impostor that must be rejected
+    return float(np.nextafter(impostor[len(impostor) - allowed - 1], np.inf))
+
+
+def error_rates(genuine, impostor, threshold):
+    """(FAR, FRR) at one threshold"""
+    far = float(np.mean(np.asarray(impostor) >= threshold)) if len(impostor) else 0.0
+    frr = float(np.mean(np.asarray(genuine) < threshold)) if len(genuine) else 0.0
+    return far, frr
+
+
+def det_curve(genuine, impostor):
+    """(far, frr) on the normal-deviate (probit) scale of a DET plot, rates clipped away from 0/1"""
+    from scipy.special import ndtri
+
+    _, far, frr = roc(genuine, impostor)
+    eps = 0.5 / max(len(genuine), len(impostor), 1)
+    return ndtri(np.clip(far, eps, 1 - eps)), ndtri(np.clip(frr, eps, 1 - eps))
+
+
+def _logistic_fit(features, labels, l2=1e-4, iterations=50):
+    """Class-balanced logistic regression by Newton's method; returns (weights, bias)"""
+    x = np.column_stack([features, np.ones(len(features))])
+    y = np.asarray(labels, dtype=np.float64)
+    positives = max(y.sum(), 1.0)
+    sample_weight = np.where(y > 0, 0.5 / positives, 0.5 / max(len(y) - positives, 1.0))
+    beta = np.zeros(x.shape[1])
+    ridge = l2 * np.eye(x.shape[1])
+    ridge[-1, -1] = 0
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-np.clip(x @ beta, -30, 30)))
+        gradient = x.T @ (sample_weight * (p - y)) + ridge @ beta
+        hessian = (x * (sample_weight * p * (1 - p))[:, None]).T @ x + ridge
+        step = np.linalg.solve(hessian + 1e-9 * np.eye(x.shape[1]), gradient)
+        beta -= step
+        if np.abs(step).max() < 1e-9:
+            break
+    return beta[:-1], float(beta[-1])
+
+
+# Per-modality score normalization
+
+class IdentityCalibration:
+    name = "none"
+
+    def fit(self, genuine, impostor):
+        return self
+
+    def __call__(self, scores):
+        return np.asarray(scores, dtype=np.float64)
+
+    def params(self):
+        return {}
+
+
+class ZNorm(IdentityCalibration):
+    """Scores in impostor standard deviations above the impostor mean"""
+    name = "znorm"
+
+    def __init__(self, mean=0.0, std=1.0):
+        self.mean = mean
+        self.std = std
+
+    def fit(self, genuine, impostor):
+        self.mean = float(np.mean(impostor))
+        self.std = float(np.std(impostor)) or 1.0
+        return self
+
+    def __call__(self, scores):
+        return (np.asarray(scores, dtype=np.float64) - self.mean) / self.std
+
+    def params(self):
+        return {"mean": self.mean, "std": self.std}
+
+
+class LogisticCalibration(IdentityCalibration):
+    """Scores as log-odds of a genuine trial, assuming equal priors"""
+    name = "logistic"
+
+    def __init__(self, scale=1.0, offset=0.0):
+        self.scale = scale
+        self.offset = offset
+
+    def fit(self, genuine, impostor):
+        scores = np.concatenate([genuine, impostor])
+        labels = np.concatenate([np.ones(len(genuine)), np.zeros(len(impostor))])
+        weights, self.offset = _logistic_fit(scores[:, None], labels)
+        self.scale = float(weights[0])
+        return self
+
+    def __call__(self, scores):
+        return self.scale * np.asarray(scores, dtype=np.float64) + self.offset
+
+    def params(self):
+        return {"scale": self.scale, "offset": self.offset}
+
+
+CALIBRATIONS = {cls.name: cls for cls in (IdentityCalibration, ZNorm, LogisticCalibration)}
+
+
+class ScoreFusion:
+    """Per-modality calibration, weighted fusion and a decision threshold.
+
+    fused = sum(weights[m] * calibration[m](score[m])) + bias. The default
+    (no calibration, 0.5/0.5, threshold 0.7) is the original mean of the
+    face and voice scores. fit() learns the calibrations and, with
+    fusion="learned", the weights and bias by logistic regression on the
+    calibrated scores; set_operating_point() then picks the threshold for a
+    target false accept rate.
+
+    Modalities can also be scored one at a time in order: bands maps a
+    modality to raw-score (reject_below, accept_at) limits, and a score
+    outside them decides the trial without scoring the rest (outcome()).
+    fit_bands() sets them for a target FAR. Without bands every modality
+    is always scored.
+    """
+
+    def __init__(self, modalities=MODALITIES, calibrations=None, weights=None, bias=0.0,
+                 threshold=VERIFY_THRESHOLD, target_far=None, order=None, bands=None):
+        self.modalities = tuple(modalities)
+        self.calibrations = calibrations or {m: IdentityCalibration() for m in self.modalities}
+        self.weights = weights or {m: 1.0 / len(self.modalities) for m in self.modalities}
+        self.bias = bias
+        self.threshold = threshold
+        self.target_far = target_far
+        self.order = tuple(order or self.modalities)
+        self.bands = bands or {}
+
+    def calibrate(self, modality, scores):
+        return self.calibrations[modality](scores)
+
+    def fuse(self, scores):
+        """Fused score(s) from {modality: score or score array}"""
+        return sum(self.weights[m] * self.calibrate(m, scores[m]) for m in self.modalities) + self.bias
+
+    def decide(self, scores):
+        """(fused score, accepted) for one trial"""
+        fused = float(self.fuse(scores))
+        return fused, fused >= self.threshold
+
+    def early_decision(self, modality, score):
+        """True (accept) or False (reject) when score falls outside the modality's band, else None"""
+        if modality not in self.bands:
+            return None
+        reject_below, accept_at = self.bands[modality]
+        if score >= accept_at:
+            return True
+        if score < reject_below:
+            return False
+        return None
+
+    def outcome(self, scores):
+        """(score, accepted, early) once the modalities scored so far, in order, are decisive, else None"""
+        path = [m for m in self.order if m in scores]
+        if len(path) == len(self.order):
+            return self.decide(scores) + (False,)
+        decision = self.early_decision(path[-1], scores[path[-1]]) if path else None
+        if decision is None:
+            return None
+        return float(scores[path[-1]]), decision, True
+
+    def decisive_band(self, modality, resolution=1000):
+        """Raw (reject_below, accept_at) limits at which this modality's score alone fixes the outcome.
+
+        A score outside them decides the fused trial whatever the other
+        modalities score in [0, 1], or is decisive under the modality's
+        early-exit band. -inf/inf on a side where no score in [0, 1] is
+        decisive, e.g. accepting on the voice alone with the 50/50 mean
+        (scores are never below 0, so a reject_below of 0 never rejects).
+        """
+        grid = np.linspace(0.0, 1.0, resolution + 1)
+        others = [m for m in self.modalities if m != modality]
+        # fuse() is affine in the calibrated scores, so the extremes lie at the corners
+        corners = [self.fuse({modality: grid, **dict(zip(others, corner))})
+                   for corner in np.ndindex(*(2,) * len(others))]
+        best, worst = np.max(corners, axis=0), np.min(corners, axis=0)
+        reject = np.flatnonzero(best >= self.threshold)
+        accept = np.flatnonzero(worst >= self.threshold)
+        reject_below = float(grid[reject[0]]) if len(reject) else np.inf
+        accept_at = float(grid[accept[0]]) if len(accept) else np.inf
+        if modality in self.bands:
+            band_reject, band_accept = self.bands[modality]
+            reject_below, accept_at = max(reject_below, band_reject), min(accept_at, band_accept)
+        return reject_below, accept_at
+
+    def decide_sequential(self, scorers):
+        """Call {modality: () -> score} in order until decisive.
+
+        Returns {"score", "verified", "early", "path"}, path being the
+        modalities that were actually scored.
+        """
+        scores = {}
+        for m in self.order:
+            scores[m] = scorers[m]()
+            result = self.outcome(scores)
+            if result is not None:
+                score, verified, early = result
+                return {"score": score, "verified": verified, "early": early, "path": list(scores)}
+
+    def fit_bands(self, labels, scores, target_far, early_far_share=0.5, early_frr=0.001):
+        """Set early-exit bands and re-fit the threshold so overall FAR stays at target_far.
+
+        Each modality but the last may spend early_far_share of the FAR
+        budget on early accepts and reject at most early_frr of genuine
+        trials early. The fused threshold then spends what is left of the
+        budget on the trials that reach the last modality.
+        """
+        labels = np.asarray(labels).astype(bool)
+        pending = np.ones(len(labels), dtype=bool)
+        accepted_impostors = 0
+        self.bands = {}
+        for m in self.order[:-1]:
+            raw = np.asarray(scores[m], dtype=np.float64)
+            if not (~labels & pending).any():
+                # Earlier bands already decided every impostor: no data to set this band on
+                continue
+            accept_at = threshold_at_far(raw[~labels & pending], target_far * early_far_share * (~labels).sum()
+                                         / max((~labels & pending).sum(), 1))
+            reject_below = accept_at
+            if (labels & pending).any():
+                reject_below = min(float(np.quantile(raw[labels & pending], early_frr)), accept_at)
+            self.bands[m] = (reject_below, accept_at)
+            accepted_impostors += int(np.sum(~labels & pending & (raw >= accept_at)))
+            pending &= (raw >= reject_below) & (raw < accept_at)
+
+        remaining = max(target_far * (~labels).sum() - accepted_impostors, 0) / max((~labels & pending).sum(), 1)
+        fused = self.fuse(scores)
+        if (~labels & pending).any():
+            self.threshold = threshold_at_far(fused[~labels & pending], remaining)
+        else:
+            # No impostor reaches the last modality here; keep the plain fused operating point
+            # instead of accepting everything that does
+            self.threshold = threshold_at_far(fused[~labels], target_far)
+        self.target_far = target_far
+        return self.bands
+
+    def fit(self, labels, scores, calibration="logistic", fusion="learned", weights=None):
+        """Learn calibrations (and fused weights) from labelled trials.
+
+        labels is 1 for genuine and 0 for impostor trials; scores maps each
+        modality to the raw score array of the same trials. fusion="weighted"
+        keeps the given (or current) weights, normalized to sum to 1.
+        """
+        labels = np.asarray(labels).astype(bool)
+        calibrated = []
+        for m in self.modalities:
+            raw = np.asarray(scores[m], dtype=np.float64)
+            self.calibrations[m] = CALIBRATIONS[calibration]().fit(raw[labels], raw[~labels])
+            calibrated.append(self.calibrations[m](raw))
+        if fusion == "learned":
+            learned, self.bias = _logistic_fit(np.column_stack(calibrated), labels)
+            self.weights = dict(zip(self.modalities, (float(w) for w in learned)))
+        elif fusion == "weighted":
+            weights = weights or self.weights
+            total = sum(weights[m] for m in self.modalities)
+            self.weights = {m: weights[m] / total for m in self.modalities}
+            self.bias = 0.0
+        else:
+            raise ValueError(f"Unknown fusion {fusion!r}; choose 'learned' or 'weighted'")
+        return self
+
+    def set_operating_point(self, labels, scores, target_far):
+        """Set the threshold to the lowest one meeting target_far on these trials"""
+        fused = self.fuse(scores)
+        labels = np.asarray(labels).astype(bool)
+        self.threshold = threshold_at_far(fused[~labels], target_far)
+        self.target_far = target_far
+        return self.threshold
+
+    def to_dict(self):
+        return {
+            "modalities": list(self.modalities),
+            "calibrations": {m: {"type": c.name, **c.params()} for m, c in self.calibrations.items()},
+            "weights": self.weights,
+            "bias": self.bias,
+            "threshold": self.threshold,
+            "target_far": self.target_far,
+            "order": list(self.order),
+            "bands": {m: list(band) for m, band in self.bands.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, config):
+        calibrations = {}
+        for m, params in config["calibrations"].items():
+            params = dict(params)
+            calibrations[m] = CALIBRATIONS[params.pop("type")](**params)
+        return cls(config["modalities"], calibrations, config["weights"], config["bias"],
+                   config["threshold"], config.get("target_far"), config.get("order"),
+                   {m: tuple(band) for m, band in config.get("bands", {}).items()})
+
+    def save(self, path=FUSION_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def load_fusion(path=FUSION_PATH):
+    """The saved fusion config, or the default 50/50 mean if there is none (or it is unreadable)"""
+    if not os.path.exists(path):
+        return ScoreFusion()
+    try:
+        with open(path) as f:
+            return ScoreFusion.from_dict(json.load(f))
+    except Exception as e:
+        print(f"⚠️ Could not load fusion config {path}: {str(e)}; using the default")
+        return ScoreFusion()
+
+
+def load_scores(path):
+    """(labels, {modality: scores}) from an .npz with 'labels' and one array per modality"""
+    data = np.load(path)
+    return data["labels"], {m: data[m] for m in MODALITIES if m in data}
+
+
+def report(labels, scores, fusion, fars=(0.01, 0.001, 0.0001)):
+    """Print EER per modality and fused, and FRR at each target FAR"""
+    labels = np.asarray(labels).astype(bool)
+    print(f"{labels.sum()} genuine / {(~labels).sum()} impostor trials")
+    columns = dict(scores, fused=fusion.fuse(scores))
+    for name, values in columns.items():
+        genuine, impostor = values[labels], values[~labels]
+        rate, at = eer(genuine, impostor)
+        points = "  ".join(f"FRR@FAR{far:g} {error_rates(genuine, impostor, threshold_at_far(impostor, far))[1]:.2%}"
+                           for far in fars)
+        print(f"  {name:<6} EER {rate:6.2%} (threshold {at:.3f})  {points}")
+    far, frr = error_rates(columns["fused"][labels], columns["fused"][~labels], fusion.threshold)
+    print(f"  operating point {fusion.threshold:.4f}: FAR {far:.4%}  FRR {frr:.2%}")
+
+
+def simulate(labels, scores, fusion, compute_ms, wall_seconds):
+    """Vectorized sequential policy over recorded trials vs. always scoring every modality.
+
+    compute_ms and wall_seconds give each modality's inference cost and
+    the capture time it adds (e.g. the voice recording); returns a dict of
+    averages and error rates.
+    """
+    labels = np.asarray(labels).astype(bool)
+    pending = np.ones(len(labels), dtype=bool)
+    accepted = np.zeros(len(labels), dtype=bool)
+    compute = np.zeros(len(labels))
+    wall = np.zeros(len(labels))
+    for m in fusion.order:
+        raw = np.asarray(scores[m], dtype=np.float64)
+        compute += pending * compute_ms[m]
+        wall += pending * wall_seconds[m]
+        if m == fusion.order[-1] or m not in fusion.bands:
+            continue
+        reject_below, accept_at = fusion.bands[m]
+        accepted |= pending & (raw >= accept_at)
+        pending &= (raw >= reject_below) & (raw < accept_at)
+    fused_accept = fusion.fuse(scores) >= fusion.threshold
+    accepted |= pending & fused_accept
+    return {
+        "early": 1 - float(pending.mean()),
+        "compute_ms": float(compute.mean()),
+        "full_compute_ms": float(sum(compute_ms[m] for m in fusion.order)),
+        "wall_seconds": float(wall.mean()),
+        "full_wall_seconds": float(sum(wall_seconds[m] for m in fusion.order)),
+        "far": float(accepted[~labels].mean()),
+        "frr": float(1 - accepted[labels].mean()),
+        "full_far": float(fused_accept[~labels].mean()),
+        "full_frr": float(1 - fused_accept[labels].mean()),
+    }
+
+
+def _costs(pairs, defaults):
+    costs = dict(defaults)
+    for pair in pairs or []:
+        name, _, value = pair.partition("=")
+        costs[name] = float(value)
+    return costs
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fit and evaluate face/voice score fusion")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit_parser = commands.add_parser("fit", help="Learn calibration, weights and threshold from scored trials")
+    fit_parser.add_argument("--scores", required=True, help=".npz with labels, face and voice arrays")
+    fit_parser.add_argument("--calibration", choices=sorted(CALIBRATIONS), default="logistic")
+    fit_parser.add_argument("--fusion", choices=["learned", "weighted"], default="learned")
+    fit_parser.add_argument("--far", type=float, default=0.001, help="Target false accept rate")
+    fit_parser.add_argument("--out", default=FUSION_PATH)
+    fit_parser.add_argument("--sequential", action="store_true",
+                            help="Also fit early-exit bands so a decisive first modality skips the rest")
+    fit_parser.add_argument("--early-frr", type=float, default=0.001, help="Genuine trials that may be rejected early")
+    eval_parser = commands.add_parser("evaluate", help="ROC/EER and FRR at fixed FAR for a fusion config")
+    eval_parser.add_argument("--scores", required=True)
+    eval_parser.add_argument("--config", default=FUSION_PATH)
+    eval_parser.add_argument("--det", help="Write DET curve points (probit FAR, FRR) to this .csv")
+    sim_parser = commands.add_parser("simulate", help="Compute and wall time saved by early exit at fixed FAR")
+    sim_parser.add_argument("--scores", required=True)
+    sim_parser.add_argument("--far", type=float, default=0.001)
+    sim_parser.add_argument("--early-frr", type=float, default=0.001)
+    sim_parser.add_argument("--order", default=",".join(MODALITIES), help="Comma-separated scoring order")
+    sim_parser.add_argument("--compute-ms", action="append", metavar="MODALITY=MS",
+                            help="Inference cost per modality (default face=25, voice=60)")
+    sim_parser.add_argument("--wall-seconds", action="append", metavar="MODALITY=S",
+                            help="Capture time per modality (default face=3, voice=5: countdown and recording)")
+    args = parser.parse_args()
+
+    labels, scores = load_scores(args.scores)
+    if args.command == "simulate":
+        # Same fit on both sides, so the comparison is at the same target FAR
+        full = ScoreFusion(order=args.order.split(",")).fit(labels, scores)
+        full.set_operating_point(labels, scores, args.far)
+        engine = ScoreFusion.from_dict(full.to_dict())
+        engine.fit_bands(labels, scores, args.far, early_frr=args.early_frr)
+        compute_ms = _costs(args.compute_ms, {"face": 25, "voice": 60})
+        wall_seconds = _costs(args.wall_seconds, {"face": 3, "voice": 5})
+        result = simulate(labels, scores, engine, compute_ms, wall_seconds)
+        full_result = simulate(labels, scores, full, compute_ms, wall_seconds)
+        print(f"Order {' -> '.join(engine.order)}, target FAR {args.far:g}; bands {engine.bands}")
+        print(f"  decided early: {result['early']:.1%} of trials")
+        print(f"  compute: {full_result['compute_ms']:.1f} -> {result['compute_ms']:.1f} ms/trial  "
+              f"({1 - result['compute_ms'] / full_result['compute_ms']:.1%} saved)")
+        print(f"  wall:    {full_result['wall_seconds']:.2f} -> {result['wall_seconds']:.2f} s/trial  "
+              f"({1 - result['wall_seconds'] / full_result['wall_seconds']:.1%} saved)")
+        print(f"  FAR {full_result['far']:.4%} -> {result['far']:.4%}  FRR {full_result['frr']:.2%} -> {result['frr']:.2%}")
+        raise SystemExit
+    if args.command == "fit":
+        engine = ScoreFusion().fit(labels, scores, args.calibration, args.fusion)
+        engine.set_operating_point(labels, scores, args.far)
+        if args.sequential:
+            engine.fit_bands(labels, scores, args.far, early_frr=args.early_frr)
+        engine.save(args.out)
+        print(f"✅ Saved fusion config to {args.out}")
+    else:
+        engine = load_fusion(args.config)
+    report(labels, scores, engine)
+    if args.command == "evaluate" and args.det:
+        fused = engine.fuse(scores)
+        labels = labels.astype(bool)
+        np.savetxt(args.det, np.column_stack(det_curve(fused[labels], fused[~labels])),
+                   delimiter=",", header="far_probit,frr_probit", comments="")
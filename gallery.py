@@ -0,0 +1,385 @@
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+GALLERY_DIR = "./db/gallery"
+FACE_DIM = 512   # ArcFace (buffalo_l) normed_embedding
+VOICE_DIM = 256  # ECAPA_TDNN output
+
+
+class EmbeddingGallery:
+    """Single on-disk store for every enrolled user's face and voice embeddings.
+
+    Embeddings live in two contiguous float32 matrices (``face.f32`` and
+    ``voice.f32``) that are memory-mapped on read, so a verification is a row
+    lookup instead of an ``np.load`` of a per-user file and the whole
+    population can be scanned as one array. Enrollment is append-only: a new
+    row is written for every registration and ``index.csv`` records
+    ``username,row`` (last entry wins, ``-1`` marks a removal). Superseded
+    rows stay on disk until ``compact()`` rewrites the files.
+
+    A user's face row may be a template fused from several capture frames;
+    the per-frame embeddings can be kept alongside as exemplars in
+    ``exemplars.f32``, with ``exemplars.csv`` mapping ``row,start,count``.
+    """
+
+    def __init__(self, root=GALLERY_DIR, face_dim=FACE_DIM, voice_dim=VOICE_DIM):
+        self.root = root
+        self.face_dim = face_dim
+        self.voice_dim = voice_dim
+        self.face_path = os.path.join(root, "face.f32")
+        self.voice_path = os.path.join(root, "voice.f32")
+        self.index_path = os.path.join(root, "index.csv")
+        self.exemplar_path = os.path.join(root, "exemplars.f32")
+        self.exemplar_index_path = os.path.join(root, "exemplars.csv")
+        self.lock_path = os.path.join(root, "gallery.lock")
+        self.version = 0
+        self._signature = None
+        self._lock = threading.RLock()
+        self._lock_held = False  # this instance holds the process lock (guarded by _lock)
+        os.makedirs(root, exist_ok=True)
+        self.reload()
+
+    # Loading
+
+    @staticmethod
+    def _file_rows(path, dim):
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // (dim * 4)
+
+    def _disk_signature(self):
+        signature = []
+        for path in (self.index_path, self.face_path, self.voice_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def refresh(self):
+        """Reload only if another process changed the gallery; returns True if it did"""
+        with self._lock:
+            if self._disk_signature() == self._signature:
+                return False
+            self.reload()
+            return True
+
+    @contextmanager
+    def _process_lock(self, shared=False):
+        # Serializes writers across processes (e.g. several service workers). Readers take
+        # it shared, so a reload never pairs the index with files compact() is still replacing.
+        # Callers hold self._lock; nested use (a reload inside add/compact) is a no-op.
+        if fcntl is None or self._lock_held:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._lock_held = True
+            try:
+                yield
+            finally:
+                self._lock_held = False
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def reload(self):
+        """Re-read the index and remap the matrices from disk"""
+        with self._lock, self._process_lock(shared=True):
+            self._signature = self._disk_signature()
+            # Rows are written before their index line, so a row only counts once
+            # it is complete in both matrices.
+            rows = min(self._file_rows(self.face_path, self.face_dim),
+                       self._file_rows(self.voice_path, self.voice_dim))
+            index = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        username, sep, row = line.rstrip("\n").rpartition(",")
+                        if not sep or not username:
+                            continue
+                        try:
+                            row = int(row)
+                        except ValueError:
+                            continue
+                        if 0 <= row < rows:
+                            index[username] = row
+                        else:
+                            index.pop(username, None)
+            self._rows = rows
+            self._index = index
+            self._exemplar_rows = self._file_rows(self.exemplar_path, self.face_dim)
+            self._exemplars = self._read_exemplar_index()
+            self._invalidate()
+
+    def _read_exemplar_index(self):
+        exemplars = {}
+        if os.path.exists(self.exemplar_index_path):
+            with open(self.exemplar_index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row, start, count = (int(v) for v in line.split(","))
+                    except ValueError:
+                        continue
+                    if 0 <= row < self._rows and start + count <= self._exemplar_rows:
+                        exemplars[row] = (start, count)
+        return exemplars
+
+    def _invalidate(self):
+        # Mapped now, under the process lock, rather than on first access: a map opened
+        # later could see files a compact() in another process swapped in meanwhile.
+        # Replaced files stay readable through maps that are already open.
+        self._face_map = self._map(self.face_path, self._rows, self.face_dim)
+        self._voice_map = self._map(self.voice_path, self._rows, self.voice_dim)
+        self._exemplar_map = self._map(self.exemplar_path, self._exemplar_rows, self.face_dim)
+        self._labels = None
+        self.version += 1
+
+    @staticmethod
+    def _map(path, rows, dim):
+        if rows == 0:
+            return np.empty((0, dim), dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+
+    # Read access
+
+    @property
+    def rows(self):
+        """Number of physical rows, including superseded ones"""
+        return self._rows
+
+    @property
+    def face(self):
+        """Memory-mapped (rows, face_dim) float32 matrix"""
+        with self._lock:
+            if self._face_map is None:
+                self._face_map = self._map(self.face_path, self._rows, self.face_dim)
+            return self._face_map
+
+    @property
+    def voice(self):
+        """Memory-mapped (rows, voice_dim) float32 matrix"""
+        with self._lock:
+            if self._voice_map is None:
+                self._voice_map = self._map(self.voice_path, self._rows, self.voice_dim)
+            return self._voice_map
+
+    def labels(self):
+        """Per-row owner username, or None for superseded/removed rows"""
+        with self._lock:
+            if self._labels is None:
+                labels = np.full(self._rows, None, dtype=object)
+                for username, row in self._index.items():
+                    labels[row] = username
+                self._labels = labels
+            return self._labels
+
+    def usernames(self):
+        with self._lock:
+            return sorted(self._index)
+
+    def row_of(self, username):
+        with self._lock:
+            return self._index.get(username)
+
+    def get(self, username):
+        """Return (face_embedding, voice_embedding) copies for a user, or None"""
+        with self._lock:
+            row = self._index.get(username)
+            if row is None:
+                return None
+            return np.array(self.face[row]), np.array(self.voice[row])
+
+    def get_exemplars(self, username):
+        """Return a (n, face_dim) copy of the user's per-frame face exemplars, or None"""
+        with self._lock:
+            row = self._index.get(username)
+            if row is None or row not in self._exemplars:
+                return None
+            start, count = self._exemplars[row]
+            if self._exemplar_map is None:
+                self._exemplar_map = self._map(self.exemplar_path, self._exemplar_rows, self.face_dim)
+            return np.array(self._exemplar_map[start:start + count])
+
+    def __contains__(self, username):
+        with self._lock:
+            return username in self._index
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    # Writes
+
+    @staticmethod
+    def _write_row(path, dim, row, vector):
+        mode = "r+b" if os.path.exists(path) else "wb"
+        with open(path, mode) as f:
+            f.seek(row * dim * 4)
+            f.write(vector.tobytes())
+            # Drop any torn row left behind by an interrupted write
+            f.truncate()
+
+    def _as_row(self, embedding, dim, kind):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != dim:
+            raise ValueError(f"{kind} embedding must have {dim} values, got {vector.shape[0]}")
+        return vector
+
+    def add(self, username, face_embedding, voice_embedding, face_exemplars=None):
+        """Append an enrollment for username and return its row.
+
+        face_exemplars optionally keeps the per-frame embeddings a fused face
+        template was built from.
+        """
+        if not username or "\n" in username:
+            raise ValueError("Invalid username")
+        face = self._as_row(face_embedding, self.face_dim, "Face")
+        voice = self._as_row(voice_embedding, self.voice_dim, "Voice")
+        if face_exemplars is not None:
+            face_exemplars = np.asarray(face_exemplars, dtype=np.float32).reshape(-1, self.face_dim)
+
+        with self._lock, self._process_lock():
+            self.refresh()
+            row = self._rows
+            has_exemplars = face_exemplars is not None and len(face_exemplars) > 0
+            if has_exemplars:
+                # Exemplar rows are written first and mapped to the user last,
+                # once the index line has committed the enrollment.
+                start = self._exemplar_rows
+                self._write_row(self.exemplar_path, self.face_dim, start, face_exemplars)
+                self._exemplar_rows = start + len(face_exemplars)
+            self._write_row(self.face_path, self.face_dim, row, face)
+            self._write_row(self.voice_path, self.voice_dim, row, voice)
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(f"{username},{row}\n")
+            if has_exemplars:
+                with open(self.exemplar_index_path, "a", encoding="utf-8") as f:
+                    f.write(f"{row},{start},{len(face_exemplars)}\n")
+                self._exemplars[row] = (start, len(face_exemplars))
+            self._rows = row + 1
+            self._index[username] = row
+            self._invalidate()
+            self._signature = self._disk_signature()
+            return row
+
+    def remove(self, username):
+        """Forget a user; the row is reclaimed by the next compact()"""
+        with self._lock, self._process_lock():
+            self.refresh()
+            if username not in self._index:
+                return False
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(f"{username},-1\n")
+            del self._index[username]
+            self._invalidate()
+            self._signature = self._disk_signature()
+            return True
+
+    def compact(self):
+        """Rewrite the matrices keeping only live rows; returns rows reclaimed"""
+        with self._lock, self._process_lock():
+            self.refresh()
+            names = sorted(self._index, key=self._index.get)
+            live = np.array([self._index[n] for n in names], dtype=np.int64)
+            reclaimed = self._rows - len(live)
+            if reclaimed == 0:
+                return 0
+
+            face = np.ascontiguousarray(self.face[live]) if len(live) else np.empty((0, self.face_dim), np.float32)
+            voice = np.ascontiguousarray(self.voice[live]) if len(live) else np.empty((0, self.voice_dim), np.float32)
+            exemplar_blocks, exemplar_lines, start = [], [], 0
+            for row, old_row in enumerate(live):
+                if int(old_row) in self._exemplars:
+                    block = self.get_exemplars(names[row])
+                    exemplar_blocks.append(block)
+                    exemplar_lines.append(f"{row},{start},{len(block)}\n")
+                    start += len(block)
+            exemplars = np.concatenate(exemplar_blocks) if exemplar_blocks else np.empty((0, self.face_dim), np.float32)
+            # Release the maps so the files can be replaced (required on Windows)
+            self._face_map = None
+            self._voice_map = None
+            self._exemplar_map = None
+
+            for path, matrix in ((self.face_path, face), (self.voice_path, voice), (self.exemplar_path, exemplars)):
+                with open(path + ".tmp", "wb") as f:
+                    f.write(matrix.tobytes())
+            with open(self.exemplar_index_path + ".tmp", "w", encoding="utf-8") as f:
+                f.writelines(exemplar_lines)
+            with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+                for row, username in enumerate(names):
+                    f.write(f"{username},{row}\n")
+
+            os.replace(self.exemplar_path + ".tmp", self.exemplar_path)
+            os.replace(self.exemplar_index_path + ".tmp", self.exemplar_index_path)
+            os.replace(self.face_path + ".tmp", self.face_path)
+            os.replace(self.voice_path + ".tmp", self.voice_path)
+            os.replace(self.index_path + ".tmp", self.index_path)
+            self.reload()
+            return reclaimed
+
+
+def migrate_legacy_db(db_dir="./db", gallery=None, remove_legacy=False):
+    """Import ./db/<user>/face_embedding.npy + voice_embedding.npy into the gallery"""
+    if gallery is None:
+        gallery = EmbeddingGallery()
+    gallery_root = os.path.abspath(gallery.root)
+    migrated = []
+
+    for username in sorted(os.listdir(db_dir)):
+        user_dir = os.path.join(db_dir, username)
+        if not os.path.isdir(user_dir) or os.path.abspath(user_dir) == gallery_root:
+            continue
+
+        face_file = os.path.join(user_dir, "face_embedding.npy")
+        voice_file = os.path.join(user_dir, "voice_embedding.npy")
+        if not (os.path.exists(face_file) and os.path.exists(voice_file)):
+            print(f"⚠️ Skipping {username}: no stored embeddings")
+            continue
+        if username in gallery:
+            print(f"⚠️ Skipping {username}: already in gallery")
+            continue
+
+        try:
+            gallery.add(username, np.load(face_file), np.load(voice_file))
+        except Exception as e:
+            print(f"❌ ERROR migrating {username}: {str(e)}")
+            continue
+
+        if remove_legacy:
+            os.remove(face_file)
+            os.remove(voice_file)
+        migrated.append(username)
+
+    print(f"✅ Migrated {len(migrated)} user(s) into {gallery.root}")
+    return migrated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the enrolled embedding gallery")
+    parser.add_argument("--gallery", default=GALLERY_DIR, help="Gallery directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="Import legacy ./db/<user>/*.npy files")
+    migrate_parser.add_argument("--db", default="./db", help="Legacy database directory")
+    migrate_parser.add_argument("--remove-legacy", action="store_true",
+                                help="Delete the per-user .npy files after import")
+    commands.add_parser("compact", help="Reclaim superseded rows")
+    commands.add_parser("info", help="Show gallery statistics")
+
+    args = parser.parse_args()
+    store = EmbeddingGallery(args.gallery)
+    if args.command == "migrate":
+        migrate_legacy_db(args.db, store, remove_legacy=args.remove_legacy)
+    elif args.command == "compact":
+        print(f"✅ Reclaimed {store.compact()} row(s)")
+    else:
+        print(f"Users: {len(store)}  Rows: {store.rows}  Path: {store.root}")
@@ -0,0 +1,207 @@
+import os
+import time
+import tempfile
+import threading
+import numpy as np
+
+import fusion
+import gallery as gallery_store
+
+CHUNK_ROWS = 65536  # rows scored per matmul; bounds temporaries to ~CHUNK_ROWS floats
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def score_matrix(matrix, probe, inv_norms=None, chunk_rows=CHUNK_ROWS, out=None):
+    """Cosine-style scores of one probe against every row, one chunked matmul at a time"""
+    rows = matrix.shape[0]
+    if out is None:
+        out = np.empty(rows, dtype=np.float32)
+    for start in range(0, rows, chunk_rows):
+        end = min(start + chunk_rows, rows)
+        np.dot(matrix[start:end], probe, out=out[start:end])
+    if inv_norms is not None:
+        out *= inv_norms
+    return out
+
+
+def top_k(scores, labels, k, live=None):
+    """Best k (username, score) pairs, skipping rows without a live owner"""
+    if live is None:
+        live = labels != None  # noqa: E711 (elementwise)
+    scores = np.where(live, scores, -np.inf)
+    k = min(k, int(np.count_nonzero(np.isfinite(scores))))
+    if k <= 0:
+        return []
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(labels[i], float(scores[i])) for i in best]
+
+
+class Identifier:
+    """1:N identification over every user enrolled in an EmbeddingGallery.
+
+    Each probe is scored against the whole population with one matrix
+    product per modality instead of one compare_faces/compare_voices call
+    per user. Face rows are ArcFace normed_embedding vectors so a dot
+    product is the cosine; voice rows are not normalized, so their inverse
+    norms are cached per gallery version. Scores are clamped to [0, 1] like
+    the 1:1 comparisons and fused with the same fusion.ScoreFusion that
+    verification uses, so the fused score is comparable to its threshold.
+    """
+
+    def __init__(self, gallery=None, chunk_rows=CHUNK_ROWS, face_index=None, score_fusion=None):
+        self.gallery = gallery if gallery is not None else gallery_store.EmbeddingGallery()
+        self.score_fusion = score_fusion if score_fusion is not None else fusion.ScoreFusion()
+        self.chunk_rows = chunk_rows
+        # Optional ann_index.GalleryFaceIndex for galleries too large to scan densely
+        self.face_index = face_index
+        self._voice_inv_norms = None
+        self._voice_version = None
+        self._live = None
+        self._live_version = None
+        self._lock = threading.Lock()
+
+    def _voice_norms(self):
+        with self._lock:
+            if self._voice_version != self.gallery.version:
+                voice = self.gallery.voice
+                norms = np.empty(voice.shape[0], dtype=np.float32)
+                for start in range(0, voice.shape[0], self.chunk_rows):
+                    chunk = voice[start:start + self.chunk_rows]
+                    norms[start:start + len(chunk)] = np.linalg.norm(chunk, axis=1)
+                with np.errstate(divide="ignore"):
+                    self._voice_inv_norms = np.where(norms > 0, 1.0 / norms, 0.0).astype(np.float32)
+                self._voice_version = self.gallery.version
+            return self._voice_inv_norms
+
+    def _live_rows(self):
+        with self._lock:
+            if self._live_version != self.gallery.version:
+                self._live = self.gallery.labels() != None  # noqa: E711 (elementwise)
+                self._live_version = self.gallery.version
+            return self._live
+
+    def face_scores(self, face_embedding):
+        """Similarity of a probe face embedding to every gallery row"""
+        scores = score_matrix(self.gallery.face, _unit(face_embedding), chunk_rows=self.chunk_rows)
+        return np.clip(scores, 0.0, 1.0, out=scores)
+
+    def voice_scores(self, voice_embedding):
+        """Similarity of a probe voice embedding to every gallery row"""
+        scores = score_matrix(self.gallery.voice, _unit(voice_embedding),
+                              inv_norms=self._voice_norms(), chunk_rows=self.chunk_rows)
+        return np.clip(scores, 0.0, 1.0, out=scores)
+
+    def _fuse(self, face, voice):
+        return np.asarray(self.score_fusion.fuse({"face": face, "voice": voice}), dtype=np.float32)
+
+    def identify(self, face_embedding=None, voice_embedding=None, k=5):
+        """Return the top-k (username, score) matches for a face and/or voice probe.
+
+        When both modalities are given the score is score_fusion.fuse of the
+        two; a single modality keeps its raw similarity.
+        """
+        if face_embedding is None and voice_embedding is None:
+            raise ValueError("Need a face or voice embedding to identify")
+        if self.face_index is not None and face_embedding is not None:
+            return self._identify_indexed(face_embedding, voice_embedding, k)
+
+        scores = None
+        if face_embedding is not None:
+            scores = self.face_scores(face_embedding)
+        if voice_embedding is not None:
+            voice = self.voice_scores(voice_embedding)
+            scores = voice if scores is None else self._fuse(scores, voice)
+        return top_k(scores, self.gallery.labels(), k, live=self._live_rows())
+
+
+    def _identify_indexed(self, face_embedding, voice_embedding, k, candidates=100):
+        """Shortlist with the face ANN index, then fuse voice only over the shortlist"""
+        shortlist = max(k, candidates)
+        # Rerank against the exact gallery rows so scores match the dense path
+        rows, face = self.face_index.search(face_embedding, k=shortlist, rerank=shortlist)
+        if len(rows) == 0:
+            return []
+        scores = np.clip(face, 0.0, 1.0)
+        if voice_embedding is not None:
+            voice = (self.gallery.voice[rows] @ _unit(voice_embedding)) * self._voice_norms()[rows]
+            scores = self._fuse(scores, np.clip(voice, 0.0, 1.0))
+        best = np.argsort(-scores)[:k]
+        labels = self.gallery.labels()
+        return [(labels[rows[i]], float(scores[i])) for i in best]
+
+
+def benchmark(num_users=100000, loop_users=2000, repeats=20, chunk_rows=CHUNK_ROWS, seed=0):
+    """Compare batched identification against the per-file np.load loop on synthetic users"""
+    rng = np.random.default_rng(seed)
+
+    def random_unit(n, dim):
+        x = rng.standard_normal((n, dim), dtype=np.float32)
+        return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = gallery_store.EmbeddingGallery(os.path.join(tmp, "gallery"))
+        face = random_unit(num_users, store.face_dim)
+        voice = rng.standard_normal((num_users, store.voice_dim), dtype=np.float32)
+        # Bulk-write the matrices directly; add() per row would dominate setup time
+        face.tofile(store.face_path)
+        voice.tofile(store.voice_path)
+        with open(store.index_path, "w", encoding="utf-8") as f:
+            f.writelines(f"user{i},{i}\n" for i in range(num_users))
+        store.reload()
+
+        identifier = Identifier(store, chunk_rows=chunk_rows)
+        probe_face = face[num_users // 2] + 0.05 * random_unit(1, store.face_dim)[0]
+        probe_voice = voice[num_users // 2]
+        identifier.identify(probe_face, probe_voice)  # page in the maps, cache voice norms
+
+        timings = {}
+        for name, kwargs in (("face", {"face_embedding": probe_face}),
+                             ("voice", {"voice_embedding": probe_voice}),
+                             ("fused", {"face_embedding": probe_face, "voice_embedding": probe_voice})):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                result = identifier.identify(k=5, **kwargs)
+            timings[name] = (time.perf_counter() - start) / repeats
+            assert result[0][0] == f"user{num_users // 2}"
+
+        # Legacy layout: one directory and np.load per user, as compare_faces does
+        loop_users = min(loop_users, num_users)
+        legacy_dir = os.path.join(tmp, "legacy")
+        for i in range(loop_users):
+            user_dir = os.path.join(legacy_dir, f"user{i}")
+            os.makedirs(user_dir)
+            np.save(os.path.join(user_dir, "face_embedding.npy"), face[i])
+        start = time.perf_counter()
+        best = (None, -1.0)
+        for username in os.listdir(legacy_dir):
+            stored = np.load(os.path.join(legacy_dir, username, "face_embedding.npy"))
+            score = min(max(float(np.dot(stored, probe_face)), 0.0), 1.0)
+            if score > best[1]:
+                best = (username, score)
+        loop_per_user = (time.perf_counter() - start) / loop_users
+
+    print(f"Identification over {num_users} users (chunk={chunk_rows}, {repeats} runs)")
+    for name, seconds in timings.items():
+        print(f"  batched {name:<5}: {seconds * 1000:8.2f} ms/probe")
+    print(f"  per-file loop: {loop_per_user * 1e6:8.2f} us/user measured on {loop_users} users "
+          f"-> ~{loop_per_user * num_users * 1000:.0f} ms/probe extrapolated "
+          f"({loop_per_user * num_users / timings['face']:.0f}x slower than batched face)")
+    return timings, loop_per_user
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark 1:N identification")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--loop-users", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    benchmark(args.users, args.loop_users, args.repeats, args.chunk)
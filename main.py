@@ -3,13 +3,21 @@ from tkinter import messagebox, ttk
 import cv2
 import os
 import util
+import gallery
+import ann_index
+import capture
+import fusion
+import voice_stream
+import tracing
+import soundfile as sf
 import numpy as np
 from PIL import Image, ImageTk
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 class BiometricApp:
-    def __init__(self, root):
+    def __init__(self, root, profile_every=0):
         self.root = root
         self.root.title("Biometric Authentication System")
         self.root.geometry("800x600")
@@ -33,8 +41,34 @@ class BiometricApp:
         self.camera_thread = None
         self.stop_camera = False
         
+        # Enrolled embeddings (memory-mapped, shared by register and verify)
+        self.gallery = gallery.EmbeddingGallery()
+        # Face ANN index, kept current on registration once `ann_index.py build` has created it
+        self.face_index = ann_index.load_face_index(self.gallery)
+        
+        # Face and voice inference run here, concurrently, off the Tk thread
+        self.inference_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="inference")
+        self.inference_busy = False
+        
+        # Calibrated face/voice score fusion (./db/fusion.json, else the plain 50/50 mean at 0.7)
+        self.score_fusion = fusion.load_fusion()
+        
+        # Best capture frames fused into one face template (1 = single best frame)
+        self.face_frames = 3
+        # The preview runs the face detector every Nth frame and tracks the face in between
+        self.preview_detect_every = 5
+        # Preview frame rate cap; the camera still runs at full rate for capture
+        self.preview_fps = 15
+        
+        # With tracing on (--profile N or TRACE=1), print the per-stage table every N verifications
+        self.profile_every = profile_every
+        self.verifications = 0
+        
         self.setup_ui()
         
+        # Load the face/voice models in the background once the window is up
+        self.root.after(200, util.warm_up_models)
+        
     def setup_ui(self):
         # Create main frame
         main_frame = tk.Frame(self.root, bg=self.bg_color)
@@ -390,15 +424,17 @@ class BiometricApp:
             countdown_start = time.time()
             show_countdown = True
             frames_captured = 0
-            best_frame = None
+            # Candidate frames go into a preallocated ring buffer; the best face wins
+            selector = capture.FrameSelector(capacity=5)
+            tracker = capture.FaceTracker(detect_every=self.preview_detect_every)
             
             while not self.stop_camera:
                 ret, frame = cap.read()
                 if not ret:
                     break
                     
-                # Convert frame to RGB for tkinter
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                # Face box: detected every few frames, tracked in between
+                face = tracker.update(frame)
                 
                 # Add countdown if needed
                 current_time = time.time()
@@ -410,59 +446,83 @@ class BiometricApp:
                         show_countdown = False
                         frames_captured = 0
                 
-                # Display countdown or frame number
-                if show_countdown:
-                    cv2.putText(rgb_frame, str(countdown), (int(frame.shape[1]/2)-50, int(frame.shape[0]/2)), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 4)
-                elif frames_captured < 5:
+                capturing = not show_countdown and frames_captured < 5
+                if capturing:
                     frames_captured += 1
-                    best_frame = frame.copy()  # Save the current frame
-                    cv2.putText(rgb_frame, f"Capturing... {frames_captured}/5", (20, 50), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    
-                    # Draw green border when capturing
-                    rgb_frame = cv2.rectangle(rgb_frame, (0, 0), (rgb_frame.shape[1]-1, rgb_frame.shape[0]-1), 
-                                             (0, 255, 0), 5)
+                    selector.add(frame, face)
                     
                     if frames_captured >= 5:
+                        selected = selector.select_top(self.face_frames)
+                        status_text = self.reg_status_text if action_type == "register" else self.verify_status_text
+                        best_frame, quality = (selected[0][0], selected[0][1]) if selected else (None, 0.0)
+                        # Aligned here from the tracked landmarks, so recognition needs no detection pass
+                        crops = [(util.align_face(f, kps), q) for f, q, _, kps in selected]
+                        if best_frame is None:
+                            status_text.set("❌ No face detected! Try again.")
                         # Save the captured frame
-                        if action_type == "register":
+                        elif action_type == "register":
                             username = self.register_username_entry.get().strip()
                             user_dir = f"./db/{username}"
                             os.makedirs(user_dir, exist_ok=True)
                             face_path = os.path.join(user_dir, "face.jpg")
                             cv2.imwrite(face_path, best_frame)
                             self.reg_face_path = face_path
-                            self.reg_status_text.set("✅ Face captured successfully!")
+                            # Embed the raw frames, not the re-encoded JPEG
+                            self.reg_face_crops = crops
+                            self.reg_status_text.set(f"✅ Face captured successfully! (quality {quality:.2f})")
                         else:  # verify
-                            face_path = "./temp_face.jpg"
-                            cv2.imwrite(face_path, best_frame)
-                            self.verify_face_path = face_path
-                            self.verify_status_text.set("✅ Face captured successfully!")
+                            # Kept in memory: no temp file, no lossy JPEG round trip
+                            self.verify_face_crops = crops
+                            self.verify_status_text.set(f"✅ Face captured successfully! (quality {quality:.2f})")
                         
                         # Stop camera after capturing
                         self.stop_camera = True
                         break
                 
-                # Resize for display
-                pil_img = Image.fromarray(rgb_frame)
-                pil_img = pil_img.resize((300, 300), Image.LANCZOS)
-                imgtk = ImageTk.PhotoImage(image=pil_img)
-                
-                # Update the label
-                target_label.imgtk = imgtk
-                target_label.configure(image=imgtk)
-                
-                self.root.update()
+                # Preview frames are rate-limited; overlays are drawn only on the ones shown.
+                # The frame was already buffered/tracked, so drawing on it in place is safe.
+                if not renderer.due():
+                    continue
+                if face is not None:
+                    capture.draw_face_box(frame, face[0])
+                if show_countdown:
+                    cv2.putText(frame, str(countdown), (int(frame.shape[1]/2)-50, int(frame.shape[0]/2)), 
+                                cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 4)
+                elif capturing:
+                    cv2.putText(frame, f"Capturing... {frames_captured}/5", (20, 50), 
+                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                    
+                    # Draw green border when capturing
+                    cv2.rectangle(frame, (0, 0), (frame.shape[1]-1, frame.shape[0]-1), (0, 255, 0), 5)
+                renderer.submit(frame)
                 
             cap.release()
             self.is_camera_active = False
         
+        # The Tk loop, not the camera thread, puts preview frames on screen
+        renderer = capture.PreviewRenderer(size=(300, 300), max_fps=self.preview_fps)
+        self.refresh_preview(target_label, renderer)
+        
         # Start the camera in a separate thread
         self.camera_thread = threading.Thread(target=camera_stream)
         self.camera_thread.daemon = True
         self.camera_thread.start()
     
+    def refresh_preview(self, target_label, renderer, photo=None):
+        """Show the renderer's newest frame, from the Tk loop, while the camera runs.
+        
+        One PhotoImage is reused and pasted into rather than rebuilt per frame.
+        """
+        frame = renderer.take()
+        if frame is not None:
+            if photo is None:
+                photo = ImageTk.PhotoImage("RGB", renderer.size)
+                target_label.imgtk = photo
+                target_label.configure(image=photo)
+            photo.paste(Image.fromarray(frame))
+        if self.is_camera_active:
+            self.root.after(max(1, 500 // renderer.max_fps), self.refresh_preview, target_label, renderer, photo)
+    
     def start_face_capture_reg(self):
         username = self.register_username_entry.get().strip()
         if not username:
@@ -526,7 +586,7 @@ class BiometricApp:
               bg=self.bg_color).pack(pady=10)
         
         timer_var = tk.StringVar()
-        timer_var.set("5")
+        timer_var.set("")
         timer_label = tk.Label(dialog, 
                             textvariable=timer_var, 
                             font=("Helvetica", 24), 
@@ -535,24 +595,27 @@ class BiometricApp:
         timer_label.pack(pady=10)
         
         # Start recording process
-        def start_recording():
-            for i in range(5, 0, -1):
-                timer_var.set(str(i))
-                dialog.update()
-                time.sleep(1)
-                
-            timer_var.set("Recording...")
-            dialog.update()
+        # Runs on the recording thread, so every widget update goes through
+        # root.after and happens on the Tk thread
+        def show_progress(seconds, score):
+            self.root.after(0, timer_var.set, f"Recording... {seconds:.1f}s")
             
-            # Record audio
-            util.record_audio(voice_path, phrase)
+        def start_recording():
+            # Streams straight from the microphone; the embedding is computed
+            # while the phrase is spoken
+            self.root.after(0, timer_var.set, "Recording...")
+            audio, embedding = voice_stream.record_voice_stream(on_update=show_progress)
+            if embedding is not None:
+                sf.write(voice_path, audio, util.VOICE_SAMPLE_RATE)
+                self.reg_voice = (username, embedding)
             
-            timer_var.set("Done!")
-            dialog.update()
-            time.sleep(1)
-            dialog.destroy()
+            self.root.after(0, timer_var.set, "Done!" if embedding is not None else "Not enough speech")
+            self.root.after(500, dialog.destroy)
             
-            self.reg_status_text.set("✅ Voice recorded successfully!")
+            if embedding is not None:
+                self.root.after(0, self.reg_status_text.set, "✅ Voice recorded successfully!")
+            else:
+                self.root.after(0, self.reg_status_text.set, "❌ Voice recording failed! Try again.")
             
         threading.Thread(target=start_recording, daemon=True).start()
         
@@ -562,12 +625,11 @@ class BiometricApp:
             self.show_error("Username cannot be empty!")
             return
             
-        user_dir = f"./db/{username}"
-        if not os.path.exists(user_dir):
+        stored_embeddings = self.gallery.get(username)
+        if stored_embeddings is None:
             self.show_error("User not found! Register first.")
             return
             
-        voice_path = "./temp_voice.wav"
         phrase = "Hello, this is a test phrase."
         
         # Create custom dialog for voice recording
@@ -602,7 +664,7 @@ class BiometricApp:
               bg=self.bg_color).pack(pady=10)
         
         timer_var = tk.StringVar()
-        timer_var.set("5")
+        timer_var.set("")
         timer_label = tk.Label(dialog, 
                             textvariable=timer_var, 
                             font=("Helvetica", 24), 
@@ -611,25 +673,24 @@ class BiometricApp:
         timer_label.pack(pady=10)
         
         # Start recording process
-        def start_recording():
-            for i in range(5, 0, -1):
-                timer_var.set(str(i))
-                dialog.update()
-                time.sleep(1)
-                
-            timer_var.set("Recording...")
-            dialog.update()
+        # Runs on the recording thread, so every widget update goes through
+        # root.after and happens on the Tk thread
+        def show_progress(seconds, score):
+            self.root.after(0, timer_var.set, f"{seconds:.1f}s  score {score:.2f}")
             
-            # Record audio
-            util.record_audio(voice_path, phrase)
-            self.verify_voice_path = voice_path
+        def start_recording():
+            # Scored against the claimed user while recording; stops as soon as
+            # the voice score alone decides the fused outcome of score_fusion
+            self.root.after(0, timer_var.set, "Recording...")
+            result = voice_stream.verify_voice_stream(stored_embeddings[1], on_update=show_progress,
+                                                      band=self.score_fusion.decisive_band("voice"))
+            self.verify_voice_audio = result["audio"]
+            self.verify_voice = (username, result["score"])
             
-            timer_var.set("Done!")
-            dialog.update()
-            time.sleep(1)
-            dialog.destroy()
+            self.root.after(0, timer_var.set, f"Done! ({result['seconds']:.1f}s)")
+            self.root.after(500, dialog.destroy)
             
-            self.verify_status_text.set("✅ Voice recorded successfully!")
+            self.root.after(0, self.verify_status_text.set, "✅ Voice recorded successfully!")
             
         threading.Thread(target=start_recording, daemon=True).start()
     
@@ -642,11 +703,10 @@ class BiometricApp:
         user_dir = f"./db/{username}"
         os.makedirs(user_dir, exist_ok=True)
         
-        face_path = os.path.join(user_dir, "face.jpg")
         voice_path = os.path.join(user_dir, "voice.wav")
         
         # Check if face is captured
-        if not hasattr(self, 'reg_face_path') or not os.path.exists(self.reg_face_path):
+        if not getattr(self, 'reg_face_crops', None):
             self.show_error("You need to capture your face first!")
             return
             
@@ -654,20 +714,45 @@ class BiometricApp:
         if not os.path.exists(voice_path):
             self.show_error("You need to record your voice first!")
             return
+        
+        # The streamed recording already carries its embedding
+        reg_voice = getattr(self, 'reg_voice', None)
+        if reg_voice is not None and reg_voice[0] == username:
+            voice_task = (lambda: reg_voice[1],)
+        else:
+            voice_task = (util.extract_voice_features, voice_path)
             
-        # Extract & Save Face Embeddings
-        self.update_status("Processing face data...")
-        face_embedding = util.extract_face_features(face_path)
+        # Extract face and voice embeddings concurrently; the selected face
+        # crops share one recognition call and are fused into a template
+        crops, qualities = zip(*self.reg_face_crops)
+        self.update_status("Processing face and voice data...")
+        self.reg_status_text.set("Processing...")
+        self.run_inference({
+            "face": (util.extract_face_template, crops, None, qualities, True),
+            "voice": voice_task,
+        }, lambda results: self.finish_registration(username, results))
+    
+    def finish_registration(self, username, results):
+        face_embedding, face_exemplars = results["face"] or (None, None)
+        voice_embedding = results["voice"]
         if face_embedding is None:
+            self.reg_status_text.set("Registration failed")
             self.show_error("Face not detected properly! Try again.")
             return
+        # An all-zero embedding means the recording held too little speech
+        if voice_embedding is None or not np.any(voice_embedding):
+            self.reg_status_text.set("Registration failed")
+            self.show_error("Voice could not be processed! Try again.")
+            return
             
-        np.save(os.path.join(user_dir, "face_embedding.npy"), face_embedding)
-        
-        # Extract & Save Voice Embeddings
-        self.update_status("Processing voice data...")
-        voice_embedding = util.extract_voice_features(voice_path)
-        np.save(os.path.join(user_dir, "voice_embedding.npy"), voice_embedding)
+        # Save both embeddings to the gallery, keeping per-frame exemplars
+        # when the template was fused from several frames
+        if len(face_exemplars) < 2:
+            face_exemplars = None
+        self.gallery.add(username, face_embedding, voice_embedding, face_exemplars)
+        if self.face_index is not None:
+            self.face_index.sync()
+            self.face_index.save()
         
         # Success animation
         self.show_success_animation()
@@ -683,51 +768,133 @@ class BiometricApp:
             self.show_error("Username cannot be empty!")
             return
             
-        user_dir = f"./db/{username}"
-        if not os.path.exists(user_dir):
+        stored_embeddings = self.gallery.get(username)
+        if stored_embeddings is None:
             self.show_error("User not found! Register first.")
             return
             
-        # Check if face is captured
-        if not hasattr(self, 'verify_face_path') or not os.path.exists(self.verify_face_path):
-            self.show_error("You need to capture your face first!")
+        stored_face_embedding, stored_voice_embedding = stored_embeddings
+        tasks = {}
+        if getattr(self, 'verify_face_crops', None):
+            crops, qualities = zip(*self.verify_face_crops)
+            tasks["face"] = (util.compare_face_frames, crops, stored_face_embedding, None, qualities,
+                             self.gallery.get_exemplars(username), True)
+        if getattr(self, 'verify_voice_audio', None) is not None:
+            # The streamed recording was already scored against this user
+            verify_voice = getattr(self, 'verify_voice', None)
+            if verify_voice is not None and verify_voice[0] == username:
+                tasks["voice"] = (lambda: verify_voice[1],)
+            else:
+                tasks["voice"] = (util.compare_voices, stored_voice_embedding, self.verify_voice_audio)
+        if not tasks:
+            self.show_error("You need to capture your face or record your voice first!")
             return
             
-        # Check if voice is recorded
-        if not hasattr(self, 'verify_voice_path') or not os.path.exists(self.verify_voice_path):
-            self.show_error("You need to record your voice first!")
+        self.update_status("Analyzing...")
+        self.verify_status_text.set("Verifying...")
+        self.verify_next(username, tasks, {})
+    
+    def verify_next(self, username, tasks, scores):
+        """Score the next modality in the fusion order until the policy decides.
+        
+        With early-exit bands (fusion.ScoreFusion.bands) modalities are scored
+        one at a time and a decisive score skips the rest, so the second one
+        is only asked for when needed; without bands all are scored concurrently.
+        """
+        result = self.score_fusion.outcome(scores)
+        if result is not None:
+            self.finish_verification(username, scores, result)
+            return
+        pending = [m for m in self.score_fusion.order if m not in scores]
+        batch = pending[:1] if self.score_fusion.bands else pending
+        missing = [m for m in batch if m not in tasks]
+        if missing:
+            request = "capture your face" if missing[0] == "face" else "record your voice"
+            if scores:
+                self.verify_status_text.set(f"Inconclusive: please {request} too")
+                self.show_error(f"{' and '.join(m.capitalize() for m in scores)} score was not decisive. "
+                                f"Please {request} to finish verification.")
+            else:
+                self.show_error(f"You need to {request} first!")
             return
             
-        stored_face_embedding_path = os.path.join(user_dir, "face_embedding.npy")
-        stored_voice_embedding_path = os.path.join(user_dir, "voice_embedding.npy")
-        
-        # Compare Faces
-        self.update_status("Analyzing face...")
-        face_score = util.compare_faces(self.verify_face_path, stored_face_embedding_path)
-        
-        # Compare Voices
-        self.update_status("Analyzing voice...")
-        voice_score = util.compare_voices(stored_voice_embedding_path, self.verify_voice_path)
-        
-        # Update progress bars
-        self.face_progress["value"] = int(face_score * 100)
-        self.voice_progress["value"] = int(voice_score * 100)
-        
-        # Update score labels
-        self.face_score_var.set(f"Face: {face_score:.2f}")
-        self.voice_score_var.set(f"Voice: {voice_score:.2f}")
-        
-        total_score = (face_score + voice_score) / 2
-        self.update_status(f"Face Score: {face_score:.2f}, Voice Score: {voice_score:.2f}, Total: {total_score:.2f}")
+        # Bars pulse until each modality finishes
+        for name in batch:
+            progress = self.face_progress if name == "face" else self.voice_progress
+            progress.configure(mode="indeterminate")
+            progress.start(10)
+        self.run_inference({name: tasks[name] for name in batch},
+                           lambda results: self.verify_next(username, tasks, dict(scores, **{
+                               name: score or 0.0 for name, score in results.items()})),
+                           on_task_done=self.show_partial_score)
+    
+    def show_partial_score(self, name, score):
+        progress = self.face_progress if name == "face" else self.voice_progress
+        score_var = self.face_score_var if name == "face" else self.voice_score_var
+        score = score or 0.0
+        
+        # Update progress bar and score label as soon as this modality is done
+        progress.stop()
+        progress.configure(mode="determinate")
+        progress["value"] = int(score * 100)
+        score_var.set(f"{name.capitalize()}: {score:.2f}")
+    
+    def finish_verification(self, username, scores, result):
+        total_score, verified, early = result
+        scored = ", ".join(f"{name.capitalize()} Score: {score:.2f}" for name, score in scores.items())
+        if early:
+            skipped = ", ".join(m for m in self.score_fusion.order if m not in scores)
+            self.update_status(f"{scored} (decisive; skipped {skipped})")
+        else:
+            self.update_status(f"{scored}, Total: {total_score:.2f}")
         
         # Verify result
-        if total_score >= 0.7:
+        if verified:
             self.show_success(f"✅ Verified as {username}!")
             self.verify_status_text.set("Authentication Successful")
             self.show_success_animation()
         else:
             self.show_error("❌ Verification failed! Try again.")
             self.verify_status_text.set("Authentication Failed")
+        
+        self.verifications += 1
+        if tracing.ENABLED and self.profile_every and self.verifications % self.profile_every == 0:
+            tracing.print_report(f"After {self.verifications} verifications,")
+    
+    def run_inference(self, tasks, on_done, on_task_done=None):
+        """Run named (function, *args) tasks on the inference pool.
+        
+        Results are collected by polling from the Tk loop with root.after, so
+        on_task_done(name, result) and on_done(results) always run on the Tk
+        thread and may touch widgets. Total time is the slowest task, not the sum.
+        """
+        if self.inference_busy:
+            self.update_status("Still processing, please wait...")
+            return
+        self.inference_busy = True
+        
+        futures = {name: self.inference_pool.submit(fn, *args) for name, (fn, *args) in tasks.items()}
+        results = {}
+        
+        def poll():
+            for name, future in futures.items():
+                if name in results or not future.done():
+                    continue
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"❌ ERROR during {name} processing: {str(e)}")
+                    results[name] = None
+                if on_task_done:
+                    on_task_done(name, results[name])
+                    
+            if len(results) < len(futures):
+                self.root.after(50, poll)
+                return
+            self.inference_busy = False
+            on_done(results)
+            
+        self.root.after(50, poll)
     
     def show_error(self, message):
         messagebox.showerror("Error", message)
@@ -765,13 +932,28 @@ class BiometricApp:
         overlay.after(1500, close_overlay)
 
 
+def run_app(profile=None):
+    """Run the GUI; profile=N traces pipeline stages and prints them every N verifications and at exit"""
+    if profile:
+        tracing.enable()
+    root = tk.Tk()
+    app = BiometricApp(root, profile_every=profile or 0)
+    root.mainloop()
+    if tracing.ENABLED:
+        tracing.print_report("Session")
+
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Biometric authentication app")
+    parser.add_argument("--profile", type=int, metavar="N",
+                        help="Trace pipeline stages; print a per-stage breakdown every N verifications and at exit")
+    args = parser.parse_args()
+    
     # Create db directory if it doesn't exist
     os.makedirs("./db", exist_ok=True)
     
     # Create assets directory if it doesn't exist
     os.makedirs("./assets", exist_ok=True)
     
-    root = tk.Tk()
-    app = BiometricApp(root)
-    root.mainloop()
\ No newline at end of file
+    run_app(args.profile)
\ No newline at end of file
@@ -12,23 +12,41 @@ class ECAPA_TDNN(nn.Module):
         # Add ReLU activations for better feature extraction
         self.relu = nn.ReLU()
 
-    def forward(self, x):
+    def forward(self, x, lengths=None, frame_mask=None):
         # Handle different input dimensions
         if x.dim() == 3:  # batch x channels x time
             pass
         elif x.dim() == 2:  # channels x time
             x = x.unsqueeze(0)
         
+        # For zero-padded batches, lengths holds each item's valid frame count
+        mask = None
+        if lengths is not None:
+            mask = torch.arange(x.shape[-1], device=x.device)[None, :] < lengths[:, None]
+            mask = mask.unsqueeze(1).to(x.dtype)
+        
+        # frame_mask (batch x time) marks the frames to average, e.g. speech from a VAD
+        pool_mask = mask
+        if frame_mask is not None:
+            frame_mask = frame_mask.unsqueeze(1).to(x.dtype)
+            pool_mask = frame_mask if mask is None else mask * frame_mask
+        
         # Apply first convolutional layer
         x = self.layer1(x)
         x = self.relu(x)
+        if mask is not None:
+            # Zero padded frames so layer2 sees the same edge padding as an unbatched input
+            x = x * mask
         
         # Apply second convolutional layer
         x = self.layer2(x)
         x = self.relu(x)
         
-        # Global pooling
-        x = self.global_pool(x).squeeze(-1)
+        # Global pooling (masked mean over valid/speech frames when masked)
+        if pool_mask is None:
+            x = self.global_pool(x).squeeze(-1)
+        else:
+            x = (x * pool_mask).sum(dim=-1) / pool_mask.sum(dim=-1).clamp(min=1)
         
         # Final linear layer
         return self.fc(x)
\ No newline at end of file
@@ -2,7 +2,6 @@ import os
 import sys
 import shutil
 import subprocess
-import tkinter as tk
 from tkinter import messagebox
 import importlib.util
 
@@ -38,18 +37,23 @@ def create_directories():
         os.makedirs(directory, exist_ok=True)
         print(f"Directory {directory} created or already exists.")
 
-def run_application():
+def run_application(profile=None):
     """Run the main application"""
     try:
         import main
-        root = tk.Tk()
-        app = main.BiometricApp(root)
-        root.mainloop()
+        main.run_app(profile)
     except Exception as e:
         messagebox.showerror("Error", f"An error occurred while starting the application: {str(e)}")
         print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Set up and start the biometric authentication app")
+    parser.add_argument("--profile", type=int, metavar="N",
+                        help="Trace pipeline stages; print a per-stage breakdown every N verifications and at exit")
+    args = parser.parse_args()
+
     print("Welcome to Biometric Authentication System")
     print("Setting up...")
     
@@ -60,6 +64,6 @@ if __name__ == "__main__":
         
         # Run the application
         print("Starting application...")
-        run_application()
+        run_application(args.profile)
     else:
         print("Failed to set up the application dependencies. Please check your installation.")
\ No newline at end of file
@@ -0,0 +1,386 @@
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import sys
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+import soundfile as sf
+
+import util
+import fusion
+import tracing
+import gallery as gallery_store
+import ann_index
+from identify import Identifier
+
+MAX_BODY_BYTES = 32 << 20  # largest accepted request body
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_multipart(body, content_type):
+    """Split a multipart/form-data body into {field name: bytes}"""
+    boundary = None
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            boundary = value.strip('"')
+    if not boundary:
+        raise HTTPError(400, "Missing multipart boundary")
+
+    fields = {}
+    for part in body.split(b"--" + boundary.encode())[1:]:
+        if part.startswith(b"--"):
+            break
+        head, sep, data = part.partition(b"\r\n\r\n")
+        if not sep:
+            continue
+        name = None
+        for line in head.decode("utf-8", "replace").split("\r\n"):
+            if line.lower().startswith("content-disposition:"):
+                for param in line.split(";")[1:]:
+                    key, _, value = param.strip().partition("=")
+                    if key == "name":
+                        name = value.strip('"')
+        if name:
+            fields[name] = data[:-2] if data.endswith(b"\r\n") else data
+    return fields
+
+
+def decode_image(data):
+    """JPEG/PNG bytes -> BGR array, as cv2.imread would return"""
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise HTTPError(400, "Could not decode the face image")
+    return img
+
+
+def decode_audio(data):
+    """WAV/FLAC/OGG bytes -> (mono float32 waveform, sample rate)"""
+    try:
+        audio, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except Exception as e:
+        raise HTTPError(400, f"Could not decode the voice audio: {str(e)}")
+    return audio.mean(axis=1), sample_rate
+
+
+def decode_username(data):
+    """Form field bytes -> username, rejecting what index.csv cannot store"""
+    try:
+        username = data.decode("utf-8").strip()
+    except UnicodeDecodeError:
+        raise HTTPError(400, "Username must be valid UTF-8")
+    if not username:
+        raise HTTPError(400, "Username cannot be empty")
+    if any(unicodedata.category(c) == "Cc" for c in username):
+        raise HTTPError(400, "Username cannot contain control characters")
+    return username
+
+
+class BiometricService:
+    """Enroll / verify / identify on top of util's face and voice pipeline.
+
+    One instance per worker process: models are loaded once through
+    util.models and inference runs on a thread pool (onnxruntime and torch
+    release the GIL), so the event loop keeps accepting requests while
+    face and voice are scored concurrently. With load_models=False only
+    the gallery is opened, for front ends that forward requests elsewhere.
+    """
+
+    def __init__(self, gallery=None, inference_threads=2, score_fusion=None, load_models=True):
+        self.gallery = gallery if gallery is not None else gallery_store.EmbeddingGallery()
+        self.score_fusion = score_fusion
+        self.face_index = self.identifier = self.executor = None
+        if not load_models:
+            return
+        # Same fusion config (calibration, weights, threshold) as BiometricApp.verify_user
+        if self.score_fusion is None:
+            self.score_fusion = fusion.load_fusion()
+        # The IVF face index is used once `ann_index.py build` has saved one for this gallery
+        self.face_index = ann_index.load_face_index(self.gallery)
+        self.identifier = Identifier(self.gallery, face_index=self.face_index,
+                                     score_fusion=self.score_fusion)
+        self.executor = ThreadPoolExecutor(max_workers=inference_threads, thread_name_prefix="inference")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _embeddings(self, fields, need_face=True, need_voice=True):
+        """Decode and embed the uploaded face/voice concurrently"""
+        jobs = {}
+        if "face" in fields:
+            jobs["face"] = self._run(util.extract_face_features, decode_image(fields["face"]))
+        elif need_face:
+            raise HTTPError(400, "Missing 'face' image")
+        if "voice" in fields:
+            waveform, sample_rate = decode_audio(fields["voice"])
+            jobs["voice"] = self._run(util.extract_voice_features, waveform, sample_rate)
+        elif need_voice:
+            raise HTTPError(400, "Missing 'voice' audio")
+
+        results = dict(zip(jobs, await asyncio.gather(*jobs.values())))
+        if "face" in results and results["face"] is None:
+            raise HTTPError(400, "No face detected")
+        return results.get("face"), results.get("voice")
+
+    async def enroll(self, fields):
+        username = decode_username(fields.get("username", b""))
+        face, voice = await self._embeddings(fields)
+        # An all-zero embedding means the recording held too little speech, as in BiometricApp
+        if not np.any(voice):
+            raise HTTPError(400, "No usable speech in the voice audio")
+        row = await self._run(self.gallery.add, username, face, voice)
+        if self.face_index is not None:
+            await self._run(self._update_face_index)
+        return {"username": username, "row": row}
+
+    def _update_face_index(self):
+        self.face_index.sync()
+        self.face_index.save()
+
+    async def verify(self, fields):
+        username = decode_username(fields.get("username", b""))
+        self.gallery.refresh()
+        stored = self.gallery.get(username)
+        if stored is None:
+            raise HTTPError(404, "User not found")
+        # With early-exit bands the modalities are embedded one at a time and a
+        # decisive score skips the rest; otherwise both are embedded concurrently
+        scores = {}
+        result = None
+        while result is None:
+            pending = [m for m in self.score_fusion.order if m not in scores]
+            batch = pending[:1] if self.score_fusion.bands else pending
+            face, voice = await self._embeddings({m: fields[m] for m in batch if m in fields},
+                                                 need_face="face" in batch, need_voice="voice" in batch)
+            if "face" in batch:
+                scores["face"] = float(util.compare_embeddings(stored[0], face))
+            if "voice" in batch:
+                scores["voice"] = float(util.compare_embeddings(stored[1], voice))
+            result = self.score_fusion.outcome(scores)
+        total_score, verified, early = result
+        return {"username": username, "face_score": scores.get("face"), "voice_score": scores.get("voice"),
+                "total_score": total_score, "verified": verified, "early": early, "path": list(scores)}
+
+    async def identify(self, fields):
+        try:
+            k = int(fields.get("k", b"5"))
+        except ValueError:
+            raise HTTPError(400, "'k' must be an integer")
+        if k < 1:
+            raise HTTPError(400, "'k' must be at least 1")
+        face, voice = await self._embeddings(fields, need_face=False, need_voice=False)
+        if face is None and voice is None:
+            raise HTTPError(400, "Need a 'face' image or 'voice' audio")
+        self.gallery.refresh()
+        matches = await self._run(self.identifier.identify, face, voice, k)
+        return {"matches": [{"username": name, "score": score} for name, score in matches]}
+
+    async def handle(self, path, fields):
+        """Run the /enroll, /verify or /identify route on already parsed form fields"""
+        routes = {"/enroll": self.enroll, "/verify": self.verify, "/identify": self.identify}
+        return await routes[path](fields)
+
+    async def metrics(self):
+        """The tracing.Tracer behind /metrics"""
+        return tracing.tracer
+
+    def health(self):
+        self.gallery.refresh()
+        return {"status": "ok", "users": len(self.gallery), "pid": os.getpid(),
+                "embedding_cache": util.EMBEDDING_CACHE.stats()}
+
+    async def dispatch(self, method, path, query, headers, body):
+        if path == "/health":
+            return self.health()
+        if path == "/metrics":
+            # Prometheus text by default; ?format=json for the raw per-stage snapshot
+            tracer = await self.metrics()
+            if query.get("format", [""])[0] == "json":
+                return tracer.snapshot()
+            return tracer.to_prometheus()
+        if path not in ("/enroll", "/verify", "/identify"):
+            raise HTTPError(404, f"No route for {path}")
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+
+        content_type = headers.get("content-type", "")
+        if not content_type.startswith("multipart/form-data"):
+            raise HTTPError(400, "Expected multipart/form-data")
+        fields = {key: values[0].encode("utf-8") for key, values in query.items()}
+        fields.update(parse_multipart(body, content_type))
+        with tracing.span(f"request {path}"):
+            return await self.handle(path, fields)
+
+    async def handle_connection(self, reader, writer):
+        """Minimal HTTP/1.1 with keep-alive; bodies must carry Content-Length"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    length = int(headers.get("content-length", "0"))
+                    if headers.get("transfer-encoding"):
+                        raise HTTPError(411, "Chunked bodies are not supported")
+                    if length > MAX_BODY_BYTES:
+                        raise HTTPError(413, "Request body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    url = urlsplit(target)
+                    status, payload = 200, await self.dispatch(method, url.path, parse_qs(url.query), headers, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                    keep_alive = keep_alive and e.status not in (411, 413)
+                except Exception as e:
+                    print(f"❌ ERROR handling {target}: {str(e)}")
+                    status, payload = 500, {"error": str(e)}
+
+                if isinstance(payload, str):
+                    data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                writer.write((f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                              f"Content-Type: {content_type}\r\n"
+                              f"Content-Length: {len(data)}\r\n"
+                              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+class PooledService(BiometricService):
+    """Front end that parses HTTP and hands each request to a worker_pool.InferencePool.
+
+    The front process loads no models; the pool's dispatcher balances
+    requests across its workers, which also works where SO_REUSEPORT does not.
+    """
+
+    def __init__(self, pool, gallery=None):
+        super().__init__(gallery, load_models=False)
+        self.pool = pool
+
+    async def handle(self, path, fields):
+        status, payload = await asyncio.wrap_future(self.pool.submit(path, fields))
+        if status != 200:
+            raise HTTPError(status, payload["error"])
+        return payload
+
+    async def metrics(self):
+        # Stages run in the workers: merge their histograms with this process's request spans
+        merged = await asyncio.get_running_loop().run_in_executor(None, self.pool.trace_export)
+        merged.merge(tracing.tracer.export())
+        return merged
+
+    def health(self):
+        return dict(super().health(), pool=self.pool.stats())
+
+
+async def serve(host, port, gallery_dir, inference_threads, reuse_port, pool=None):
+    if pool is not None:
+        service = PooledService(pool, gallery_store.EmbeddingGallery(gallery_dir))
+    else:
+        service = BiometricService(gallery_store.EmbeddingGallery(gallery_dir), inference_threads)
+        util.warm_up_models(background=False)
+    server = await asyncio.start_server(service.handle_connection, host, port, reuse_port=reuse_port)
+    tracing.start_reporting(f"Front end {os.getpid()}" if pool is not None else f"Worker {os.getpid()}")
+    print(f"✅ Worker {os.getpid()} listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def run_worker(host, port, gallery_dir, inference_threads, reuse_port):
+    try:
+        asyncio.run(serve(host, port, gallery_dir, inference_threads, reuse_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tracing.ENABLED:
+            tracing.print_report(f"Worker {os.getpid()}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Headless HTTP biometric verification service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--gallery", default=gallery_store.GALLERY_DIR)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes sharing the port")
+    parser.add_argument("--inference-threads", type=int, default=2, help="Inference threads per worker")
+    parser.add_argument("--pool", action="store_true",
+                        help="One front-end process dispatching to --workers inference processes")
+    parser.add_argument("--trace", action="store_true", help="Record per-stage latencies, served on /metrics")
+    parser.add_argument("--trace-report", type=float, default=None, metavar="SECONDS",
+                        help="With --trace, also print each process's per-stage table every SECONDS (always at exit)")
+    args = parser.parse_args()
+
+    if args.trace:
+        # Environment, so spawned pool workers trace and report too
+        os.environ["TRACE"] = "1"
+        tracing.enable()
+        if args.trace_report:
+            os.environ["TRACE_REPORT"] = str(args.trace_report)
+            tracing.REPORT_SECONDS = args.trace_report
+
+    if (args.pool or args.workers > 1) and not util.voice_weights_shared():
+        # Each process would draw its own random voice model: enrollments made by
+        # one worker would not verify on another
+        print("❌ ERROR: Several workers need identical voice weights; set VOICE_WEIGHTS or VOICE_SEED")
+        sys.exit(1)
+
+    if args.workers > 1 and sys.platform == "win32" and not args.pool:
+        print("⚠️ SO_REUSEPORT is unavailable on Windows; dispatching to a worker pool instead")
+        args.pool = True
+
+    worker_args = (args.host, args.port, args.gallery, args.inference_threads, args.workers > 1)
+    if args.pool:
+        from worker_pool import InferencePool
+
+        with InferencePool(args.workers, args.gallery, args.inference_threads) as pool:
+            try:
+                asyncio.run(serve(args.host, args.port, args.gallery, args.inference_threads, False, pool))
+            except KeyboardInterrupt:
+                pass
+            if tracing.ENABLED:
+                tracing.print_report(f"Front end {os.getpid()}")
+    elif args.workers == 1:
+        run_worker(*worker_args)
+    else:
+        # Each process loads its own models; the kernel spreads connections across them
+        workers = [multiprocessing.Process(target=run_worker, args=worker_args, daemon=True)
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
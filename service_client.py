@@ -0,0 +1,139 @@
+import http.client
+import json
+import threading
+import time
+import uuid
+import numpy as np
+
+
+class ServiceClient:
+    """Small client for service.py; one keep-alive connection per instance"""
+
+    def __init__(self, host="127.0.0.1", port=8080, timeout=60):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._conn = None
+
+    def _post(self, path, fields):
+        boundary = uuid.uuid4().hex
+        body = bytearray()
+        for name, value in fields.items():
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; "
+                     f"filename=\"{name}\"\r\n\r\n").encode("utf-8")
+            body += value + b"\r\n"
+        body += f"--{boundary}--\r\n".encode("utf-8")
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request("POST", path, body=bytes(body), headers=headers)
+                response = self._conn.getresponse()
+                return response.status, json.loads(response.read())
+            except (ConnectionError, http.client.HTTPException):
+                # Server closed an idle keep-alive connection; retry once on a fresh one
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+
+    def enroll(self, username, face_bytes, voice_bytes):
+        return self._post("/enroll", {"username": username, "face": face_bytes, "voice": voice_bytes})
+
+    def verify(self, username, face_bytes, voice_bytes):
+        return self._post("/verify", {"username": username, "face": face_bytes, "voice": voice_bytes})
+
+    def identify(self, face_bytes=None, voice_bytes=None, k=5):
+        return self._post("/identify", {"face": face_bytes, "voice": voice_bytes, "k": str(k)})
+
+
+def load_test(host, port, endpoint, face_bytes, voice_bytes, username, concurrency=4, requests=200):
+    """Fire requests from concurrent keep-alive clients; report latency percentiles and throughput"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        client = ServiceClient(host, port)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                if endpoint == "verify":
+                    status, payload = client.verify(username, face_bytes, voice_bytes)
+                else:
+                    status, payload = client.identify(face_bytes, voice_bytes)
+            except Exception as e:
+                status, payload = None, {"error": str(e)}
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status != 200:
+                    errors.append(payload.get("error"))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    print(f"{endpoint}: {len(ms)} requests, concurrency {concurrency}, {len(errors)} errors")
+    print(f"  latency p50 {p50:.1f} ms  p95 {p95:.1f} ms  p99 {p99:.1f} ms")
+    print(f"  throughput {len(ms) / wall:.1f} req/s")
+    if errors:
+        print(f"  first error: {errors[0]}")
+    return {"p50": p50, "p95": p95, "p99": p99, "rps": len(ms) / wall, "errors": len(errors)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Client and load generator for service.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("enroll", "verify", "identify", "load"):
+        command = commands.add_parser(name)
+        command.add_argument("--face", help="Face image file")
+        command.add_argument("--voice", help="Voice audio file")
+        if name != "identify":
+            command.add_argument("--username", required=name != "load")
+        if name == "load":
+            command.add_argument("--endpoint", choices=["verify", "identify"], default="verify")
+            command.add_argument("--concurrency", type=int, default=4)
+            command.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    def read(path):
+        if not path:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    face, voice = read(args.face), read(args.voice)
+    if args.command == "load":
+        load_test(args.host, args.port, args.endpoint, face, voice, args.username,
+                  args.concurrency, args.requests)
+    else:
+        client = ServiceClient(args.host, args.port)
+        if args.command == "enroll":
+            status, payload = client.enroll(args.username, face, voice)
+        elif args.command == "verify":
+            status, payload = client.verify(args.username, face, voice)
+        else:
+            status, payload = client.identify(face, voice)
+        print(status, json.dumps(payload, indent=2))
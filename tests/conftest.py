@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# Modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def restore_runtime():
+    # Imported here so conftest does not load torch for every test module
+    import util
+
+    saved = dict(util.VOICE_RUNTIME)
+    yield
+    util.VOICE_RUNTIME.update(saved)
+    util.models.unload("voice")
@@ -0,0 +1,45 @@
+import asyncio
+
+import cv2
+import numpy as np
+
+import ann_index
+import gallery as gallery_store
+import service
+import util
+
+
+def _unit(rng, dim):
+    x = rng.standard_normal(dim).astype(np.float32)
+    return x / np.linalg.norm(x)
+
+
+def test_enroll_inserts_into_saved_index_and_identify_uses_it(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    store = gallery_store.EmbeddingGallery(str(tmp_path / "gallery"))
+    for i in range(50):
+        store.add(f"user{i}", _unit(rng, store.face_dim), _unit(rng, store.voice_dim))
+    built = ann_index.GalleryFaceIndex(store, nlist=4)
+    built.build()
+    built.save()
+
+    face, voice = _unit(rng, store.face_dim), _unit(rng, store.voice_dim)
+    monkeypatch.setattr(util, "extract_face_features", lambda img: face)
+    monkeypatch.setattr(util, "extract_voice_features", lambda waveform, rate: voice)
+    monkeypatch.setattr(service, "decode_audio", lambda data: (np.zeros(16000, dtype=np.float32), 16000))
+    image = cv2.imencode(".png", np.zeros((8, 8, 3), dtype=np.uint8))[1].tobytes()
+
+    worker = service.BiometricService(store, inference_threads=1)
+    assert worker.identifier.face_index is not None
+    asyncio.run(worker.enroll({"username": b"newcomer", "face": image, "voice": b""}))
+
+    # Persisted: a fresh load already holds the new row
+    saved = ann_index.load_face_index(gallery_store.EmbeddingGallery(store.root))
+    assert saved.indexed_rows == store.rows == 51
+
+    calls = []
+    search = worker.face_index.search
+    monkeypatch.setattr(worker.face_index, "search", lambda *a, **kw: calls.append(a) or search(*a, **kw))
+    result = asyncio.run(worker.identify({"face": image, "k": b"1"}))
+    assert calls
+    assert result["matches"][0]["username"] == "newcomer"
@@ -0,0 +1,59 @@
+import numpy as np
+
+import embedding_cache
+import util
+
+
+def test_disabled_cache_does_no_hashing(monkeypatch):
+    hashed = []
+    monkeypatch.setattr(embedding_cache, "content_key", lambda *args: hashed.append(args) or args[:1])
+    monkeypatch.setattr(util.EMBEDDING_CACHE, "max_entries", 0)
+    misses = util.EMBEDDING_CACHE.misses
+
+    assert util._face_cache_key(np.zeros((4, 4, 3), dtype=np.uint8)) is None
+    util.extract_voice_features(np.zeros(16000, dtype=np.float32), 16000)
+    assert hashed == []
+    assert util.EMBEDDING_CACHE.misses == misses
+
+    monkeypatch.setattr(util.EMBEDDING_CACHE, "max_entries", 16)
+    util._face_cache_key(np.zeros((4, 4, 3), dtype=np.uint8))
+    assert len(hashed) == 1
+
+
+def test_none_key_is_never_stored():
+    cache = embedding_cache.EmbeddingCache(max_entries=4)
+    cache.put(None, np.ones(3))
+    assert len(cache) == 0
+    assert cache.get(None) is None
+    assert cache.stats()["misses"] == 0
+
+
+def test_voice_key_covers_the_exported_model(monkeypatch):
+    monkeypatch.setattr(util.EMBEDDING_CACHE, "max_entries", 16)
+    waveform = np.ones(160, dtype=np.float32)
+    monkeypatch.setitem(util.VOICE_RUNTIME, "model_path", "")
+    converted = util._voice_cache_key(waveform, 16000, True)
+    monkeypatch.setitem(util.VOICE_RUNTIME, "model_path", "models/ecapa_tdnn.pt")
+    assert util._voice_cache_key(waveform, 16000, True) != converted
+
+
+def test_face_template_reuses_cached_crops(monkeypatch):
+    batches = []
+
+    class Recognition:
+        def get_feat(self, crops):
+            batches.append(len(crops))
+            return np.stack([crop.reshape(-1)[:512].astype(np.float32) + 1 for crop in crops])
+
+    class Analyzer:
+        models = {"recognition": Recognition()}
+
+    monkeypatch.setattr(util, "get_face_analyzer", lambda: Analyzer())
+    monkeypatch.setattr(util, "EMBEDDING_CACHE", embedding_cache.EmbeddingCache(max_entries=16))
+    crops = [np.full((112, 112, 3), i, dtype=np.uint8) for i in range(3)]
+
+    template, embeddings = util.extract_face_template(crops[:2], aligned=True)
+    again, cached = util.extract_face_template(crops, aligned=True)
+    assert batches == [2, 1]
+    np.testing.assert_allclose(cached[:2], embeddings)
+    assert template is not None and again is not None
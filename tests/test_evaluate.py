@@ -0,0 +1,32 @@
+import numpy as np
+import soundfile as sf
+
+import evaluate
+import fusion
+
+
+def _voice(path, pitch, seed, seconds=1.5, rate=16000):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    audio = 0.3 * np.sin(2 * np.pi * pitch * t) * (1 + np.sin(2 * np.pi * 3 * t)) + 0.01 * rng.standard_normal(len(t))
+    sf.write(path, audio.astype(np.float32), rate)
+
+
+def test_scores_do_not_depend_on_the_number_of_workers(tmp_path):
+    data = tmp_path / "data"
+    for user, pitch in enumerate((150, 220, 330)):
+        (data / f"user{user}").mkdir(parents=True)
+        for take in range(2):
+            _voice(str(data / f"user{user}" / f"take{take}.wav"), pitch, seed=user * 10 + take)
+
+    results = []
+    for workers in (1, 2):
+        work_dir = tmp_path / f"work{workers}"
+        work_dir.mkdir()
+        # One file per shard, so with two workers pairs cross processes
+        histograms, stats = evaluate.evaluate(str(data), str(work_dir), fusion.ScoreFusion(), workers=workers,
+                                              shard_size=1)
+        assert stats["failed"]["voice"] == 0
+        results.append(histograms["voice"])
+    np.testing.assert_array_equal(results[0].genuine, results[1].genuine)
+    np.testing.assert_array_equal(results[0].impostor, results[1].impostor)
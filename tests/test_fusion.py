@@ -0,0 +1,37 @@
+import numpy as np
+
+import fusion
+
+
+def test_decisive_band_of_the_default_mean():
+    # fused = (face + voice) / 2 >= 0.7: voice alone can only reject, below 0.4
+    reject_below, accept_at = fusion.ScoreFusion().decisive_band("voice")
+    assert np.isclose(reject_below, 0.4)
+    assert accept_at == np.inf
+
+
+def test_decisive_band_includes_early_exit_bands():
+    engine = fusion.ScoreFusion(bands={"face": (0.3, 0.9)})
+    assert engine.decisive_band("face") == (0.4, 0.9)
+
+
+def test_threshold_at_far_without_impostors():
+    assert fusion.threshold_at_far([], 0.01) == -np.inf
+
+
+def test_fit_bands_with_fully_separable_scores():
+    rng = np.random.default_rng(0)
+    labels = np.repeat([1, 0], 500)
+    # Every impostor face score is far below every genuine one
+    scores = {"face": np.where(labels, rng.uniform(0.8, 1.0, 1000), rng.uniform(0.0, 0.2, 1000)),
+              "voice": np.where(labels, rng.uniform(0.5, 1.0, 1000), rng.uniform(0.0, 0.6, 1000))}
+    engine = fusion.ScoreFusion().fit(labels, scores)
+    engine.fit_bands(labels, scores, target_far=0.01)
+
+    reject_below, accept_at = engine.bands["face"]
+    assert reject_below <= accept_at
+    assert np.isfinite(engine.threshold)
+    accepted = np.array([engine.decide_sequential({m: (lambda m=m: scores[m][i]) for m in engine.order})["verified"]
+                         for i in range(len(labels))])
+    assert accepted[labels == 1].all()
+    assert accepted[labels == 0].mean() <= 0.01
@@ -0,0 +1,66 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import gallery as gallery_store
+
+
+@pytest.mark.skipif(gallery_store.fcntl is None, reason="cross-process locking needs fcntl")
+def test_reader_never_pairs_old_index_with_compacted_rows(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    writer = gallery_store.EmbeddingGallery(str(tmp_path))
+    expected = {}
+    for i in range(6):
+        username = f"user{i}"
+        expected[username] = rng.standard_normal(writer.face_dim).astype(np.float32)
+        writer.add(username, expected[username], np.zeros(writer.voice_dim))
+        # Superseded and removed rows give compact() something to reclaim
+        writer.add(f"old{i}", expected[username] + 1, np.zeros(writer.voice_dim))
+        writer.remove(f"old{i}")
+    reader = gallery_store.EmbeddingGallery(str(tmp_path))
+
+    # Another process reloading between two of compact()'s file swaps
+    replace = os.replace
+    refreshed = []
+
+    def replace_then_refresh(src, dst):
+        replace(src, dst)
+        if dst == writer.face_path:
+            thread = threading.Thread(target=lambda: refreshed.append(reader.refresh()))
+            thread.start()
+            thread.join(timeout=0.5)
+            assert thread.is_alive()  # blocked until the swap is complete
+            refreshed.append(thread)
+
+    monkeypatch.setattr(gallery_store.os, "replace", replace_then_refresh)
+    assert writer.compact() == 6
+    refreshed[0].join(timeout=5)
+
+    assert refreshed[1:] == [True]
+    for username, face in expected.items():
+        np.testing.assert_array_equal(reader.get(username)[0], face)
+
+
+def test_interrupted_add_leaves_no_exemplar_mapping(tmp_path, monkeypatch):
+    writer = gallery_store.EmbeddingGallery(str(tmp_path))
+    exemplars = np.ones((3, writer.face_dim), dtype=np.float32)
+
+    def crash_on_index(path, *args, **kwargs):
+        if path == writer.index_path:
+            raise OSError("disk full")
+        return open(path, *args, **kwargs)
+
+    monkeypatch.setattr(gallery_store, "open", crash_on_index, raising=False)
+    with pytest.raises(OSError):
+        writer.add("alice", exemplars[0], np.zeros(writer.voice_dim), face_exemplars=exemplars)
+    monkeypatch.undo()
+
+    # Rows written before the crash stay unreferenced: no exemplar mapping without an index line
+    assert not os.path.exists(writer.exemplar_index_path)
+    store = gallery_store.EmbeddingGallery(str(tmp_path))
+    assert "alice" not in store
+    row = store.add("alice", exemplars[0], np.zeros(store.voice_dim), face_exemplars=exemplars * 2)
+    np.testing.assert_array_equal(store.get_exemplars("alice"), exemplars * 2)
+    assert gallery_store.EmbeddingGallery(str(tmp_path))._exemplars == {row: (3, 3)}
@@ -0,0 +1,26 @@
+import numpy as np
+
+import fusion
+import gallery as gallery_store
+from identify import Identifier
+
+
+def test_identify_fuses_with_the_verification_fusion(tmp_path):
+    rng = np.random.default_rng(0)
+    store = gallery_store.EmbeddingGallery(str(tmp_path))
+    for i in range(4):
+        face = rng.standard_normal(store.face_dim).astype(np.float32)
+        store.add(f"user{i}", face / np.linalg.norm(face), rng.standard_normal(store.voice_dim))
+    score_fusion = fusion.ScoreFusion(weights={"face": 0.8, "voice": 0.2}, bias=0.1)
+    identifier = Identifier(store, score_fusion=score_fusion)
+
+    face_probe, voice_probe = store.face[2], store.voice[2]
+    (username, score), = identifier.identify(face_probe, voice_probe, k=1)
+    assert username == "user2"
+    expected = score_fusion.fuse({"face": identifier.face_scores(face_probe)[2],
+                                  "voice": identifier.voice_scores(voice_probe)[2]})
+    assert np.isclose(score, expected, atol=1e-5)
+
+    # A single modality keeps its raw similarity
+    (_, face_only), = identifier.identify(face_probe, k=1)
+    assert np.isclose(face_only, 1.0, atol=1e-5)
@@ -0,0 +1,56 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+import gallery as gallery_store
+import service
+import util
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(util, "extract_face_features", lambda img: np.ones(gallery_store.FACE_DIM, dtype=np.float32))
+    monkeypatch.setattr(service, "decode_audio", lambda data: (np.zeros(16000, dtype=np.float32), 16000))
+    return service.BiometricService(gallery_store.EmbeddingGallery(str(tmp_path / "gallery")), inference_threads=1)
+
+
+def _image():
+    return cv2.imencode(".png", np.zeros((8, 8, 3), dtype=np.uint8))[1].tobytes()
+
+
+def test_enroll_rejects_silent_voice(worker, monkeypatch):
+    # extract_voice_features returns zeros when VAD finds too little speech
+    monkeypatch.setattr(util, "extract_voice_features", lambda waveform, rate: np.zeros(gallery_store.VOICE_DIM))
+    with pytest.raises(service.HTTPError) as error:
+        asyncio.run(worker.enroll({"username": b"alice", "face": _image(), "voice": b""}))
+    assert error.value.status == 400
+    assert len(worker.gallery) == 0
+
+
+@pytest.mark.parametrize("k", [b"abc", b"0", b"-3"])
+def test_identify_rejects_bad_k(worker, k):
+    with pytest.raises(service.HTTPError) as error:
+        asyncio.run(worker.identify({"face": _image(), "k": k}))
+    assert error.value.status == 400
+
+
+def test_pooled_front_end_loads_nothing(tmp_path, monkeypatch):
+    def unexpected(*args, **kwargs):
+        raise AssertionError("the front end should leave inference to the pool")
+
+    monkeypatch.setattr(service.fusion, "load_fusion", unexpected)
+    monkeypatch.setattr(service.ann_index, "load_face_index", unexpected)
+    monkeypatch.setattr(service, "Identifier", unexpected)
+    front = service.PooledService(pool=None, gallery=gallery_store.EmbeddingGallery(str(tmp_path)))
+    assert front.executor is None and front.identifier is None
+
+
+@pytest.mark.parametrize("username", [b"\xff\xfe", b"   ", b"eve\nbob,0", b"tab\there"])
+@pytest.mark.parametrize("route", ["enroll", "verify"])
+def test_bad_username_is_rejected(worker, route, username):
+    with pytest.raises(service.HTTPError) as error:
+        asyncio.run(getattr(worker, route)({"username": username, "face": _image(), "voice": b""}))
+    assert error.value.status == 400
+    assert len(worker.gallery) == 0
@@ -0,0 +1,16 @@
+import numpy as np
+
+import tracing
+
+
+def test_merged_exports_match_one_histogram():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(8, 1, 2000).astype(int)
+    combined, merged = tracing.Tracer(), tracing.Tracer()
+    parts = [tracing.Tracer(), tracing.Tracer()]
+    for i, value in enumerate(values):
+        combined.record("face detect", value)
+        parts[i % 2].record("face detect", value)
+    for part in parts:
+        merged.merge(part.export())
+    assert merged.snapshot() == combined.snapshot()
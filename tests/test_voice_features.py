@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import util
+
+
+def _voice(seconds, pitch=200, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * util.VOICE_SAMPLE_RATE)) / util.VOICE_SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * pitch * t) * (1 + np.sin(2 * np.pi * 3 * t))
+            + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def _cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setattr(util.EMBEDDING_CACHE, "max_entries", 0)
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    calls = []
+    get_voice_model = util.get_voice_model
+
+    def counting():
+        model = get_voice_model()
+
+        def run(*args, **kwargs):
+            calls.append(args[0].shape)
+            return model(*args, **kwargs)
+        return run
+
+    monkeypatch.setattr(util, "get_voice_model", counting)
+    return calls
+
+
+@pytest.mark.parametrize("vad", [True, False])
+def test_batch_matches_single_extraction(no_cache, vad):
+    audios = [_voice(seconds, pitch, seed)
+              for seed, (seconds, pitch) in enumerate([(1.2, 180), (2.7, 220), (0.9, 150), (4.1, 260)])]
+    batch, statuses = util.extract_voice_features_batch(audios, batch_size=3, vad=vad)
+    assert statuses == ["ok"] * len(audios)
+    for audio, embedding in zip(audios, batch):
+        np.testing.assert_allclose(embedding, util.extract_voice_features(audio, vad=vad), atol=1e-5)
+
+
+def test_silence_is_rejected_without_running_the_model(no_cache, model_calls):
+    silence = np.zeros(3 * util.VOICE_SAMPLE_RATE, dtype=np.float32)
+    assert not np.any(util.extract_voice_features(silence))
+    embeddings, statuses = util.extract_voice_features_batch([silence, silence])
+    assert statuses == ["too_short", "too_short"]
+    assert not np.any(embeddings)
+    assert model_calls == []
+
+
+@pytest.mark.parametrize("pad_hops", [(50, 0), (0, 80), (120, 200)])
+def test_padding_silence_does_not_change_the_embedding(no_cache, pad_hops):
+    hop = util.MEL_PARAMS["hop_length"]
+    voice = _voice(2.0)
+    padded = np.concatenate([np.zeros(pad_hops[0] * hop, np.float32), voice,
+                             np.zeros(pad_hops[1] * hop, np.float32)])
+    assert _cosine(util.extract_voice_features(padded), util.extract_voice_features(voice)) > 0.999
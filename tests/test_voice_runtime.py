@@ -0,0 +1,40 @@
+import pytest
+import torch
+
+import util
+import voice_runtime
+from model import ECAPA_TDNN
+
+
+def test_quantized_onnx_is_rejected_up_front(restore_runtime):
+    before = dict(util.VOICE_RUNTIME)
+    with pytest.raises(ValueError):
+        util.set_voice_runtime(backend="onnx", quantize="dynamic")
+    with pytest.raises(ValueError):
+        util.set_voice_runtime(backend="onnx", model_path="ecapa_tdnn.pt")
+    assert util.VOICE_RUNTIME == before
+
+
+@pytest.mark.parametrize("backend", ["torchscript", "onnx"])
+def test_exported_artifact_is_loaded(tmp_path, restore_runtime, backend):
+    # Weights that differ from util's eager model, so a conversion would not match
+    exported = ECAPA_TDNN(input_size=80).eval()
+    path = str(tmp_path / f"ecapa_tdnn{voice_runtime.ARTIFACT_EXTENSIONS[backend]}")
+    if backend == "torchscript":
+        voice_runtime.trace_voice_model(exported).save(path)
+    else:
+        voice_runtime.export_onnx(exported, path)
+
+    util.set_voice_runtime(backend=backend, model_path=path)
+    model = util.get_voice_model()
+    mel = torch.rand(1, 80, 200) * 50
+    with torch.no_grad():
+        assert torch.allclose(model(mel), exported(mel), atol=1e-4)
+        assert not torch.allclose(model(mel), util.get_eager_voice_model()(mel), atol=1e-4)
+
+
+@pytest.mark.parametrize("lengths", [(57, 140), (100, 250, 400)])
+@pytest.mark.parametrize("backend", ["torchscript", "onnx"])
+def test_backend_matches_eager(backend, lengths):
+    worst, ok = voice_runtime.check_parity(ECAPA_TDNN(input_size=80).eval(), backend, lengths=lengths)
+    assert ok, f"{backend} differs from eager by {worst:.2e}"
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import util
+import voice_runtime
+import voice_stream
+from model import ECAPA_TDNN
+
+
+def _tone(seconds=3.0):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * util.VOICE_SAMPLE_RATE)) / util.VOICE_SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 200 * t) * (1 + np.sin(2 * np.pi * 3 * t))
+            + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def _stream(model, audio):
+    embedder = voice_stream.StreamingVoiceEmbedder(model, vad=False)
+    for start in range(0, len(audio), 1600):
+        embedder.push(audio[start:start + 1600])
+    return embedder.finalize()
+
+
+@pytest.mark.parametrize("backend", ["eager", "torchscript"])
+def test_streaming_uses_the_quantized_runtime(restore_runtime, backend):
+    audio = _tone()
+    util.set_voice_runtime(backend=backend, quantize="dynamic")
+    quantized = util.extract_voice_features(audio, vad=False)
+    streamed = _stream(None, audio)
+    util.set_voice_runtime(backend="eager", quantize="")
+    eager = util.extract_voice_features(audio, vad=False)
+
+    assert np.abs(streamed - quantized).max() < np.abs(eager - quantized).max() / 10
+
+
+def test_streaming_reruns_a_loaded_artifact(tmp_path):
+    exported = ECAPA_TDNN(input_size=80).eval()
+    path = str(tmp_path / "ecapa_tdnn.pt")
+    voice_runtime.trace_voice_model(exported).save(path)
+    model = voice_runtime.build_voice_model(util.get_eager_voice_model(), "torchscript", path=path)
+    assert voice_runtime.LayerwiseECAPA.of(model) is None
+
+    audio = _tone()
+    batch = model(util._voice_mel(audio))[0].numpy()
+    np.testing.assert_allclose(_stream(model, audio), batch, atol=1e-4)
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import torch
+
+import util
+from model import ECAPA_TDNN
+
+# First layer1 weights of a freshly imported util, in a separate interpreter
+PROBE = "import util; print(util._load_eager_voice_model().layer1.weight.flatten()[:8].tolist())"
+
+
+def test_every_process_builds_the_same_voice_model():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {k: v for k, v in os.environ.items() if k not in ("VOICE_WEIGHTS", "VOICE_SEED")}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    runs = [subprocess.run([sys.executable, "-c", PROBE], env=env, cwd=root, capture_output=True, text=True,
+                           check=True).stdout.strip().splitlines()[-1] for _ in range(2)]
+    assert runs[0] == runs[1]
+    assert runs[0] == str(util._load_eager_voice_model().layer1.weight.flatten()[:8].tolist())
+
+
+def test_seeding_leaves_the_global_rng_alone():
+    torch.manual_seed(123)
+    expected = torch.rand(3)
+    torch.manual_seed(123)
+    util._load_eager_voice_model()
+    assert torch.equal(torch.rand(3), expected)
+
+
+def test_weights_file_is_loaded(tmp_path, monkeypatch):
+    weights = ECAPA_TDNN(input_size=80).state_dict()
+    path = str(tmp_path / "ecapa.pt")
+    torch.save(weights, path)
+    monkeypatch.setattr(util, "VOICE_WEIGHTS", path)
+    assert torch.equal(util._load_eager_voice_model().fc.weight, weights["fc.weight"])
+
+
+def test_unseeded_random_init_is_not_shared(monkeypatch):
+    monkeypatch.setattr(util, "VOICE_SEED", "")
+    assert not util.voice_weights_shared()
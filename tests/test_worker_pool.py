@@ -0,0 +1,31 @@
+import time
+
+import worker_pool
+
+
+def _fake_worker(index, gallery_dir, inference_threads, tasks, results):
+    """Worker 0 never answers; the others answer every request at once"""
+    import os
+
+    results.put((None, index, "ready", os.getpid()))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        if index != 0:
+            results.put((task[0], index, 200, {"worker": index}))
+
+
+def test_crashed_worker_fails_its_requests_while_others_keep_answering(tmp_path):
+    with worker_pool.InferencePool(2, str(tmp_path), worker_main=_fake_worker) as pool:
+        stuck = pool.submit("/verify", {})
+        assert pool.submit("/verify", {}).result(timeout=10) == (200, {"worker": 1})
+        pool._processes[0].kill()
+
+        # Keep results flowing faster than the liveness interval
+        deadline = time.monotonic() + 10
+        while not stuck.done() and time.monotonic() < deadline:
+            assert pool.submit("/verify", {}).result(timeout=10)[0] == 200
+            time.sleep(0.05)
+        assert stuck.result(timeout=0) == (500, {"error": "Inference worker exited"})
+        assert pool.stats()["alive"] == 1
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Off unless TRACE=1 or enable(): span() then costs one global lookup and a no-op context manager
+ENABLED = os.environ.get("TRACE", "") not in ("", "0")
+# Seconds between report dumps of long-running processes (service, pool workers); 0 = only at exit
+REPORT_SECONDS = float(os.environ.get("TRACE_REPORT", "0") or 0)
+
+SUB_BUCKETS = 16      # linear sub-buckets per power of two: ~6% worst-case relative error
+MAX_EXPONENT = 40     # ~18 minutes in microseconds
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of durations, recorded in microseconds.
+
+    Values below SUB_BUCKETS us get one bucket each; above that every power
+    of two is split into SUB_BUCKETS equal buckets, so percentiles carry a
+    bounded relative error at any scale while memory stays fixed.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(SUB_BUCKETS * (MAX_EXPONENT - 2), dtype=np.int64)
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    @staticmethod
+    def _index(value):
+        if value < SUB_BUCKETS:
+            return value
+        exponent = value.bit_length() - 1
+        shift = exponent - 4  # log2(SUB_BUCKETS)
+        return SUB_BUCKETS * (shift + 1) + ((value >> shift) & (SUB_BUCKETS - 1))
+
+    @staticmethod
+    def _upper_bound(index):
+        """Largest value (us) that falls in a bucket"""
+        if index < SUB_BUCKETS:
+            return index
+        shift = index // SUB_BUCKETS - 1
+        return ((SUB_BUCKETS + index % SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, micros):
+        value = max(int(micros), 0)
+        self.counts[min(self._index(value), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total_us += value
+        self.min_us = value if self.min_us is None else min(self.min_us, value)
+        self.max_us = max(self.max_us, value)
+
+    def percentile(self, q):
+        """Upper bound (us) of the bucket holding the q-quantile, capped at the observed max"""
+        if not self.count:
+            return 0
+        index = int(np.searchsorted(np.cumsum(self.counts), max(q * self.count, 1)))
+        return min(self._upper_bound(index), self.max_us)
+
+    def export(self):
+        """Raw state (non-empty buckets only), picklable, for merge() in another process"""
+        buckets = np.flatnonzero(self.counts)
+        return {"buckets": buckets, "counts": self.counts[buckets], "count": self.count,
+                "total_us": self.total_us, "min_us": self.min_us, "max_us": self.max_us}
+
+    def merge(self, state):
+        """Add another histogram's export() into this one"""
+        self.counts[state["buckets"]] += state["counts"]
+        self.count += state["count"]
+        self.total_us += state["total_us"]
+        if state["min_us"] is not None:
+            self.min_us = state["min_us"] if self.min_us is None else min(self.min_us, state["min_us"])
+        self.max_us = max(self.max_us, state["max_us"])
+
+    def snapshot(self):
+        return {"count": self.count, "total_ms": self.total_us / 1000,
+                "mean_ms": self.total_us / 1000 / self.count if self.count else 0.0,
+                "min_ms": (self.min_us or 0) / 1000, "max_ms": self.max_us / 1000,
+                **{f"p{round(q * 100)}_ms": self.percentile(q) / 1000 for q in QUANTILES}}
+
+
+class Tracer:
+    """Per-stage LatencyHistograms, shared by every thread of the process"""
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, micros):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.record(micros)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+
+    def export(self):
+        with self._lock:
+            return {stage: histogram.export() for stage, histogram in self.histograms.items()}
+
+    def merge(self, exported):
+        """Fold in another process's export(), e.g. to aggregate the worker pool"""
+        with self._lock:
+            for stage, state in exported.items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = LatencyHistogram()
+                histogram.merge(state)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: histogram.snapshot() for stage, histogram in self.histograms.items()}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, metric="biometric_stage_seconds"):
+        """Prometheus text exposition: one summary per stage"""
+        lines = [f"# HELP {metric} Time spent in each face/voice pipeline stage",
+                 f"# TYPE {metric} summary"]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{stage="{stage}",quantile="{q:g}"}} {histogram.percentile(q) / 1e6:.6f}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {histogram.total_us / 1e6:.6f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """Per-stage breakdown table, slowest total first"""
+        stages = sorted(self.snapshot().items(), key=lambda item: -item[1]["total_ms"])
+        lines = [f"{'stage':<22}{'count':>7}{'mean ms':>10}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'total ms':>11}"]
+        for stage, s in stages:
+            lines.append(f"{stage:<22}{s['count']:>7}{s['mean_ms']:>10.2f}{s['p50_ms']:>9.2f}{s['p90_ms']:>9.2f}"
+                         f"{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}{s['total_ms']:>11.1f}")
+        return "\n".join(lines)
+
+
+tracer = Tracer()
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+@contextmanager
+def _span(stage):
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        tracer.record(stage, (time.perf_counter_ns() - start) // 1000)
+
+
+def span(stage):
+    """Time a block as one sample of stage: `with tracing.span("face detect"): ...`"""
+    if not ENABLED:
+        return _NO_SPAN
+    return _span(stage)
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+
+def print_report(title):
+    """Print the per-stage table if anything was traced"""
+    if tracer.histograms:
+        print(f"\n{title} per-stage latency:\n{tracer.report()}", flush=True)
+
+
+def start_reporting(title, interval=None):
+    """Print the report every interval seconds (default TRACE_REPORT) from a daemon thread"""
+    interval = REPORT_SECONDS if interval is None else interval
+    if not ENABLED or interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            print_report(title)
+
+    thread = threading.Thread(target=loop, name="trace-report", daemon=True)
+    thread.start()
+    return thread
@@ -1,4 +1,9 @@
+import time
+_import_start = time.perf_counter()
+
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
 import torch
@@ -6,54 +11,504 @@ import torchaudio
 import sounddevice as sd
 import soundfile as sf
 import librosa
-from scipy.spatial.distance import cosine
 from model import ECAPA_TDNN
-from insightface.app import FaceAnalysis
+import voice_runtime
+import embedding_cache
+import tracing
+
+class ModelRegistry:
+    """Loads heavy models on first use and records startup costs per stage.
+
+    Nothing is built at import time: get() runs a model's loader the first
+    time it is asked for (once, even if several threads ask together), and
+    warm_up() can do that in a background thread once the UI is showing.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self.timings = {}
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def unload(self, name):
+        """Drop a loaded model so the next get() builds it again"""
+        with self._locks[name]:
+            self._models.pop(name, None)
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            with self._locks[name]:
+                model = self._models.get(name)
+                if model is None:
+                    start = time.perf_counter()
+                    model = self._loaders[name]()
+                    self.timings[f"load {name}"] = time.perf_counter() - start
+                    self._models[name] = model
+        return model
+
+    def record_first(self, stage, seconds):
+        """Keep the cost of the first call of a stage (e.g. first inference)"""
+        self.timings.setdefault(stage, seconds)
+
+    def warm_up(self, names=None, background=True):
+        """Load models now, optionally in a daemon thread so the caller isn't blocked"""
+        names = list(names or self._loaders)
+
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"❌ ERROR while loading {name} model: {str(e)}")
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self):
+        """Startup cost breakdown, one stage per line"""
+        lines = ["Startup timings:"]
+        for stage, seconds in self.timings.items():
+            lines.append(f"  {stage:<24} {seconds * 1000:9.1f} ms")
+        return "\n".join(lines)
+
+# Voice model runtime: backend is "eager", "torchscript" or "onnx" (see voice_runtime.py),
+# threads the intra-op thread count (0 keeps the library default), quantize
+# "" (float), "dynamic" or "static" int8, and model_path an exported .pt/.onnx
+# to load instead of converting the eager model ("" to convert)
+VOICE_RUNTIME = {"backend": os.environ.get("VOICE_BACKEND", "eager"),
+                 "threads": int(os.environ.get("VOICE_THREADS", "0")),
+                 "quantize": os.environ.get("VOICE_QUANTIZE", ""),
+                 "model_path": os.environ.get("VOICE_MODEL_PATH", "")}
+# A bad combination fails here rather than as zero embeddings at inference time
+voice_runtime.check_runtime(VOICE_RUNTIME["backend"], VOICE_RUNTIME["quantize"], VOICE_RUNTIME["model_path"])
+
+# Voice weights: VOICE_WEIGHTS is an ECAPA_TDNN state_dict; without one the model is initialized
+# from VOICE_SEED, so every process (pool and SO_REUSEPORT workers, evaluate.py shards, restarts)
+# builds the same weights. VOICE_SEED="" falls back to an unseeded, per-process random init.
+VOICE_WEIGHTS = os.environ.get("VOICE_WEIGHTS", "")
+VOICE_SEED = os.environ.get("VOICE_SEED", "0")
+
+def voice_weights_shared():
+    """True when every process builds identical voice weights (VOICE_WEIGHTS or VOICE_SEED)"""
+    return bool(VOICE_WEIGHTS or VOICE_SEED)
+
+def _load_eager_voice_model():
+    if VOICE_SEED and not VOICE_WEIGHTS:
+        # Own RNG state, so seeding does not reset the caller's torch random stream
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(int(VOICE_SEED))
+            voice_model = ECAPA_TDNN(input_size=80)
+    else:
+        voice_model = ECAPA_TDNN(input_size=80)
+    if VOICE_WEIGHTS:
+        voice_model.load_state_dict(torch.load(VOICE_WEIGHTS, map_location="cpu"))
+    voice_model.eval()
+    return voice_model
+
+def voice_calibration_mels(paths=None, seconds=3.0):
+    """Mel spectrograms of sample utterances for static quantization.
+
+    Defaults to the bundled temp_voice.wav and enrolled ./db/<user>/voice.wav
+    recordings, cut into seconds-long pieces.
+    """
+    if paths is None:
+        paths = [p for p in ["./temp_voice.wav"] if os.path.exists(p)]
+        if os.path.isdir("./db"):
+            paths += [os.path.join("./db", user, "voice.wav") for user in sorted(os.listdir("./db"))
+                      if os.path.exists(os.path.join("./db", user, "voice.wav"))]
+    frames = int(seconds * VOICE_SAMPLE_RATE / MEL_PARAMS["hop_length"])
+    mels = []
+    for path in paths:
+        mel = _voice_mel(path)
+        mels += [mel[:, start:start + frames] for start in range(0, max(mel.shape[-1] - frames, 0) + 1, frames // 2)]
+    return mels
+
+def _load_voice_model():
+    # Every backend is built from the same eager weights
+    quantize = VOICE_RUNTIME["quantize"] or None
+    calibration = voice_calibration_mels() if quantize == "static" else None
+    return voice_runtime.build_voice_model(models.get("voice_eager"), VOICE_RUNTIME["backend"],
+                                           VOICE_RUNTIME["threads"] or None, quantize, calibration,
+                                           VOICE_RUNTIME["model_path"] or None)
+
+# Face pipeline: modules are the buffalo_l models loaded (landmarks and gender/age are never
+# used), det_size the detector input (multiples of 32), and frames larger than
+# detect_max_side are downscaled for detection but aligned at full resolution (0 = off)
+FACE_RUNTIME = {"modules": ["detection", "recognition"],
+                "det_size": int(os.environ.get("FACE_DET_SIZE", "640")),
+                "detect_max_side": int(os.environ.get("FACE_DETECT_MAX_SIDE", "0"))}
+
+def _load_face_analyzer():
+    # insightface pulls in onnxruntime, so import it only when faces are needed
+    from insightface.app import FaceAnalysis
+
+    # Use ArcFace for face recognition
+    det_size = FACE_RUNTIME["det_size"]
+    face_analyzer = FaceAnalysis(name='buffalo_l', allowed_modules=FACE_RUNTIME["modules"])
+    face_analyzer.prepare(ctx_id=0, det_size=(det_size, det_size))
+    return face_analyzer
+
+models = ModelRegistry()
+models.register("voice_eager", _load_eager_voice_model)
+models.register("voice", _load_voice_model)
+models.register("face", _load_face_analyzer)
+
+def get_voice_model():
+    return models.get("voice")
+
+def get_eager_voice_model():
+    """The PyTorch module every voice runtime is built from"""
+    return models.get("voice_eager")
+
+def set_voice_runtime(backend=None, threads=None, quantize=None, model_path=None):
+    """Switch the voice backend, thread count, int8 quantization ("" for float) and/or
+    exported model file ("" to convert the eager model); the model is rebuilt on next use.
+
+    Raises ValueError, changing nothing, for a combination that cannot run.
+    """
+    runtime = dict(VOICE_RUNTIME)
+    for name, value in (("backend", backend), ("threads", threads), ("quantize", quantize),
+                        ("model_path", model_path)):
+        if value is not None:
+            runtime[name] = value
+    voice_runtime.check_runtime(runtime["backend"], runtime["quantize"], runtime["model_path"])
+    VOICE_RUNTIME.update(runtime)
+    models.unload("voice")
 
-# Initialize voice model
-voice_model = ECAPA_TDNN(input_size=80)
-voice_model.eval()
+def get_face_analyzer():
+    return models.get("face")
 
-# Use ArcFace for face recognition
-face_analyzer = FaceAnalysis(name='buffalo_l')
-face_analyzer.prepare(ctx_id=0)
+def set_face_runtime(det_size=None, detect_max_side=None, modules=None):
+    """Change the detector input size, detection downscaling or loaded modules.
+
+    det_size and detect_max_side apply from the next detection; a module
+    change reloads the analyzer on next use.
+    """
+    if det_size is not None:
+        if det_size % 32:
+            raise ValueError("det_size must be a multiple of 32")
+        FACE_RUNTIME["det_size"] = det_size
+    if detect_max_side is not None:
+        FACE_RUNTIME["detect_max_side"] = detect_max_side
+    if modules is not None and list(modules) != FACE_RUNTIME["modules"]:
+        FACE_RUNTIME["modules"] = list(modules)
+        models.unload("face")
+
+# Embeddings of recently seen images/recordings, keyed by decoded content and model config,
+# so retries and re-scoring the same probe skip detection and inference
+EMBEDDING_CACHE = embedding_cache.EmbeddingCache(
+    max_entries=int(os.environ.get("EMBEDDING_CACHE_ENTRIES", "1024")),
+    max_bytes=int(os.environ.get("EMBEDDING_CACHE_MB", "32")) << 20,
+    ttl=float(os.environ.get("EMBEDDING_CACHE_TTL", "600")))
+
+def _face_cache_key(img):
+    # No hashing at all while the cache is disabled (evaluate.py, benchmarks)
+    if not EMBEDDING_CACHE.enabled:
+        return None
+    with tracing.span("cache key"):
+        return embedding_cache.content_key("face", img, "buffalo_l", FACE_RUNTIME["det_size"],
+                                           FACE_RUNTIME["detect_max_side"])
+
+def _face_crop_cache_key(crop):
+    # Aligned crops go straight to recognition, so detector settings are not part of the key
+    if not EMBEDDING_CACHE.enabled:
+        return None
+    with tracing.span("cache key"):
+        return embedding_cache.content_key("face crop", crop, "buffalo_l")
+
+def _voice_cache_key(waveform, sample_rate, vad):
+    if not EMBEDDING_CACHE.enabled:
+        return None
+    with tracing.span("cache key"):
+        return embedding_cache.content_key("voice", waveform, sample_rate, vad, VOICE_RUNTIME["backend"],
+                                           VOICE_RUNTIME["quantize"], VOICE_RUNTIME["model_path"])
+
+def warm_up_models(background=True):
+    """Load the face and voice models ahead of their first use"""
+    return models.warm_up(background=background)
+
+def __getattr__(name):
+    # Keep util.voice_model / util.face_analyzer working, loaded on first access
+    if name == "voice_model":
+        return get_voice_model()
+    if name == "face_analyzer":
+        return get_face_analyzer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def extract_face_features(face_path):
-    """Extract face embeddings using ArcFace"""
+    """Extract face embeddings using ArcFace from an image path or a decoded BGR array"""
     try:
-        img = cv2.imread(face_path)
+        with tracing.span("face read"):
+            img = face_path if isinstance(face_path, np.ndarray) else cv2.imread(face_path)
         if img is None:
             print("❌ ERROR: Could not read the image!")
             return None
+        key = _face_cache_key(img)
+        embedding = EMBEDDING_CACHE.get(key)
+        if embedding is not None:
+            return embedding
 
-        faces = face_analyzer.get(img)
-        if len(faces) == 0:
+        # Detection and recognition only, instead of every module FaceAnalysis.get runs
+        face_analyzer = get_face_analyzer()
+        start = time.perf_counter()
+        crop = _detect_and_align(face_analyzer, img)
+        if crop is None:
             print("❌ ERROR: No face detected!")
             return None
+        with tracing.span("face embed"):
+            embedding = face_analyzer.models['recognition'].get_feat([crop])[0].astype(np.float32)
+        models.record_first("first inference face", time.perf_counter() - start)
 
-        return faces[0].normed_embedding  # ArcFace Embedding
+        embedding /= max(float(np.linalg.norm(embedding)), 1e-12)  # normed ArcFace embedding
+        EMBEDDING_CACHE.put(key, embedding)
+        return embedding
     except Exception as e:
         print(f"❌ ERROR during face extraction: {str(e)}")
         return None
 
-def compare_faces(new_face_path, stored_embedding_path):
-    """Compare face embeddings and return similarity score"""
+def detect_faces(img, det_size=None, max_side=None):
+    """Run only the face detector: (N, 5) boxes with scores and (N, 5, 2) keypoints,
+    in the order FaceAnalysis.get returns faces, in img's coordinates.
+
+    Frames larger than max_side (default FACE_RUNTIME["detect_max_side"])
+    are detected on an INTER_AREA-downscaled copy and the results scaled
+    back, so alignment still crops from the full-resolution frame.
+    """
+    det_size = det_size or FACE_RUNTIME["det_size"]
+    max_side = FACE_RUNTIME["detect_max_side"] if max_side is None else max_side
+    scale = 1.0
+    with tracing.span("face detect"):
+        if max_side and max(img.shape[:2]) > max_side:
+            scale = max_side / max(img.shape[:2])
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        bboxes, kpss = get_face_analyzer().det_model.detect(img, input_size=(det_size, det_size),
+                                                            max_num=0, metric='default')
+    if scale != 1.0:
+        bboxes = bboxes.copy()
+        bboxes[:, :4] /= scale
+        if kpss is not None:
+            kpss = kpss / scale
+    return bboxes, kpss
+
+def align_face(img, kps):
+    """ArcFace-aligned recognition crop (112x112) from a face's 5 keypoints"""
+    from insightface.utils import face_align
+
+    rec_model = get_face_analyzer().models['recognition']
+    with tracing.span("face align"):
+        return face_align.norm_crop(img, landmark=kps, image_size=rec_model.input_size[0])
+
+def _detect_and_align(face_analyzer, img):
+    """Detect the first face (as FaceAnalysis.get orders them) and return its aligned crop"""
+    bboxes, kpss = detect_faces(img)
+    if bboxes.shape[0] == 0 or kpss is None:
+        return None
+    return align_face(img, kpss[0])
+
+def extract_face_features_batch(face_paths, batch_size=32, workers=None):
+    """Extract ArcFace embeddings for many images (paths or BGR arrays) at once.
+
+    Images are decoded, detected and aligned in a thread pool (OpenCV and
+    onnxruntime release the GIL), then the aligned crops are stacked and
+    run through the recognition model batch_size at a time. Returns an
+    (N, 512) float32 array of normed embeddings (zero rows for failures)
+    and a per-item status: "ok", "unreadable", "no_face" or "error: ...".
+    """
+    face_analyzer = get_face_analyzer()
+    rec_model = face_analyzer.models['recognition']
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+
+    def prepare(path):
+        # (crop, status, cache key), or (cached embedding, "ok", None) on a cache hit
+        try:
+            with tracing.span("face read"):
+                img = path if isinstance(path, np.ndarray) else cv2.imread(path)
+            if img is None:
+                return None, "unreadable", None
+            key = _face_cache_key(img)
+            cached = EMBEDDING_CACHE.get(key)
+            if cached is not None:
+                return cached, "ok", None
+            crop = _detect_and_align(face_analyzer, img)
+            if crop is None:
+                return None, "no_face", None
+            return crop, "ok", key
+        except Exception as e:
+            return None, f"error: {str(e)}", None
+
+    embeddings = np.zeros((len(face_paths), 512), dtype=np.float32)
+    statuses = [None] * len(face_paths)
+    crops, crop_rows, crop_keys = [], [], []
+
+    def flush():
+        try:
+            with tracing.span("face embed"):
+                feats = rec_model.get_feat(crops).astype(np.float32)
+            feats /= np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-12)
+            embeddings[crop_rows] = feats
+            for key, feat in zip(crop_keys, feats):
+                EMBEDDING_CACHE.put(key, feat)
+        except Exception as e:
+            for row in crop_rows:
+                statuses[row] = f"error: {str(e)}"
+        crops.clear()
+        crop_rows.clear()
+        crop_keys.clear()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map() yields in input order while later images are still being prepared
+        for row, (crop, status, key) in enumerate(pool.map(prepare, face_paths)):
+            statuses[row] = status
+            if crop is None:
+                continue
+            if key is None:
+                embeddings[row] = crop
+                continue
+            crops.append(crop)
+            crop_rows.append(row)
+            crop_keys.append(key)
+            if len(crops) >= batch_size:
+                flush()
+        if crops:
+            flush()
+
+    return embeddings, statuses
+
+def fuse_embeddings(embeddings, weights=None):
+    """Weighted mean of unit embeddings, renormalized to unit length (a multi-frame template)"""
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+    weights = np.ones(len(embeddings), dtype=np.float32) if weights is None else np.asarray(weights, dtype=np.float32)
+    if weights.sum() <= 0:
+        weights = np.ones(len(embeddings), dtype=np.float32)
+    template = weights @ embeddings
+    return template / max(float(np.linalg.norm(template)), 1e-12)
+
+def extract_face_template(frames, keypoints=None, weights=None, aligned=False):
+    """Embed several frames of one person in a single recognition call and fuse them.
+
+    keypoints are the detector's 5-point landmarks per frame (as returned by
+    capture.FrameSelector.select_top); frames without them are detected here.
+    With aligned, frames are already align_face crops (e.g. from the tracked
+    preview) and go straight to recognition. weights, typically the capture
+    quality, drive the fused mean. Returns (template, per-frame embeddings)
+    or (None, None) when no frame has a face. Per-crop embeddings are cached
+    on the crop bytes, so re-scoring the same frames skips recognition.
+    """
     try:
-        new_embedding = extract_face_features(new_face_path)
-        if new_embedding is None:
+        face_analyzer = get_face_analyzer()
+        rec_model = face_analyzer.models['recognition']
+        crops, used = [], []
+        for i, frame in enumerate(frames):
+            kps = keypoints[i] if keypoints is not None else None
+            if aligned:
+                crop = frame
+            elif kps is None:
+                crop = _detect_and_align(face_analyzer, frame)
+            else:
+                crop = align_face(frame, kps)
+            if crop is not None:
+                crops.append(crop)
+                used.append(i)
+        if not crops:
+            print("❌ ERROR: No face detected!")
+            return None, None
+
+        keys = [_face_crop_cache_key(crop) for crop in crops]
+        embeddings = np.zeros((len(crops), 512), dtype=np.float32)
+        missing = []
+        for row, key in enumerate(keys):
+            cached = EMBEDDING_CACHE.get(key)
+            if cached is None:
+                missing.append(row)
+            else:
+                embeddings[row] = cached
+        if missing:
+            start = time.perf_counter()
+            with tracing.span("face embed"):
+                feats = rec_model.get_feat([crops[row] for row in missing]).astype(np.float32)
+            models.record_first("first inference face", time.perf_counter() - start)
+            feats /= np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-12)
+            embeddings[missing] = feats
+            for row, feat in zip(missing, feats):
+                EMBEDDING_CACHE.put(keys[row], feat)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float32)[used]
+        return fuse_embeddings(embeddings, weights), embeddings
+    except Exception as e:
+        print(f"❌ ERROR during face extraction: {str(e)}")
+        return None, None
+
+def load_embedding(stored_embedding):
+    """Accept a stored embedding as an array (gallery row) or a legacy .npy path"""
+    if isinstance(stored_embedding, (str, os.PathLike)):
+        return np.load(stored_embedding)
+    return np.asarray(stored_embedding)
+
+def compare_embeddings(stored_embedding, new_embedding):
+    """Cosine similarity of two embeddings, normalized to the 0-1 score range"""
+    with tracing.span("score"):
+        stored_embedding = np.asarray(stored_embedding, dtype=np.float32).reshape(-1)
+        new_embedding = np.asarray(new_embedding, dtype=np.float32).reshape(-1)
+        norms = np.linalg.norm(stored_embedding) * np.linalg.norm(new_embedding)
+        if norms == 0:
             return 0.0
+        similarity = float(np.dot(stored_embedding, new_embedding) / norms)
+    return min(max(similarity, 0.0), 1.0)
 
-        stored_embedding = np.load(stored_embedding_path)
-        similarity = np.dot(stored_embedding, new_embedding)
+def compare_faces(new_face, stored_embedding):
+    """Compare face embeddings and return similarity score.
+
+    new_face may be an image path or an in-memory BGR frame (no re-encode).
+    """
+    try:
+        new_embedding = extract_face_features(new_face)
+        if new_embedding is None:
+            return 0.0
 
-        # Normalize score to 0-1 range, assuming similarity is typically between 0 and 1
-        # but can sometimes be slightly higher
-        normalized_score = min(max(similarity, 0.0), 1.0)
-        return normalized_score
+        # ArcFace embeddings are unit length, so this is their dot product
+        return compare_embeddings(load_embedding(stored_embedding), new_embedding)
     except Exception as e:
         print(f"❌ ERROR during face comparison: {str(e)}")
         return 0.0
 
+def compare_face_template(probe_embedding, stored_embedding, exemplars=None):
+    """Score a probe against the stored template, or its best-matching exemplar if higher"""
+    score = compare_embeddings(stored_embedding, probe_embedding)
+    if exemplars is not None and len(exemplars):
+        score = max(score, max(compare_embeddings(exemplar, probe_embedding) for exemplar in exemplars))
+    return score
+
+def compare_face_frames(frames, stored_embedding, keypoints=None, weights=None, exemplars=None, aligned=False):
+    """Fuse several captured frames (or aligned crops) into a probe template and score it
+    against the stored one"""
+    template, _ = extract_face_template(frames, keypoints, weights, aligned)
+    if template is None:
+        return 0.0
+    return compare_face_template(template, load_embedding(stored_embedding), exemplars)
+
+def capture_audio(duration=5, samplerate=16000):
+    """Record audio from microphone and return it as a mono float32 array (None on error)"""
+    try:
+        print("Recording... Please say the given phrase.")
+        audio = sd.rec(int(duration * samplerate), samplerate=samplerate, channels=1, dtype='float32')
+        sd.wait()
+        return audio[:, 0]
+    except Exception as e:
+        print(f"❌ ERROR during audio recording: {str(e)}")
+        return None
+
 def record_audio(filename, phrase, duration=5, samplerate=16000):
     """Record audio from microphone"""
     try:
@@ -61,9 +516,9 @@ def record_audio(filename, phrase, duration=5, samplerate=16000):
         if dir_path and not os.path.exists(dir_path):
             os.makedirs(dir_path, exist_ok=True)
 
-        print("Recording... Please say the given phrase.")
-        audio = sd.rec(int(duration * samplerate), samplerate=samplerate, channels=1, dtype='float32')
-        sd.wait()
+        audio = capture_audio(duration, samplerate)
+        if audio is None:
+            return False
 
         sf.write(filename, audio, samplerate)
         print(f"✅ Recording saved at {filename}.")
@@ -72,45 +527,281 @@ def record_audio(filename, phrase, duration=5, samplerate=16000):
         print(f"❌ ERROR during audio recording: {str(e)}")
         return False
 
-def extract_voice_features(audio_path):
-    """Extract voice embeddings using the ECAPA-TDNN model"""
+VOICE_SAMPLE_RATE = 16000
+MEL_PARAMS = {"n_mels": 80, "n_fft": 400, "hop_length": 160}
+
+_transforms = {}
+_transform_lock = threading.Lock()
+
+def _cached_transform(key, factory):
+    """Build each transform once: Resample recomputes its sinc kernel and
+    MelSpectrogram its filterbank on construction, which used to happen per call"""
+    transform = _transforms.get(key)
+    if transform is None:
+        with _transform_lock:
+            transform = _transforms.get(key)
+            if transform is None:
+                transform = _transforms[key] = factory()
+    return transform
+
+def _get_resampler(orig_freq, new_freq=VOICE_SAMPLE_RATE):
+    return _cached_transform(("resample", orig_freq, new_freq),
+                             lambda: torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq))
+
+def _get_mel_transform(sample_rate=VOICE_SAMPLE_RATE, n_mels=MEL_PARAMS["n_mels"],
+                       n_fft=MEL_PARAMS["n_fft"], hop_length=MEL_PARAMS["hop_length"], center=True):
+    # center=False is the streaming variant: the caller supplies the reflect padding
+    return _cached_transform(("mel", sample_rate, n_mels, n_fft, hop_length, center),
+                             lambda: torchaudio.transforms.MelSpectrogram(
+                                 sample_rate=sample_rate,
+                                 n_mels=n_mels,
+                                 n_fft=n_fft,
+                                 hop_length=hop_length,
+                                 center=center
+                             ))
+
+def _load_waveform(audio, sample_rate=VOICE_SAMPLE_RATE):
+    """(mono (1, samples) tensor, sample rate) of an audio file path, array or tensor"""
+    if isinstance(audio, (str, os.PathLike)):
+        with tracing.span("voice load"):
+            waveform, sample_rate = torchaudio.load(audio)
+    else:
+        waveform = torch.as_tensor(np.asarray(audio, dtype=np.float32))
+        if waveform.dim() == 1:
+            waveform = waveform.unsqueeze(0)
+        elif waveform.shape[0] > waveform.shape[1]:
+            waveform = waveform.T  # (samples, channels) as recorded by sounddevice
+    return waveform.mean(dim=0, keepdim=True), sample_rate
+
+def _voice_mel(audio, sample_rate=VOICE_SAMPLE_RATE):
+    """(80, frames) mel spectrogram of an audio file path, array or tensor"""
+    waveform, sample_rate = _load_waveform(audio, sample_rate)
+    # Already at the model rate: skip resampling entirely
+    if sample_rate != VOICE_SAMPLE_RATE:
+        with tracing.span("voice resample"):
+            waveform = _get_resampler(sample_rate)(waveform)
+    with tracing.span("voice mel"):
+        return _get_mel_transform()(waveform)[0]
+
+# Energy/spectral VAD on the mel frames the model sees
+VAD_PARAMS = {"margin_db": 10.0, "min_db": -50.0, "max_flatness": 0.35, "hangover": 8}
+MIN_SPEECH_SECONDS = 0.5
+
+def _frame_stats(mel):
+    """Per-frame log energy (dB) and spectral flatness of a (n_mels, frames) power mel spectrogram"""
+    power = np.asarray(mel, dtype=np.float64)
+    energy = 10 * np.log10(power.sum(axis=0) + 1e-10)
+    flatness = np.exp(np.log(power + 1e-10).mean(axis=0)) / (power.mean(axis=0) + 1e-10)
+    return energy, flatness
+
+def _speech_mask(energy, flatness, margin_db=VAD_PARAMS["margin_db"], min_db=VAD_PARAMS["min_db"],
+                 max_flatness=VAD_PARAMS["max_flatness"], hangover=VAD_PARAMS["hangover"]):
+    """Boolean speech decision per frame.
+
+    A frame is speech when its energy clears both an absolute floor and the
+    recording's own noise floor (10th percentile) by margin_db, and its
+    spectrum is not flat like broadband noise. Decisions are median-smoothed
+    over 5 frames and extended by hangover frames to keep onsets and tails.
+    """
+    if len(energy) == 0:
+        return np.zeros(0, dtype=bool)
+    threshold = max(np.percentile(energy, 10) + margin_db, min_db)
+    speech = (energy > threshold) & (flatness < max_flatness)
+    speech = np.convolve(speech, np.ones(5), mode="same") >= 3
+    if hangover:
+        speech = np.convolve(speech, np.ones(2 * hangover + 1), mode="same") > 0
+    return speech
+
+def _speech_stats(mask):
+    seconds_per_frame = MEL_PARAMS["hop_length"] / VOICE_SAMPLE_RATE
+    speech_frames = int(mask.sum())
+    return {"speech_ratio": speech_frames / max(len(mask), 1),
+            "speech_seconds": speech_frames * seconds_per_frame,
+            "seconds": len(mask) * seconds_per_frame}
+
+def _apply_vad(mel):
+    """Trim leading/trailing non-speech from a mel spectrogram.
+
+    Returns (trimmed mel, speech mask over its frames, stats); the mask is
+    None when every kept frame is speech and the mel is None without speech.
+    """
+    mask = _speech_mask(*_frame_stats(mel))
+    stats = _speech_stats(mask)
+    frames = np.flatnonzero(mask)
+    if len(frames) == 0:
+        return None, None, stats
+    start, end = frames[0], frames[-1] + 1
+    mask = mask[start:end]
+    return mel[:, start:end], None if mask.all() else torch.from_numpy(mask), stats
+
+def speech_activity(audio, sample_rate=VOICE_SAMPLE_RATE):
+    """Speech statistics of a recording: speech_ratio, speech_seconds and seconds"""
+    return _speech_stats(_speech_mask(*_frame_stats(_voice_mel(audio, sample_rate))))
+
+def extract_voice_features(audio_path, sample_rate=VOICE_SAMPLE_RATE, vad=True):
+    """Extract voice embeddings using the ECAPA-TDNN model.
+
+    audio_path may be a file path or an in-memory waveform (numpy array or
+    tensor) at sample_rate, e.g. straight from capture_audio(). With vad,
+    leading/trailing silence is trimmed before the network, pauses are left
+    out of the pooled average, and recordings with less than
+    MIN_SPEECH_SECONDS of speech are rejected without running the model.
+    """
     try:
-        waveform, sample_rate = torchaudio.load(audio_path)
-        waveform = waveform.mean(dim=0, keepdim=True)
-
-        resampler = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)
-        waveform = resampler(waveform)
-
-        mel_transform = torchaudio.transforms.MelSpectrogram(
-            sample_rate=16000,
-            n_mels=80,
-            n_fft=400,
-            hop_length=160
-        )
-        
-        mel_spectrogram = mel_transform(waveform)
-        mel_spectrogram = mel_spectrogram.unsqueeze(0) if mel_spectrogram.dim() == 2 else mel_spectrogram
-
-        with torch.no_grad():
-            embedding = voice_model(mel_spectrogram)
-
-        return embedding.squeeze().numpy()
+        waveform, sample_rate = _load_waveform(audio_path, sample_rate)
+        key = _voice_cache_key(waveform.numpy(), sample_rate, vad)
+        embedding = EMBEDDING_CACHE.get(key)
+        if embedding is not None:
+            return embedding
+
+        mel_spectrogram = _voice_mel(waveform, sample_rate)
+        frame_mask = None
+        if vad:
+            with tracing.span("voice vad"):
+                mel_spectrogram, frame_mask, stats = _apply_vad(mel_spectrogram)
+            if stats["speech_seconds"] < MIN_SPEECH_SECONDS:
+                print(f"⚠️ Too little speech: {stats['speech_seconds']:.2f} s "
+                      f"({stats['speech_ratio']:.0%} of the recording)")
+                return np.zeros(256)
+            if frame_mask is not None:
+                frame_mask = frame_mask.unsqueeze(0)
+
+        voice_model = get_voice_model()
+        start = time.perf_counter()
+        with torch.no_grad(), tracing.span("voice embed"):
+            embedding = voice_model(mel_spectrogram.unsqueeze(0), frame_mask=frame_mask)
+        models.record_first("first inference voice", time.perf_counter() - start)
+
+        embedding = embedding.squeeze().numpy()
+        EMBEDDING_CACHE.put(key, embedding)
+        return embedding
     except Exception as e:
         print(f"❌ ERROR during voice feature extraction: {str(e)}")
         return np.zeros(256)  # Return zero embedding in case of error
 
-def compare_voices(stored_embedding_path, new_audio_path):
-    """Compare voice embeddings and return similarity score"""
+def extract_voice_features_batch(audios, sample_rate=VOICE_SAMPLE_RATE, batch_size=16, workers=None, vad=True):
+    """Extract ECAPA-TDNN embeddings for many recordings at once.
+
+    audios may mix file paths and waveforms (numpy arrays or tensors at
+    sample_rate). Mel spectrograms (VAD-trimmed, as in extract_voice_features)
+    are computed in a thread pool with shared transform objects, then sorted
+    by length so each batch pads as little as possible; padded frames are
+    masked out of the model's pooling, so every embedding matches
+    extract_voice_features on the same input. Returns an (N, 256) float32
+    array (zero rows for failures) and per-item statuses ("ok",
+    "too_short" or "error: ...").
+    """
+    voice_model = get_voice_model()
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+
+    def prepare(audio):
+        # ((mel, frame_mask, cache key), status), or (cached embedding, "ok") on a cache hit
+        try:
+            waveform, rate = _load_waveform(audio, sample_rate)
+            key = _voice_cache_key(waveform.numpy(), rate, vad)
+            cached = EMBEDDING_CACHE.get(key)
+            if cached is not None:
+                return cached, "ok"
+            mel = _voice_mel(waveform, rate)
+            if not vad:
+                return (mel, None, key), "ok"
+            with tracing.span("voice vad"):
+                mel, frame_mask, stats = _apply_vad(mel)
+            if stats["speech_seconds"] < MIN_SPEECH_SECONDS:
+                return None, "too_short"
+            return (mel, frame_mask, key), "ok"
+        except Exception as e:
+            return None, f"error: {str(e)}"
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        prepared = list(pool.map(prepare, audios))
+
+    embeddings = np.zeros((len(prepared), 256), dtype=np.float32)
+    statuses = [status for _, status in prepared]
+    for i, (item, _) in enumerate(prepared):
+        if isinstance(item, np.ndarray):
+            embeddings[i] = item
+    ready = sorted((i for i, (item, _) in enumerate(prepared) if isinstance(item, tuple)),
+                   key=lambda i: prepared[i][0][0].shape[-1])
+
+    for start in range(0, len(ready), batch_size):
+        rows = ready[start:start + batch_size]
+        mels = [prepared[i][0][0] for i in rows]
+        masks = [prepared[i][0][1] for i in rows]
+        lengths = torch.tensor([mel.shape[-1] for mel in mels])
+        batch = torch.zeros(len(mels), mels[0].shape[0], int(lengths.max()))
+        for j, mel in enumerate(mels):
+            batch[j, :, :mel.shape[-1]] = mel
+        frame_mask = None
+        if any(mask is not None for mask in masks):
+            frame_mask = torch.zeros(len(mels), batch.shape[-1], dtype=torch.bool)
+            for j, mask in enumerate(masks):
+                frame_mask[j, :mels[j].shape[-1]] = True if mask is None else mask
+        # Equal-length buckets need no mask
+        if bool((lengths == lengths[0]).all()):
+            lengths = None
+        try:
+            with torch.no_grad(), tracing.span("voice embed"):
+                embeddings[rows] = voice_model(batch, lengths=lengths, frame_mask=frame_mask).numpy()
+            for i in rows:
+                EMBEDDING_CACHE.put(prepared[i][0][2], embeddings[i])
+        except Exception as e:
+            for i in rows:
+                statuses[i] = f"error: {str(e)}"
+
+    return embeddings, statuses
+
+def compare_voices(stored_embedding, new_audio, sample_rate=VOICE_SAMPLE_RATE):
+    """Compare voice embeddings and return similarity score.
+
+    new_audio may be a file path or an in-memory waveform at sample_rate.
+    """
     try:
-        stored_embedding = np.load(stored_embedding_path)
-        new_embedding = extract_voice_features(new_audio_path)
-
-        # Calculate cosine similarity (1 - cosine distance)
-        similarity = 1 - cosine(stored_embedding, new_embedding)
-        
-        # Normalize score to 0-1 range
-        normalized_score = min(max(similarity, 0.0), 1.0)
-        return normalized_score
+        stored_embedding = load_embedding(stored_embedding)
+        new_embedding = extract_voice_features(new_audio, sample_rate)
+
+        # Cosine similarity, normalized to the 0-1 range
+        return compare_embeddings(stored_embedding, new_embedding)
     except Exception as e:
         print(f"❌ ERROR during voice comparison: {str(e)}")
-        return 0.0
\ No newline at end of file
+        return 0.0
+
+models.timings["import util"] = time.perf_counter() - _import_start
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report util's import, model-load and first-inference costs")
+    parser.add_argument("--image", help="Face image for the first face inference")
+    parser.add_argument("--audio", default="./temp_voice.wav", help="Audio file for the first voice inference")
+    parser.add_argument("--profile", type=int, metavar="N",
+                        help="Then run face and voice extraction N more times and print a per-stage breakdown")
+    args = parser.parse_args()
+
+    warm_up_models(background=False)
+    if args.image:
+        extract_face_features(args.image)
+    else:
+        # A blank frame still runs detection, which is the first-inference cost
+        start = time.perf_counter()
+        detect_faces(np.zeros((480, 640, 3), dtype=np.uint8))
+        models.record_first("first inference face", time.perf_counter() - start)
+    if os.path.exists(args.audio):
+        extract_voice_features(args.audio)
+    print(models.report())
+
+    if args.profile:
+        EMBEDDING_CACHE.max_entries = 0  # every run pays the full pipeline
+        tracing.enable()
+        image = args.image if args.image else np.zeros((480, 640, 3), dtype=np.uint8)
+        for _ in range(args.profile):
+            with tracing.span("face total"):
+                if args.image:
+                    extract_face_features(image)
+                else:
+                    detect_faces(image)
+            if os.path.exists(args.audio):
+                with tracing.span("voice total"):
+                    extract_voice_features(args.audio)
+        print(f"\nPer-stage latency over {args.profile} runs:")
+        print(tracing.tracer.report())
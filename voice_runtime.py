@@ -0,0 +1,336 @@
+import copy
+import io
+import sys
+import warnings
+import torch
+import torch.nn as nn
+
+BACKENDS = ("eager", "torchscript", "onnx")
+QUANTIZE_MODES = ("dynamic", "static")
+ARTIFACT_EXTENSIONS = {"torchscript": ".pt", "onnx": ".onnx"}  # what export writes per backend
+
+
+def check_runtime(backend, quantize=None, path=None):
+    """Raise ValueError for a backend/quantization/artifact combination build_voice_model cannot run"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown voice backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    if quantize and quantize not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization {quantize!r}; choose from {', '.join(QUANTIZE_MODES)}")
+    if quantize and backend == "onnx":
+        raise ValueError("Quantized voice models run on the eager or torchscript backend")
+    if path:
+        if backend not in ARTIFACT_EXTENSIONS or not path.endswith(ARTIFACT_EXTENSIONS[backend]):
+            raise ValueError(f"{path!r} cannot be loaded by the {backend} backend; use a "
+                             + " or ".join(f"{ext} file with {name}" for name, ext in ARTIFACT_EXTENSIONS.items()))
+        if quantize:
+            raise ValueError("A saved voice model is loaded as exported; it cannot also be quantized")
+
+
+class MaskedECAPA(nn.Module):
+    """ECAPA_TDNN.forward with its masks as explicit inputs, for tracing and export.
+
+    valid (batch x frames) zeroes padded frames after layer1 and pool
+    (batch x frames) selects the frames that are averaged; all-ones masks
+    reproduce the unmasked model. One graph then covers every batch size,
+    utterance length and VAD mask.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x, valid, pool):
+        model = self.model
+        valid = valid.unsqueeze(1)
+        pool = pool.unsqueeze(1)
+        x = model.relu(model.layer1(x)) * valid
+        x = model.relu(model.layer2(x))
+        return model.fc((x * pool).sum(dim=-1) / pool.sum(dim=-1).clamp(min=1))
+
+
+class QuantizedECAPA(nn.Module):
+    """MaskedECAPA with int8 Conv1d+ReLU blocks, built by quantize_voice_model("static").
+
+    Activations are quantized on the way into each conv and dequantized
+    after it, so the masks and the pooling stay in float. quantize_input
+    False keeps layer1 in float: its input is the raw (not log) mel power,
+    whose dynamic range a single int8 scale cannot cover.
+    """
+
+    def __init__(self, model, quantize_input=False):
+        super().__init__()
+        from torch.ao.quantization import QuantStub, DeQuantStub
+
+        self.quantize_input = quantize_input
+        self.quant1, self.dequant1 = QuantStub(), DeQuantStub()
+        self.block1 = nn.Sequential(copy.deepcopy(model.layer1), nn.ReLU())
+        self.quant2, self.dequant2 = QuantStub(), DeQuantStub()
+        self.block2 = nn.Sequential(copy.deepcopy(model.layer2), nn.ReLU())
+        self.fc = copy.deepcopy(model.fc)
+
+    def forward(self, x, valid, pool):
+        valid = valid.unsqueeze(1)
+        pool = pool.unsqueeze(1)
+        if self.quantize_input:
+            x = self.dequant1(self.block1(self.quant1(x))) * valid
+        else:
+            x = self.block1(x) * valid
+        x = self.dequant2(self.block2(self.quant2(x)))
+        return self.fc((x * pool).sum(dim=-1) / pool.sum(dim=-1).clamp(min=1))
+
+
+def quantize_voice_model(model, mode="dynamic", calibration=None, quantize_input=False):
+    """int8 copy of the eager model as a MaskedECAPA-style module.
+
+    "dynamic" quantizes the Linear layer's weights (PyTorch has no dynamic
+    Conv1d); "static" also runs both Conv1d+ReLU blocks in int8, with
+    activation ranges calibrated on calibration, a list of (n_mels, frames)
+    mel spectrograms of sample utterances.
+    """
+    from torch.ao.quantization import convert, fuse_modules, get_default_qconfig, prepare, quantize_dynamic
+
+    with warnings.catch_warnings():
+        # torch.ao eager-mode quantization is deprecated in favour of torchao but still shipped
+        warnings.simplefilter("ignore")
+        if mode == "dynamic":
+            module = copy.deepcopy(MaskedECAPA(model)).eval()
+        elif mode == "static":
+            if not calibration:
+                raise ValueError("Static quantization needs calibration utterances")
+            module = QuantizedECAPA(model, quantize_input).eval()
+            fuse_modules(module, [["block1.0", "block1.1"], ["block2.0", "block2.1"]], inplace=True)
+            engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+            torch.backends.quantized.engine = engine
+            module.qconfig = get_default_qconfig(engine)
+            module.fc.qconfig = None  # quantized dynamically below
+            if not quantize_input:
+                module.block1.qconfig = None
+            prepare(module, inplace=True)
+            with torch.no_grad():
+                for mel in calibration:
+                    x = mel.unsqueeze(0) if mel.dim() == 2 else mel
+                    module(x, *frame_masks(x))
+            convert(module, inplace=True)
+        else:
+            raise ValueError(f"Unknown quantization mode {mode!r}; choose from {', '.join(QUANTIZE_MODES)}")
+        return quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8)
+
+
+def frame_masks(x, lengths=None, frame_mask=None):
+    """valid/pool float masks for MaskedECAPA from ECAPA_TDNN-style lengths/frame_mask"""
+    batch, frames = x.shape[0], x.shape[-1]
+    if lengths is None:
+        valid = torch.ones(batch, frames)
+    else:
+        valid = (torch.arange(frames)[None, :] < lengths[:, None]).float()
+    pool = valid if frame_mask is None else valid * frame_mask.float()
+    return valid, pool
+
+
+def _example_inputs(model, batch=2, frames=300):
+    x = torch.randn(batch, model.layer1.in_channels, frames)
+    return (x,) + frame_masks(x)
+
+
+def trace_voice_model(model, masked=None):
+    """TorchScript trace of the eager model (or of a masked/quantized module built from it),
+    frozen and optimized for inference"""
+    masked = masked if masked is not None else MaskedECAPA(model).eval()
+    with torch.no_grad(), warnings.catch_warnings():
+        # torch.jit is deprecated in favour of torch.compile but still the portable artifact
+        warnings.simplefilter("ignore")
+        traced = torch.jit.freeze(torch.jit.trace(masked, _example_inputs(model)))
+        if isinstance(masked, MaskedECAPA):
+            traced = torch.jit.optimize_for_inference(traced)
+        return traced
+
+
+def export_onnx(model, f):
+    """Write the model as ONNX (to a path or file object) with dynamic batch and frame axes"""
+    frames_axis = {0: "batch", 1: "frames"}
+    with warnings.catch_warnings():
+        # The TorchScript-based exporter needs only the onnx package
+        warnings.simplefilter("ignore", DeprecationWarning)
+        torch.onnx.export(MaskedECAPA(model).eval(), _example_inputs(model), f, dynamo=False,
+                          input_names=["mel", "valid", "pool"], output_names=["embedding"],
+                          dynamic_axes={"mel": {0: "batch", 2: "frames"}, "valid": frames_axis,
+                                        "pool": frames_axis, "embedding": {0: "batch"}},
+                          opset_version=17)
+
+
+class LayerwiseECAPA:
+    """layer1, layer2 and fc of a voice model as separate steps, for incremental embedding.
+
+    Built from the eager model, a MaskedECAPA (float or dynamically
+    quantized) or a QuantizedECAPA, so streaming runs the same float or
+    int8 weights as the batch path. layer1/layer2 take (channels, frames)
+    including their left/right context and return only the outputs that
+    need no padding.
+    """
+
+    def __init__(self, module):
+        self.module = module.model if isinstance(module, MaskedECAPA) else module
+        self.static = isinstance(self.module, QuantizedECAPA)
+
+    @classmethod
+    def of(cls, model):
+        """Layers of an eager or build_voice_model() model; None for a loaded .pt/.onnx graph"""
+        if isinstance(model, nn.Module) and hasattr(model, "layer1"):
+            return cls(model)
+        layered = getattr(model, "layered", None)
+        return cls(layered) if layered is not None else None
+
+    @staticmethod
+    def _crop(x, trim):
+        return x[0, :, trim:x.shape[-1] - trim]
+
+    def layer1(self, x):
+        m = self.module
+        if not self.static:
+            return self._crop(m.relu(m.layer1(x[None])), m.layer1.padding[0])
+        if m.quantize_input:
+            return self._crop(m.dequant1(m.block1(m.quant1(x[None]))), 2)
+        return self._crop(m.block1(x[None]), 2)
+
+    def layer2(self, x):
+        m = self.module
+        if not self.static:
+            return self._crop(m.relu(m.layer2(x[None])), m.layer2.padding[0])
+        return self._crop(m.dequant2(m.block2(m.quant2(x[None]))), 1)
+
+    def fc(self, pooled):
+        return self.module.fc(pooled[None])[0]
+
+
+class MaskedVoiceModel:
+    """Calls a (x, valid, pool) module - traced, quantized or a saved .pt - like the eager model.
+
+    layered is the Python module behind a traced one (None for a saved .pt),
+    for LayerwiseECAPA.
+    """
+
+    def __init__(self, eager=None, path=None, module=None, layered=None):
+        self.eager = eager
+        if module is None and not path:
+            layered = MaskedECAPA(eager).eval()
+            module = trace_voice_model(eager, layered)
+        elif module is None:
+            module = torch.jit.load(path)
+        self.module = module
+        # An untraced module (the int8 eager ones) is its own layers
+        self.layered = layered if layered is not None or isinstance(module, torch.jit.ScriptModule) else module
+
+    def __call__(self, x, lengths=None, frame_mask=None):
+        if x.dim() == 2:
+            x = x.unsqueeze(0)
+        return self.module(x, *frame_masks(x, lengths, frame_mask))
+
+
+class OnnxVoiceModel:
+    """ECAPA_TDNN on ONNX Runtime, callable like the eager model.
+
+    source is an .onnx path or the serialized model bytes; bytes are
+    exported from eager, whose layers then serve LayerwiseECAPA.
+    """
+
+    def __init__(self, source, threads=None, eager=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(source, options, providers=["CPUExecutionProvider"])
+        self.eager = eager
+        self.layered = eager if isinstance(source, bytes) else None
+
+    def __call__(self, x, lengths=None, frame_mask=None):
+        if x.dim() == 2:
+            x = x.unsqueeze(0)
+        valid, pool = frame_masks(x, lengths, frame_mask)
+        outputs = self.session.run(None, {"mel": x.numpy(), "valid": valid.numpy(), "pool": pool.numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+def build_voice_model(eager, backend="eager", threads=None, quantize=None, calibration=None, path=None):
+    """Wrap the eager model for the chosen backend; all share the eager weights.
+
+    threads sets torch's intra-op thread count (process wide) and ONNX
+    Runtime's for its session. quantize ("dynamic" or "static", see
+    quantize_voice_model) runs an int8 copy on the eager or torchscript
+    backend. path loads a model written by `voice_runtime.py export`
+    (.pt for torchscript, .onnx for onnx) instead of converting eager.
+    """
+    check_runtime(backend, quantize, path)
+    if threads:
+        torch.set_num_threads(threads)
+    if path:
+        if backend == "torchscript":
+            return MaskedVoiceModel(eager, path=path)
+        return OnnxVoiceModel(path, threads, eager)
+    if quantize:
+        module = quantize_voice_model(eager, quantize, calibration)
+        if backend == "torchscript":
+            return MaskedVoiceModel(eager, module=trace_voice_model(eager, module), layered=module)
+        return MaskedVoiceModel(eager, module=module)
+    if backend == "eager":
+        return eager
+    if backend == "torchscript":
+        return MaskedVoiceModel(eager)
+    if backend == "onnx":
+        buffer = io.BytesIO()
+        export_onnx(eager, buffer)
+        return OnnxVoiceModel(buffer.getvalue(), threads, eager)
+    raise ValueError(f"Unknown voice backend {backend!r}; choose from {', '.join(BACKENDS)}")
+
+
+def check_parity(eager, backend, atol=1e-4, seed=0, lengths=(57, 140, 333, 501)):
+    """Largest absolute difference from eager over single, padded-batch and VAD-masked inputs"""
+    model = build_voice_model(eager, backend)
+    generator = torch.Generator().manual_seed(seed)
+    lengths = torch.tensor(lengths)
+    batch = torch.rand(len(lengths), eager.layer1.in_channels, int(lengths.max()), generator=generator) * 50
+    for i, length in enumerate(lengths):
+        batch[i, :, length:] = 0
+    speech = torch.rand(len(lengths), batch.shape[-1], generator=generator) > 0.3
+
+    cases = [((batch[i:i + 1, :, :length],), {}) for i, length in enumerate(lengths)]
+    cases += [((batch,), {"lengths": lengths}), ((batch,), {"lengths": lengths, "frame_mask": speech})]
+    worst = 0.0
+    with torch.no_grad():
+        for args, kwargs in cases:
+            expected = eager(*args, **kwargs)
+            worst = max(worst, float((model(*args, **kwargs) - expected).abs().max()))
+    return worst, worst <= atol
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from model import ECAPA_TDNN
+
+    parser = argparse.ArgumentParser(description="Export ECAPA_TDNN and check backend parity with eager mode")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write TorchScript (.pt) and ONNX (.onnx) models")
+    export_parser.add_argument("--out", default="./models", help="Output directory")
+    export_parser.add_argument("--weights", help="state_dict to load into ECAPA_TDNN before exporting")
+    parity_parser = commands.add_parser("parity", help="Assert every backend matches eager within tolerance")
+    parity_parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    eager = ECAPA_TDNN(input_size=80).eval()
+    if args.command == "export":
+        if args.weights:
+            eager.load_state_dict(torch.load(args.weights, map_location="cpu"))
+        os.makedirs(args.out, exist_ok=True)
+        trace_voice_model(eager).save(os.path.join(args.out, "ecapa_tdnn.pt"))
+        export_onnx(eager, os.path.join(args.out, "ecapa_tdnn.onnx"))
+        print(f"✅ Exported ecapa_tdnn.pt and ecapa_tdnn.onnx to {args.out}")
+    else:
+        failed = False
+        for backend in BACKENDS[1:]:
+            worst, ok = check_parity(eager, backend, args.atol)
+            failed = failed or not ok
+            print(f"{'✅' if ok else '❌'} {backend}: max abs diff vs. eager {worst:.2e} (atol {args.atol:g})")
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,382 @@
+import queue
+import threading
+import time
+import numpy as np
+import soundfile as sf
+import sounddevice as sd
+import torch
+
+import util
+import voice_runtime
+
+
+class StreamingVoiceEmbedder:
+    """Incremental ECAPA-TDNN embedding of audio that arrives in chunks.
+
+    Each push() turns the newly complete hops into mel frames (the same
+    reflect-padded STFT framing as util._voice_mel), runs only those frames
+    through layer1/layer2 with the few frames of left context they need,
+    and adds them to a running sum for the average pool. embedding() is the
+    current estimate; finalize() flushes the right edge and matches
+    util.extract_voice_features(vad=False) on the whole recording.
+
+    With vad, the layer2 frames are kept and only those util's VAD marks as
+    speech (decided over everything heard so far) are averaged, so leading
+    silence and pauses stop diluting the running score. The final embedding
+    then differs from util.extract_voice_features only in the conv context
+    at the trimmed edges.
+
+    The model is util's configured runtime (backend and int8 quantization),
+    so streamed and batch embeddings come from the same weights. A model
+    loaded from an exported .pt/.onnx file exposes no layers; its mel
+    frames are then kept and each embedding reruns it on all of them.
+    """
+
+    def __init__(self, model=None, sample_rate=util.VOICE_SAMPLE_RATE, vad=True):
+        if sample_rate != util.VOICE_SAMPLE_RATE:
+            raise ValueError(f"Streaming runs at {util.VOICE_SAMPLE_RATE} Hz, got {sample_rate}")
+        self.runtime = model if model is not None else util.get_voice_model()
+        # Geometry (channels) always comes from the eager model every runtime is built from
+        self.model = getattr(self.runtime, "eager", None) or self.runtime
+        self.layers = voice_runtime.LayerwiseECAPA.of(self.runtime)
+        self.sample_rate = sample_rate
+        self.vad = vad
+        self.n_fft = util.MEL_PARAMS["n_fft"]
+        self.hop = util.MEL_PARAMS["hop_length"]
+        self.mel_transform = util._get_mel_transform(center=False)
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self._head = np.empty(0, dtype=np.float32)     # audio before the left padding is known
+        self._pending = None                           # padded audio not yet framed
+        self._tail = np.empty(0, dtype=np.float32)     # last samples, for the right padding
+        self._mel = torch.zeros(self.model.layer1.in_channels, 2)  # layer1 zero padding
+        self._h1 = torch.zeros(self.model.layer1.out_channels, 1)  # layer2 zero padding
+        self._sum = torch.zeros(self.model.layer2.out_channels)
+        self._count = 0
+        self._h2 = []        # layer2 frames, kept for VAD-masked pooling
+        self._mels = []      # mel frames, kept instead when the model has no layers
+        self._energy = []    # per mel frame VAD statistics
+        self._flatness = []
+        self._final = None
+
+    @property
+    def seconds(self):
+        return self.samples / self.sample_rate
+
+    def push(self, samples):
+        """Add a chunk of mono (or (frames, channels)) float audio"""
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 2:
+            samples = samples.mean(axis=1)
+        self.samples += len(samples)
+        self._tail = np.concatenate([self._tail, samples])[-(self.n_fft // 2 + 1):]
+
+        if self._pending is None:
+            self._head = np.concatenate([self._head, samples])
+            if len(self._head) <= self.n_fft // 2:
+                return
+            # Same reflect padding MelSpectrogram(center=True) applies at the start
+            samples = np.concatenate([self._head[self.n_fft // 2:0:-1], self._head])
+            self._pending = np.empty(0, dtype=np.float32)
+            self._head = None
+        self._pending = np.concatenate([self._pending, samples])
+        self._frame_pending()
+
+    def _frame_pending(self):
+        if len(self._pending) < self.n_fft:
+            return
+        frames = (len(self._pending) - self.n_fft) // self.hop + 1
+        used = (frames - 1) * self.hop + self.n_fft
+        mel = self.mel_transform(torch.from_numpy(self._pending[:used])[None])[0]
+        self._pending = self._pending[frames * self.hop:]
+        if self.vad:
+            energy, flatness = util._frame_stats(mel.numpy())
+            self._energy.append(energy)
+            self._flatness.append(flatness)
+        self._layer1(mel)
+
+    def _layer1(self, mel):
+        if self.layers is None:
+            self._mels.append(mel)
+            self._count += mel.shape[1]
+            return
+        with torch.no_grad():
+            self._mel = torch.cat([self._mel, mel], dim=1)
+            if self._mel.shape[1] < 5:
+                return
+            h1 = self.layers.layer1(self._mel)
+            self._mel = self._mel[:, -4:]
+        self._layer2(h1)
+
+    def _layer2(self, h1):
+        with torch.no_grad():
+            self._h1 = torch.cat([self._h1, h1], dim=1)
+            if self._h1.shape[1] < 3:
+                return
+            h2 = self.layers.layer2(self._h1)
+            self._h1 = self._h1[:, -2:]
+            self._sum += h2.sum(dim=1)
+            self._count += h2.shape[1]
+            if self.vad:
+                self._h2.append(h2)
+
+    def speech_mask(self):
+        """VAD decision for every mel frame heard so far"""
+        if not self._energy:
+            return np.zeros(0, dtype=bool)
+        return util._speech_mask(np.concatenate(self._energy), np.concatenate(self._flatness))
+
+    def speech_stats(self):
+        return util._speech_stats(self.speech_mask())
+
+    def _pooled(self):
+        if self._count == 0:
+            return None
+        with torch.no_grad():
+            if self.layers is None:
+                return self._rerun()
+            if not self.vad:
+                return self.layers.fc(self._sum / self._count).numpy()
+            mask = self.speech_mask()
+            if util._speech_stats(mask)["speech_seconds"] < util.MIN_SPEECH_SECONDS:
+                return None
+            h2 = torch.cat(self._h2, dim=1)
+            self._h2 = [h2]
+            speech = torch.from_numpy(mask[:h2.shape[1]])
+            if not speech.any():
+                return None
+            return self.layers.fc(h2[:, speech].mean(dim=1)).numpy()
+
+    def _rerun(self):
+        mel = torch.cat(self._mels, dim=1)
+        self._mels = [mel]
+        if not self.vad:
+            return self.runtime(mel[None])[0].numpy()
+        mask = self.speech_mask()
+        if util._speech_stats(mask)["speech_seconds"] < util.MIN_SPEECH_SECONDS:
+            return None
+        return self.runtime(mel[None], frame_mask=torch.from_numpy(mask[:mel.shape[1]])[None])[0].numpy()
+
+    def embedding(self):
+        """Running embedding from the frames seen so far, or None before there is enough (speech)"""
+        if self._final is not None:
+            return self._final
+        return self._pooled()
+
+    def finalize(self):
+        """Flush the right edge and return the final embedding (None if too short or too little speech).
+
+        No more audio can be pushed afterwards until reset().
+        """
+        if self._final is not None or self._pending is None:
+            return self._final
+        # Right reflect padding, then the zero padding of layer1 and layer2
+        self._pending = np.concatenate([self._pending, self._tail[-2:-self.n_fft // 2 - 2:-1]])
+        self._frame_pending()
+        if self.layers is not None:
+            self._layer1(torch.zeros(self._mel.shape[0], 2))
+            self._layer2(torch.zeros(self._h1.shape[0], 1))
+        self._final = self._pooled()
+        if self._final is None and self.vad:
+            stats = self.speech_stats()
+            print(f"⚠️ Too little speech: {stats['speech_seconds']:.2f} s "
+                  f"({stats['speech_ratio']:.0%} of the recording)")
+        return self._final
+
+
+class FileInputStream:
+    """Stand-in for sounddevice.InputStream that plays an audio file through the callback.
+
+    Blocks are delivered from a background thread exactly as the microphone
+    would deliver them (float32, shape (frames, channels)); realtime=True
+    paces them at the recording rate, otherwise they arrive as fast as the
+    consumer drains them.
+    """
+
+    def __init__(self, path, samplerate=util.VOICE_SAMPLE_RATE, channels=1, dtype="float32",
+                 blocksize=1600, callback=None, realtime=False, **kwargs):
+        audio, file_rate = sf.read(path, dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+        if file_rate != samplerate:
+            audio = util._get_resampler(file_rate, samplerate)(torch.from_numpy(audio)[None])[0].numpy()
+        self.audio = np.repeat(audio[:, None], channels, axis=1)
+        self.samplerate = samplerate
+        self.blocksize = blocksize or 1600
+        self.callback = callback
+        self.realtime = realtime
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        for start in range(0, len(self.audio), self.blocksize):
+            if self._stop.is_set():
+                return
+            block = self.audio[start:start + self.blocksize]
+            self.callback(block, len(block), None, None)
+            if self.realtime:
+                time.sleep(len(block) / self.samplerate)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_stream(consume, max_seconds=5.0, samplerate=util.VOICE_SAMPLE_RATE, chunk_seconds=0.1,
+               stream_factory=None):
+    """Feed input-stream chunks to consume(chunk) until it returns True or max_seconds pass.
+
+    The audio callback only queues a copy of each block; all processing runs
+    on the calling thread. stream_factory defaults to sounddevice.InputStream
+    and takes the same keyword arguments (see FileInputStream). Returns the
+    recorded mono audio.
+    """
+    blocks = queue.Queue()
+
+    def callback(indata, frames, time_info, status):
+        blocks.put(indata[:, 0].copy())
+
+    factory = stream_factory or sd.InputStream
+    chunks, received = [], 0
+    max_samples = int(max_seconds * samplerate)
+    with factory(samplerate=samplerate, channels=1, dtype="float32",
+                 blocksize=int(chunk_seconds * samplerate), callback=callback):
+        while received < max_samples:
+            try:
+                chunk = blocks.get(timeout=1.0)
+            except queue.Empty:
+                break  # the stream ended (end of file or device stopped)
+            chunk = chunk[:max_samples - received]
+            chunks.append(chunk)
+            received += len(chunk)
+            if consume(chunk):
+                break
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.float32)
+
+
+def record_voice_stream(max_seconds=5.0, stream_factory=None, on_update=None, model=None):
+    """Record an enrollment utterance, embedding it while it is spoken.
+
+    Returns (audio, embedding); the embedding is ready as soon as recording
+    stops. embedding is None for a failed recording or too little speech.
+    """
+    embedder = StreamingVoiceEmbedder(model)
+
+    def consume(chunk):
+        embedder.push(chunk)
+        if on_update:
+            on_update(embedder.seconds, None)
+        return False
+
+    try:
+        audio = run_stream(consume, max_seconds, stream_factory=stream_factory)
+        return audio, embedder.finalize()
+    except Exception as e:
+        print(f"❌ ERROR during audio recording: {str(e)}")
+        return None, None
+
+
+def verify_voice_stream(stored_embedding, threshold=0.7, margin=0.1, min_seconds=1.5, max_seconds=5.0,
+                        patience=3, stream_factory=None, on_update=None, model=None, band=None):
+    """Score live audio against a stored voice template and stop once the answer is clear.
+
+    Scoring starts once util.MIN_SPEECH_SECONDS of speech has been heard.
+    After min_seconds, recording stops early when the running score stays
+    at or above accept_at (accept) or below reject_below (reject) for
+    patience consecutive chunks, band being (reject_below, accept_at) and
+    defaulting to threshold -/+ margin; fusion.ScoreFusion.decisive_band()
+    gives the band of a calibrated config. Otherwise the full max_seconds
+    is scored. Returns a dict with score, decision, seconds, early and audio.
+    """
+    reject_below, accept_at = band if band is not None else (threshold - margin, threshold + margin)
+    stored_embedding = util.load_embedding(stored_embedding)
+    embedder = StreamingVoiceEmbedder(model)
+    state = {"score": 0.0, "decision": None, "streak": 0}
+
+    def consume(chunk):
+        embedder.push(chunk)
+        embedding = embedder.embedding()
+        if embedding is None:
+            return False
+        score = util.compare_embeddings(stored_embedding, embedding)
+        side = "accept" if score >= accept_at else "reject" if score < reject_below else None
+        state["streak"] = state["streak"] + 1 if side is not None and side == state["decision"] else int(side is not None)
+        state["decision"], state["score"] = side, score
+        if on_update:
+            on_update(embedder.seconds, score)
+        return embedder.seconds >= min_seconds and state["streak"] >= patience
+
+    try:
+        audio = run_stream(consume, max_seconds, stream_factory=stream_factory)
+    except Exception as e:
+        print(f"❌ ERROR during audio recording: {str(e)}")
+        return {"score": 0.0, "decision": "reject", "seconds": 0.0, "early": False, "audio": None,
+                "speech_ratio": 0.0}
+
+    early = state["streak"] >= patience and embedder.seconds < max_seconds
+    if not early:
+        embedding = embedder.finalize()
+        state["score"] = util.compare_embeddings(stored_embedding, embedding) if embedding is not None else 0.0
+        state["decision"] = "accept" if state["score"] >= threshold else "reject"
+    return {"score": state["score"], "decision": state["decision"], "seconds": embedder.seconds,
+            "early": early, "audio": audio, "speech_ratio": embedder.speech_stats()["speech_ratio"]}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the streaming voice pipeline on a file-backed fake microphone")
+    parser.add_argument("--audio", default="./temp_voice.wav", help="Audio file played as the input stream")
+    parser.add_argument("--claim", help="Audio file whose embedding is the claimed user's template")
+    parser.add_argument("--username", help="Claimed user in the gallery (instead of --claim)")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--margin", type=float, default=0.1)
+    parser.add_argument("--realtime", action="store_true", help="Pace blocks like a live microphone")
+    args = parser.parse_args()
+
+    def fake_stream(**kwargs):
+        return FileInputStream(args.audio, realtime=args.realtime, **kwargs)
+
+    util.models.warm_up(["voice"], background=False)
+    for vad in (False, True):
+        embedder = StreamingVoiceEmbedder(vad=vad)
+        start = time.perf_counter()
+        audio = run_stream(lambda chunk: embedder.push(chunk), max_seconds=3600, stream_factory=fake_stream)
+        streamed = embedder.finalize()
+        elapsed = time.perf_counter() - start
+        offline = util.extract_voice_features(audio, vad=vad)
+        if streamed is None:
+            continue
+        print(f"Streamed {len(audio) / util.VOICE_SAMPLE_RATE:.2f} s (vad={vad}) in {elapsed * 1000:.0f} ms; "
+              f"cosine vs. extract_voice_features {util.compare_embeddings(offline, streamed):.6f}, "
+              f"max abs diff {np.abs(offline - streamed).max():.2e}")
+
+    template = None
+    if args.claim:
+        template = util.extract_voice_features(args.claim)
+    elif args.username:
+        import gallery
+        stored = gallery.EmbeddingGallery().get(args.username)
+        template = stored[1] if stored is not None else None
+        if template is None:
+            print(f"❌ ERROR: {args.username} is not enrolled")
+    if template is not None:
+        result = verify_voice_stream(template, args.threshold, args.margin, stream_factory=fake_stream)
+        print(f"Decision: {result['decision']} (score {result['score']:.3f}) after {result['seconds']:.2f} s"
+              f"{' (early stop)' if result['early'] else ''}")
@@ -0,0 +1,195 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+
+import gallery as gallery_store
+
+LIVENESS_INTERVAL = 1.0  # seconds between worker liveness checks
+TRACE_ROUTE = "/_trace"    # internal: a worker's tracing.tracer.export()
+
+
+def _worker_main(index, gallery_dir, inference_threads, tasks, results):
+    """One worker process: its own models and BiometricService over the shared gallery files"""
+    import torch
+    import service
+    import tracing
+    import util
+
+    # Ctrl+C reaches the whole process group; the front end shuts workers down through close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Workers scale by process, so each keeps torch to its own share of the cores
+    torch.set_num_threads(inference_threads)
+    worker = service.BiometricService(gallery_store.EmbeddingGallery(gallery_dir), inference_threads)
+    util.warm_up_models(background=False)
+    loop = asyncio.new_event_loop()
+    tracing.start_reporting(f"Worker {index}")
+    results.put((None, index, "ready", os.getpid()))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, route, fields = task
+        try:
+            if route == TRACE_ROUTE:
+                status, payload = 200, tracing.tracer.export()
+            else:
+                # Each route refreshes the gallery first, so new enrollments show up without a restart
+                status, payload = 200, loop.run_until_complete(worker.handle(route, fields))
+        except service.HTTPError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception as e:
+            print(f"❌ ERROR in worker {index} handling {route}: {str(e)}")
+            status, payload = 500, {"error": str(e)}
+        results.put((request_id, index, status, payload))
+    if tracing.ENABLED:
+        tracing.print_report(f"Worker {index}")
+
+
+class InferencePool:
+    """Dispatches enroll/verify/identify requests to worker processes with their own models.
+
+    Each worker loads FaceAnalysis and ECAPA_TDNN once and opens the same
+    EmbeddingGallery directory; its face/voice matrices are memory-mapped,
+    so the OS page cache holds one copy for every worker, and an enrollment
+    by one worker is picked up by the others on their next request
+    (gallery.refresh). submit() sends each request to the worker with the
+    fewest requests in flight and returns a Future of (status, payload),
+    the same JSON payloads as service.py.
+    """
+
+    def __init__(self, workers=None, gallery_dir=gallery_store.GALLERY_DIR, inference_threads=1, start_timeout=600,
+                 worker_main=_worker_main):
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._closed = False
+        # Fresh interpreters: forking a process that already started torch/onnxruntime threads is unsafe
+        context = multiprocessing.get_context("spawn")
+        self._results = context.Queue()
+        self._tasks = [context.Queue() for _ in range(self.workers)]
+        self._processes = [context.Process(target=worker_main, daemon=True,
+                                           args=(i, gallery_dir, inference_threads, self._tasks[i], self._results))
+                           for i in range(self.workers)]
+        for process in self._processes:
+            process.start()
+
+        self.pids = {}
+        deadline = time.monotonic() + start_timeout
+        while len(self.pids) < self.workers:
+            try:
+                _, index, _, pid = self._results.get(timeout=1.0)
+            except queue.Empty:
+                exited = [i for i, process in enumerate(self._processes) if not process.is_alive()]
+                if exited or time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError(f"Inference workers {exited} exited during startup" if exited
+                                       else "Inference workers did not start in time")
+                continue
+            self.pids[index] = pid
+
+        self._ids = itertools.count()
+        self._pending = {}  # request id -> (future, worker)
+        self._outstanding = [0] * self.workers
+        self._completed = [0] * self.workers
+        self._alive = [True] * self.workers
+        self._next = 0
+        self._collector = threading.Thread(target=self._collect, name="pool-results", daemon=True)
+        self._collector.start()
+
+    def submit(self, route, fields, worker=None):
+        """Queue a route ("/verify", "/identify" or "/enroll") with its form fields; returns a Future"""
+        future = Future()
+        with self._lock:
+            live = [i for i in range(self.workers) if self._alive[i]]
+            if self._closed or not live:
+                raise RuntimeError("Inference pool is not running")
+            if worker is None:
+                # Least loaded worker; ties rotate so idle workers share the work
+                worker = min(live, key=lambda i: (self._outstanding[i], (i - self._next) % self.workers))
+                self._next = (worker + 1) % self.workers
+            request_id = next(self._ids)
+            self._pending[request_id] = (future, worker)
+            self._outstanding[worker] += 1
+        self._tasks[worker].put((request_id, route, fields))
+        return future
+
+    def _collect(self):
+        next_check = time.monotonic() + LIVENESS_INTERVAL
+        while not self._closed:
+            # Checked on a timer, not only when the queue is idle: under load the
+            # other workers' results would otherwise hide a crashed worker forever
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + LIVENESS_INTERVAL
+            try:
+                request_id, index, status, payload = self._results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future, worker = self._pending.pop(request_id, (None, None))
+                if worker is not None:
+                    self._outstanding[worker] -= 1
+                    self._completed[worker] += 1
+            if future is not None:
+                future.set_result((status, payload))
+
+    def _check_workers(self):
+        """Fail the requests of any worker that died instead of leaving them waiting forever"""
+        with self._lock:
+            if self._closed:
+                return
+            dead = [i for i, process in enumerate(self._processes) if self._alive[i] and not process.is_alive()]
+            failed = []
+            for i in dead:
+                print(f"❌ ERROR: Inference worker {i} (pid {self.pids.get(i)}) exited")
+                self._alive[i] = False
+                failed += [rid for rid, (_, worker) in self._pending.items() if worker == i]
+            futures = [self._pending.pop(rid)[0] for rid in failed]
+        for future in futures:
+            future.set_result((500, {"error": "Inference worker exited"}))
+
+    def broadcast(self, route, fields):
+        """submit() to every live worker; returns their Futures"""
+        with self._lock:
+            live = [i for i in range(self.workers) if self._alive[i]]
+        return [self.submit(route, fields, worker=i) for i in live]
+
+    def trace_export(self, timeout=10):
+        """Every live worker's tracing export, merged into one tracing.Tracer"""
+        import tracing
+
+        merged = tracing.Tracer()
+        for future in self.broadcast(TRACE_ROUTE, {}):
+            status, payload = future.result(timeout=timeout)
+            if status == 200:
+                merged.merge(payload)
+        return merged
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "alive": sum(self._alive), "outstanding": list(self._outstanding),
+                    "completed": list(self._completed)}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        for tasks, process in zip(self._tasks, self._processes):
+            if process.is_alive():
+                tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()